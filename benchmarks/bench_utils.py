@@ -0,0 +1,95 @@
+"""Helpers shared by the benchmark scripts."""
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, Optional[float]]:
+    """Mean and percentiles in milliseconds"""
+    if not latencies:
+        return {'count': 0, 'mean': None, 'p50': None, 'p95': None, 'p99': None}
+    return {
+        'count': len(latencies),
+        'mean': statistics.mean(latencies) * 1000,
+        'p50': percentile(latencies, 50) * 1000,
+        'p95': percentile(latencies, 95) * 1000,
+        'p99': percentile(latencies, 99) * 1000
+    }
+
+
+def git_revision(path: str) -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=path, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for directory, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(directory, filename))
+            except OSError:
+                pass
+    return total
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes"""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class ResourceSampler:
+    """Background sampling of peak RSS and peak disk usage of a directory"""
+
+    def __init__(self, path: str, interval: float = 0.05):
+        self.path = path
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_disk = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> Dict[str, float]:
+        self._stop.set()
+        self._thread.join()
+        # ru_maxrss (Ko sous Linux) attrape les pics entre deux mesures
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return {
+            'peak_rss_mb': max(self.peak_rss, max_rss) / (1024 * 1024),
+            'peak_disk_mb': self.peak_disk / (1024 * 1024),
+            'final_disk_mb': directory_size(self.path) / (1024 * 1024)
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.peak_rss = max(self.peak_rss, current_rss())
+            except OSError:
+                pass
+            self.peak_disk = max(self.peak_disk, directory_size(self.path))
+            time.sleep(self.interval)
@@ -0,0 +1,272 @@
+"""End-to-end benchmark of the bot against fake YouTube and Telegram servers.
+
+N simulated users each open the search, send a video URL, pick the result
+and choose a format, concurrently. The bot runs in-process in polling mode,
+downloads synthetic media from the local media server through yt-dlp's
+generic extractor and uploads it to the fake Bot API. Nothing leaves the
+machine.
+
+    python benchmarks/e2e_bench.py --users 50 --videos 10 --output run.json
+    python benchmarks/e2e_bench.py --users 50 --videos 10 --compare run.json
+    python benchmarks/e2e_bench.py --users 50 --worker-processes 4
+
+With --worker-processes, the bot only receives updates and N worker.py
+processes serve the jobs from a SQLite job queue. With --local-api, the bot
+runs in TELEGRAM_LOCAL_MODE and the fake Bot API reads the files by path:
+
+    python benchmarks/e2e_bench.py --users 10 --media-kb 81920 --local-api
+
+Reports throughput, p50/p95/p99 per stage (search, select, delivery and the
+whole conversation), the bot's own stage timings, peak RSS and disk usage.
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_utils import ResourceSampler, git_revision, latency_summary  # noqa: E402
+from fake_telegram import (  # noqa: E402
+    FakeTelegramServer, make_callback_update, make_message_update
+)
+from fake_youtube import FakeYouTubeServer  # noqa: E402
+
+STAGES = ('search', 'select', 'delivery', 'total')
+SEND_METHODS = {'mp3': 'sendAudio', 'audio': 'sendAudio', 'mp4': 'sendVideo'}
+
+
+class UserSimulator:
+    """Drives one conversation per user through the fake Bot API"""
+
+    def __init__(self, fake: FakeTelegramServer, timeout: float):
+        self.fake = fake
+        self.timeout = timeout
+        self._update_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _next_update_id(self) -> int:
+        with self._lock:
+            return next(self._update_ids)
+
+    def _push(self, update: Dict[str, Any]) -> int:
+        """Send an update, returning the index of the first call that can answer it"""
+        since = len(self.fake.calls)
+        self.fake.push_update(update)
+        return since
+
+    def _wait(self, chat_id: int, since: int, methods,
+              marker: Optional[str] = None) -> Dict[str, Any]:
+        """Wait for the bot's answer in a chat after call ``since``; an error message fails the user"""
+        def predicate(call):
+            params = call['params']
+            if str(params.get('chat_id')) != str(chat_id):
+                return False
+            if '❌' in str(params.get('text', '')):
+                return True
+            return call['method'] in methods and (marker is None or marker in str(params))
+
+        call = self.fake.wait_for(predicate, timeout=self.timeout, since=since)
+        if call is None:
+            raise TimeoutError(f"no answer in chat {chat_id}")
+        if '❌' in str(call['params'].get('text', '')):
+            raise RuntimeError(call['params']['text'])
+        return call
+
+    def run(self, chat_id: int, url: str, format_type: str) -> Dict[str, float]:
+        edits = ('sendMessage', 'editMessageText')
+        timings = {}
+
+        since = self._push(make_callback_update(self._next_update_id(), chat_id, 1, 'search'))
+        self._wait(chat_id, since, edits, 'Envoyez')
+
+        started = time.monotonic()
+        since = self._push(make_message_update(self._next_update_id(), chat_id, url))
+        results = self._wait(chat_id, since, edits, 'select_video_0')
+        timings['search'] = results['time'] - started
+        message_id = results['result']['message_id']
+
+        start = time.monotonic()
+        since = self._push(
+            make_callback_update(self._next_update_id(), chat_id, message_id, 'select_video_0')
+        )
+        self._wait(chat_id, since, edits, f'format_{format_type}')
+        timings['select'] = time.monotonic() - start
+
+        start = time.monotonic()
+        since = self._push(
+            make_callback_update(self._next_update_id(), chat_id, message_id, f'format_{format_type}')
+        )
+        delivered = self._wait(chat_id, since, (SEND_METHODS[format_type],))
+        timings['delivery'] = delivered['time'] - start
+        timings['total'] = delivered['time'] - started
+        # Un ❌ après l'envoi (journalisation, cache...) fait aussi échouer l'utilisateur
+        self._wait(chat_id, since, ('editMessageText',), '✅')
+        return timings
+
+
+def internal_stages() -> Dict[str, Dict[str, float]]:
+    """Count and mean duration of the bot's own instrumented stages"""
+    from metrics import STAGE_SECONDS
+    return {
+        labels[0]: {'count': count, 'mean_ms': total / count * 1000 if count else None}
+        for labels, (count, total) in sorted(STAGE_SECONDS.totals().items())
+    }
+
+
+def compare(previous: Dict[str, Any], current: Dict[str, Any]):
+    """Print the change of throughput and latency percentiles against a previous run"""
+    def delta(old, new):
+        if old in (None, 0) or new is None:
+            return 'n/a'
+        return f"{(new - old) / old * 100:+.1f}%"
+
+    print(f"\nComparison with {previous.get('revision') or 'previous run'}:")
+    print(f"  throughput  {delta(previous['throughput_users_per_s'], current['throughput_users_per_s'])}")
+    for stage in STAGES:
+        old, new = previous['stages_ms'].get(stage, {}), current['stages_ms'][stage]
+        print(f"  {stage:<10} p50 {delta(old.get('p50'), new['p50']):>8}  "
+              f"p95 {delta(old.get('p95'), new['p95']):>8}  "
+              f"p99 {delta(old.get('p99'), new['p99']):>8}")
+    for key in ('peak_rss_mb', 'peak_disk_mb'):
+        print(f"  {key:<13}{delta(previous['resources'].get(key), current['resources'][key])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--videos', type=int, default=None,
+                        help='distinct videos requested (default: one per user)')
+    parser.add_argument('--concurrency', type=int, default=10,
+                        help='users running at the same time')
+    parser.add_argument('--format', choices=sorted(SEND_METHODS), default='audio',
+                        help='mp3 needs FFmpeg, audio and mp4 do not')
+    parser.add_argument('--media-kb', type=int, default=1024, help='size of each media file')
+    parser.add_argument('--bandwidth-kbps', type=float, default=None,
+                        help='throttle each media download (KB/s)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='MAX_CONCURRENT_DOWNLOADS of the bot')
+    parser.add_argument('--worker-processes', type=int, default=0,
+                        help='serve downloads from worker.py processes')
+    parser.add_argument('--local-api', action='store_true',
+                        help='send files by path to a local Bot API server')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='previous JSON results to compare with')
+    args = parser.parse_args()
+    videos = args.videos or args.users
+
+    youtube = FakeYouTubeServer(
+        media_size=args.media_kb * 1024,
+        bandwidth=args.bandwidth_kbps * 1024 if args.bandwidth_kbps else None
+    )
+    youtube.start()
+    telegram = FakeTelegramServer(local_mode=args.local_api)
+    telegram.start()
+
+    # Le bot lit sa configuration à l'import
+    work_dir = tempfile.mkdtemp(prefix='e2e-bench-')
+    os.chdir(work_dir)
+    os.environ['TELEGRAM_BOT_TOKEN'] = '123456:BENCHMARK'
+    os.environ['TELEGRAM_API_BASE_URL'] = telegram.base_url
+    os.environ['WEBHOOK_URL'] = ''
+    os.environ['TELEGRAM_LOCAL_MODE'] = '1' if args.local_api else ''
+    if args.workers:
+        os.environ['MAX_CONCURRENT_DOWNLOADS'] = str(args.workers)
+        os.environ['WORKER_THREADS'] = str(args.workers)
+    worker_processes = []
+    if args.worker_processes:
+        os.environ['JOB_QUEUE_URL'] = f"sqlite:///{os.path.join(work_dir, 'jobs.sqlite')}"
+
+    logging.basicConfig(level=logging.WARNING)
+    from bot import YouTubeAudioDownloaderBot
+
+    stop_event = threading.Event()
+    bot = YouTubeAudioDownloaderBot()
+    bot_thread = threading.Thread(target=bot.run, args=(stop_event,), daemon=True)
+    bot_thread.start()
+    if not telegram.wait_for(lambda c: c['method'] == 'getUpdates', timeout=30):
+        sys.exit("Bot did not start")
+    for _ in range(args.worker_processes):
+        worker_processes.append(subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, 'worker.py')],
+            cwd=work_dir, stdout=subprocess.DEVNULL
+        ))
+
+    sampler = ResourceSampler(work_dir)
+    sampler.start()
+    simulator = UserSimulator(telegram, args.timeout)
+    timings, failures = [], []
+
+    def one_user(i):
+        url = youtube.media_url(f"video{i % videos:05d}", 'mp4' if args.format == 'mp4' else 'm4a')
+        try:
+            timings.append(simulator.run(30_000 + i, url, args.format))
+        except Exception as e:
+            failures.append(f"user {i}: {e}")
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(one_user, range(args.users)))
+    elapsed = time.monotonic() - started
+    resources = sampler.stop()
+
+    stop_event.set()
+    bot_thread.join(timeout=10)
+    for process in worker_processes:
+        process.terminate()
+    for process in worker_processes:
+        process.wait(timeout=30)
+
+    results = {
+        'revision': git_revision(ROOT),
+        'config': {
+            'users': args.users,
+            'videos': videos,
+            'concurrency': args.concurrency,
+            'format': args.format,
+            'media_kb': args.media_kb,
+            'bandwidth_kbps': args.bandwidth_kbps,
+            'workers': bot.config.MAX_CONCURRENT_DOWNLOADS,
+            'worker_processes': args.worker_processes,
+            'local_api': args.local_api
+        },
+        'elapsed_s': elapsed,
+        'completed': len(timings),
+        'failed': len(failures),
+        'errors': failures[:20],
+        'throughput_users_per_s': len(timings) / elapsed if elapsed else 0,
+        'stages_ms': {
+            stage: latency_summary([t[stage] for t in timings]) for stage in STAGES
+        },
+        'bot_stages': internal_stages(),
+        'media_requests': sum(youtube.requests.values()),
+        'local_api_bytes': telegram.local_bytes,
+        'resources': resources
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+    telegram.stop()
+    youtube.stop()
+
+
+if __name__ == '__main__':
+    main()
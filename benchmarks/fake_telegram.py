@@ -0,0 +1,265 @@
+"""Local stand-in for the Telegram Bot API, used by the offline benchmarks.
+
+Implements the few endpoints the bot calls, records every call with its
+timestamp and serves queued updates through long-polling getUpdates.
+In local mode it accepts files sent as ``file://`` URIs, like a Bot API
+server started with ``--local``, and reads them from disk.
+"""
+import itertools
+import json
+import os
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import parse_qsl, urlparse
+from urllib.request import url2pathname
+
+
+def make_message_update(update_id: int, chat_id: int, text: str) -> Dict[str, Any]:
+    """Update carrying a private text message (commands get their entity)"""
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': f'user{chat_id}'},
+        'text': text
+    }
+    if text.startswith('/'):
+        message['entities'] = [
+            {'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}
+        ]
+    return {'update_id': update_id, 'message': message}
+
+
+def make_callback_update(update_id: int, chat_id: int, message_id: int,
+                         data: str) -> Dict[str, Any]:
+    """Update carrying an inline button press"""
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'chat_instance': str(chat_id),
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': f'user{chat_id}'},
+            'data': data,
+            'message': {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'text': ''
+            }
+        }
+    }
+
+
+class ApiError(Exception):
+    """Answered as ``{"ok": false}`` with status 400"""
+
+
+class FakeTelegramServer:
+    """Threaded HTTP server answering ``/bot<token>/<method>`` requests.
+
+    Every call except getUpdates is recorded with the result it got, so a
+    client can find the message_id of a message the bot sent.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, local_mode: bool = False):
+        self.local_mode = local_mode
+        self.local_bytes = 0  # bytes of the files read from disk in local mode
+        self.calls: List[Dict[str, Any]] = []
+        self._updates: List[Dict[str, Any]] = []
+        self._cond = threading.Condition()
+        self._message_ids = itertools.count(1000)
+        self._file_ids = itertools.count(1)
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def push_update(self, update: Dict[str, Any]):
+        """Queue an update for the next getUpdates call"""
+        with self._cond:
+            self._updates.append(update)
+            self._cond.notify_all()
+
+    def wait_for(self, predicate: Callable[[Dict[str, Any]], bool],
+                 timeout: float = 30, since: int = 0) -> Optional[Dict[str, Any]]:
+        """Block until a call recorded at index ``since`` or later matches predicate"""
+        deadline = time.monotonic() + timeout
+        seen = since
+        with self._cond:
+            while True:
+                for call in self.calls[seen:]:
+                    if predicate(call):
+                        return call
+                seen = len(self.calls)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    # -- API -----------------------------------------------------------------
+
+    def handle(self, method: str, params: Dict[str, Any]) -> Any:
+        call = {'time': time.monotonic(), 'method': method, 'params': params}
+        if method == 'getUpdates':
+            # Appel long : enregistré dès son arrivée
+            self._record(call)
+            return self._get_updates(params)
+        try:
+            call['result'] = self._answer(method, params)
+        except ApiError as e:
+            call['error'] = str(e)
+            raise
+        finally:
+            self._record(call)
+        return call['result']
+
+    def _record(self, call: Dict[str, Any]):
+        with self._cond:
+            self.calls.append(call)
+            self._cond.notify_all()
+
+    def _answer(self, method: str, params: Dict[str, Any]) -> Any:
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}
+        if method in ('sendMessage', 'editMessageText'):
+            return self._message(params, text=params.get('text', ''))
+        if method == 'sendAudio':
+            return self._message(params, audio=self._file(params.get('audio')))
+        if method == 'sendVideo':
+            return self._message(
+                params, video=dict(self._file(params.get('video')), width=0, height=0)
+            )
+        if method == 'sendDocument':
+            return self._message(params, document=self._file(params.get('document')))
+        return True
+
+    def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get('offset') or 0)
+        timeout = float(params.get('timeout') or 0)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            while not self._updates and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            return list(self._updates)
+
+    def _message(self, params: Dict[str, Any], **content: Any) -> Dict[str, Any]:
+        message_id = params.get('message_id') or next(self._message_ids)
+        return dict(
+            message_id=int(message_id),
+            date=int(time.time()),
+            chat={'id': int(params.get('chat_id', 0)), 'type': 'private'},
+            **content
+        )
+
+    def _file(self, value: Any) -> Dict[str, Any]:
+        if isinstance(value, str) and value.startswith('file://'):
+            return self._local_file(value)
+        if isinstance(value, str):
+            file_id = value  # file_id renvoyé tel quel
+        else:
+            file_id = f"fake-file-{next(self._file_ids)}"
+        return {'file_id': file_id, 'file_unique_id': file_id, 'duration': 0}
+
+    def _local_file(self, uri: str) -> Dict[str, Any]:
+        if not self.local_mode:
+            raise ApiError("Bad Request: wrong remote file identifier specified")
+        path = url2pathname(urlparse(uri).path)
+        if not os.path.isfile(path):
+            raise ApiError(f"Bad Request: file {path} not found")
+        # Lu comme le ferait le serveur local avant l'envoi à Telegram
+        size = 0
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                size += len(chunk)
+        with self._cond:
+            self.local_bytes += size
+        file_id = f"fake-file-{next(self._file_ids)}"
+        return {'file_id': file_id, 'file_unique_id': file_id, 'duration': 0, 'file_size': size}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                method = self.path.rstrip('/').rsplit('/', 1)[-1]
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else self._read_chunked()
+                params = _parse_body(self.headers.get('Content-Type', ''), body)
+                try:
+                    status, answer = 200, {'ok': True, 'result': server.handle(method, params)}
+                except ApiError as e:
+                    status, answer = 400, {'ok': False, 'error_code': 400, 'description': str(e)}
+                data = json.dumps(answer).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST
+
+            def _read_chunked(self) -> bytes:
+                if self.headers.get('Transfer-Encoding', '').lower() != 'chunked':
+                    return b''
+                chunks = []
+                while True:
+                    size = int(self.rfile.readline().strip() or b'0', 16)
+                    if size == 0:
+                        self.rfile.readline()
+                        return b''.join(chunks)
+                    chunks.append(self.rfile.read(size))
+                    self.rfile.readline()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def _parse_body(content_type: str, body: bytes) -> Dict[str, Any]:
+    if not body:
+        return {}
+    if content_type.startswith('application/json'):
+        return json.loads(body)
+    if content_type.startswith('multipart/form-data'):
+        message = BytesParser(policy=HTTP).parsebytes(
+            b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body
+        )
+        params: Dict[str, Any] = {}
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            payload = part.get_payload(decode=True) or b''
+            if part.get_filename():
+                params[name] = {'filename': part.get_filename(), 'size': len(payload)}
+            else:
+                params[name] = payload.decode()
+        return params
+    return dict(parse_qsl(body.decode()))
+
+
+if __name__ == '__main__':
+    fake = FakeTelegramServer(port=8081)
+    fake.start()
+    print(f"Fake Bot API listening on {fake.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
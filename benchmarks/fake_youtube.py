@@ -0,0 +1,111 @@
+"""Local media server standing in for YouTube in the offline benchmarks.
+
+Serves synthetic audio files at ``/media/<video_id>.m4a``. yt-dlp's generic
+extractor treats them as direct links, so the whole download path runs
+without network access. HEAD and byte ranges are supported like on a CDN.
+"""
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+MEDIA_RE = re.compile(r'^/media/(?P<id>[\w-]+)\.(?P<ext>m4a|mp4)$')
+CONTENT_TYPES = {'m4a': 'audio/mp4', 'mp4': 'video/mp4'}
+
+
+class FakeYouTubeServer:
+    """Threaded HTTP server returning ``media_size`` bytes per video"""
+
+    def __init__(self, media_size: int = 1024 * 1024, host: str = '127.0.0.1',
+                 port: int = 0, bandwidth: Optional[float] = None):
+        self.media_size = media_size
+        # Octets par seconde et par requête, None pour illimité
+        self.bandwidth = bandwidth
+        self.requests: Dict[str, int] = {}
+        self._payload = os.urandom(media_size)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def media_url(self, video_id: str, ext: str = 'm4a') -> str:
+        return f"{self.base_url}/media/{video_id}.{ext}"
+
+    def start(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _count(self, video_id: str):
+        with self._lock:
+            self.requests[video_id] = self.requests.get(video_id, 0) + 1
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_HEAD(self):
+                self._serve(body=False)
+
+            def do_GET(self):
+                self._serve(body=True)
+
+            def _serve(self, body: bool):
+                match = MEDIA_RE.match(self.path.split('?', 1)[0])
+                if not match:
+                    self.send_error(404)
+                    return
+
+                size = server.media_size
+                start, end = 0, size - 1
+                ranged = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+                if ranged:
+                    start = int(ranged.group(1))
+                    end = min(int(ranged.group(2) or end), end)
+                    if start > end:
+                        self.send_error(416)
+                        return
+
+                self.send_response(206 if ranged else 200)
+                self.send_header('Content-Type', CONTENT_TYPES[match.group('ext')])
+                self.send_header('Content-Length', str(end - start + 1))
+                self.send_header('Accept-Ranges', 'bytes')
+                if ranged:
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+                self.end_headers()
+                if not body:
+                    return
+
+                server._count(match.group('id'))
+                view = memoryview(server._payload)[start:end + 1]
+                chunk = 64 * 1024
+                for offset in range(0, len(view), chunk):
+                    self.wfile.write(view[offset:offset + chunk])
+                    if server.bandwidth:
+                        time.sleep(chunk / server.bandwidth)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == '__main__':
+    fake = FakeYouTubeServer(port=8082)
+    fake.start()
+    print(f"Fake media server listening on {fake.media_url('example')}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
@@ -0,0 +1,160 @@
+"""Cold-start benchmark: how fast a fresh bot process starts answering.
+
+Each run starts ``python bot.py`` in an empty working directory against the
+fake Bot API and the fake media server, then measures from process spawn:
+
+- first_api_call: the first request sent to the Bot API;
+- first_get_updates: the first getUpdates (the bot is listening);
+- first_reply: the answer to a /start sent as soon as it listens;
+- first_search: the result list for a video URL sent right after, or
+  ``--search-delay`` seconds after the reply;
+- search_latency: the same search, timed from the moment it is sent.
+
+The import time of ``bot`` alone is measured in a separate process.
+
+    python benchmarks/startup_bench.py --runs 5 --budget-ms 1500
+
+Exits with status 1 when the median time to the first getUpdates exceeds
+the budget.
+"""
+import argparse
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_utils import git_revision  # noqa: E402
+from fake_telegram import (  # noqa: E402
+    FakeTelegramServer, make_callback_update, make_message_update
+)
+from fake_youtube import FakeYouTubeServer  # noqa: E402
+
+CHAT_ID = 40_000
+
+
+def import_time() -> float:
+    """Seconds to import bot, net of the interpreter start-up"""
+    def run(code):
+        start = time.monotonic()
+        subprocess.run([sys.executable, '-c', code], cwd=tempfile.mkdtemp(), check=True,
+                       env=dict(os.environ, PYTHONPATH=ROOT))
+        return time.monotonic() - start
+    return run('import bot') - run('pass')
+
+
+def cold_start(telegram: FakeTelegramServer, youtube: FakeYouTubeServer,
+               run: int, timeout: float, search_delay: float = 0) -> Dict[str, Optional[float]]:
+    """Start one bot process and time its first answers (seconds)"""
+    work_dir = tempfile.mkdtemp(prefix='startup-bench-')
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN='123456:BENCHMARK',
+        TELEGRAM_API_BASE_URL=telegram.base_url,
+        WEBHOOK_URL=''
+    )
+    seen = len(telegram.calls)
+    chat_id = CHAT_ID + run
+
+    def after(predicate):
+        call = telegram.wait_for(
+            lambda c: telegram.calls.index(c) >= seen and predicate(c), timeout=timeout
+        )
+        return call['time'] - started if call else None
+
+    started = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'bot.py')], cwd=work_dir, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        timings = {
+            'first_api_call': after(lambda c: True),
+            'first_get_updates': after(lambda c: c['method'] == 'getUpdates')
+        }
+        telegram.push_update(make_message_update(run * 10 + 1, chat_id, '/start'))
+        timings['first_reply'] = after(
+            lambda c: c['method'] == 'sendMessage'
+            and str(c['params'].get('chat_id')) == str(chat_id)
+        )
+        time.sleep(search_delay)
+        telegram.push_update(make_callback_update(run * 10 + 2, chat_id, 1, 'search'))
+        sent = time.monotonic() - started
+        telegram.push_update(
+            make_message_update(run * 10 + 3, chat_id, youtube.media_url(f'startup{run}'))
+        )
+        timings['first_search'] = after(lambda c: 'select_video_0' in str(c['params']))
+        timings['search_latency'] = (
+            timings['first_search'] - sent if timings['first_search'] is not None else None
+        )
+        return timings
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def median_ms(values) -> Optional[float]:
+    values = [v for v in values if v is not None]
+    return statistics.median(values) * 1000 if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help='fail when the median time to the first getUpdates is above')
+    parser.add_argument('--search-delay', type=float, default=0,
+                        help='seconds between the /start reply and the search')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    telegram = FakeTelegramServer()
+    telegram.start()
+    youtube = FakeYouTubeServer(media_size=64 * 1024)
+    youtube.start()
+
+    runs = [
+        cold_start(telegram, youtube, i, args.timeout, args.search_delay)
+        for i in range(args.runs)
+    ]
+    results = {
+        'revision': git_revision(ROOT),
+        'runs': args.runs,
+        'import_ms': median_ms([import_time() for _ in range(args.runs)]),
+        'median_ms': {
+            name: median_ms([run[name] for run in runs])
+            for name in ('first_api_call', 'first_get_updates', 'first_reply', 'first_search',
+                         'search_latency')
+        },
+        'search_delay': args.search_delay,
+        'budget_ms': args.budget_ms
+    }
+    telegram.stop()
+    youtube.stop()
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    listening = results['median_ms']['first_get_updates']
+    if args.budget_ms is not None and (listening is None or listening > args.budget_ms):
+        print(f"Startup budget exceeded: {listening} ms > {args.budget_ms} ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Measure update→reply latency of the webhook and polling delivery modes.
+
+Runs the bot in-process against the fake Bot API, sends ``/start`` from N
+distinct chats and times each one until the welcome message is sent back.
+
+    python benchmarks/webhook_bench.py --mode webhook --updates 200
+    python benchmarks/webhook_bench.py --mode polling --updates 200
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_utils import free_port, latency_summary  # noqa: E402
+from fake_telegram import FakeTelegramServer, make_message_update  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--mode', choices=['webhook', 'polling'], default='webhook')
+    parser.add_argument('--updates', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    fake = FakeTelegramServer()
+    fake.start()
+    web_port = free_port()
+
+    # Le bot lit sa configuration à l'import
+    os.chdir(tempfile.mkdtemp(prefix='webhook-bench-'))
+    os.environ['TELEGRAM_BOT_TOKEN'] = '123456:BENCHMARK'
+    os.environ['TELEGRAM_API_BASE_URL'] = fake.base_url
+    os.environ['WEBHOOK_URL'] = f"http://127.0.0.1:{web_port}" if args.mode == 'webhook' else ''
+
+    import server
+    from config import Config
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    threading.Thread(
+        target=server.app.run,
+        kwargs={'host': '127.0.0.1', 'port': web_port},
+        daemon=True
+    ).start()
+    threading.Thread(target=server.start_bot, daemon=True).start()
+
+    ready = fake.wait_for(
+        lambda c: c['method'] in ('setWebhook', 'getUpdates'), timeout=30
+    )
+    if not ready:
+        sys.exit("Bot did not start")
+    time.sleep(0.5)
+
+    webhook_url = f"http://127.0.0.1:{web_port}{Config.WEBHOOK_PATH}"
+
+    def deliver(update):
+        if args.mode == 'polling':
+            fake.push_update(update)
+            return
+        request = urllib.request.Request(
+            webhook_url,
+            data=json.dumps(update).encode(),
+            headers={
+                'Content-Type': 'application/json',
+                'X-Telegram-Bot-Api-Secret-Token': Config.WEBHOOK_SECRET
+            }
+        )
+        urllib.request.urlopen(request).read()
+
+    def one_round_trip(i):
+        chat_id = 10_000 + i
+        start = time.monotonic()
+        deliver(make_message_update(i + 1, chat_id, '/start'))
+        reply = fake.wait_for(
+            lambda c: c['method'] == 'sendMessage'
+            and int(c['params'].get('chat_id', 0)) == chat_id
+        )
+        return (reply['time'] - start) if reply else None
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        latencies = [l for l in pool.map(one_round_trip, range(args.updates)) if l is not None]
+    elapsed = time.monotonic() - started
+
+    server.stop_event.set()
+    results = {
+        'mode': args.mode,
+        'updates': args.updates,
+        'answered': len(latencies),
+        'throughput_per_s': len(latencies) / elapsed if elapsed else 0,
+        'latency_ms': latency_summary(latencies)
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    fake.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,29 +3,45 @@ import logging
 import asyncio
 import re
 import time
+import threading
 from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
+from functools import partial
+from pathlib import Path
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Message
 from telegram.ext import (
     Updater,
     CommandHandler,
     CallbackQueryHandler,
     MessageHandler,
     Filters,
-    ConversationHandler
+    ConversationHandler,
+    TypeHandler
 )
 from telegram import ParseMode
 from telegram import error as telegram_error
+from telegram.utils.helpers import escape_markdown
 from telegram.utils.request import Request
 import tempfile
-import hashlib
 
 from config import Config
 from locales import MESSAGES
-from cache import Cache
+from cache import Cache, FileIdCache
 from db_models import Database
 from download_manager import DownloadManager
+from hashing import HashingReader, hash_file
+from job_queue import open_job_queue, worker_id
+from media_cache import MediaCache
+from metrics import REGISTRY, TRANSFERRED_BYTES, track
+from playlist import PlaylistPipeline
+from progress import ProgressFlusher, ProgressReporter
+from rate_limit import KeyedRateLimiter, RateLimitedBot, open_token_bucket
+from scheduler import DownloadScheduler, QueueFull
+from sessions import MediaRef, Session, SessionStore
+from speculative import SpeculativeDownloader
+from streaming import post_stream
+from webhook import WebhookBridge
 
 # Configuration des logs
 logging.basicConfig(
@@ -34,16 +50,109 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+FORMAT_LABELS = {'mp3': '🎵 MP3', 'audio': '🎧 Audio natif', 'mp4': '🎥 MP4'}
+PLAYLIST_URL_RE = re.compile(r'youtube\.com/playlist\?(?:\S*&)?list=[\w-]+')
+
 class YouTubeAudioDownloaderBot:
     # États de conversation
     (SEARCH_QUERY, SELECT_RESULT, SELECT_FORMAT) = range(3)
+    ALLOWED_UPDATES = ['message', 'callback_query']
+    # Délai avant qu'une playlist refusée faute de place redevienne disponible
+    PLAYLIST_RETRY_DELAY = 5
 
     def __init__(self):
+        # .env et dossiers de travail avant tout composant
+        Config.load()
         # Initialize components
         self.config = Config()
-        self.cache = Cache()
+        self.cache = Cache(
+            max_size=self.config.SEARCH_CACHE_SIZE,
+            ttl=self.config.MAX_CACHE_AGE,
+            negative_ttl=self.config.NEGATIVE_CACHE_TTL
+        )
         self.db = Database()
         self.download_manager = DownloadManager()
+        self.file_id_cache = FileIdCache(
+            self.db,
+            max_size=self.config.FILE_ID_CACHE_SIZE,
+            max_age=self.config.FILE_ID_MAX_AGE
+        )
+        self.media_cache = MediaCache(
+            self.db,
+            root=self.config.MEDIA_CACHE_DIR,
+            max_bytes=self.config.MEDIA_CACHE_MAX_MB * 1024 * 1024
+        )
+        self.scheduler = DownloadScheduler(
+            max_workers=self.config.MAX_CONCURRENT_DOWNLOADS,
+            max_pending_per_user=self.config.MAX_QUEUED_DOWNLOADS_PER_USER
+        )
+        # File partagée : les téléchargements partent vers les processus worker.py
+        self.job_queue = None
+        if self.config.JOB_QUEUE_URL:
+            self.job_queue = open_job_queue(
+                self.config.JOB_QUEUE_URL,
+                lease_seconds=self.config.JOB_LEASE_SECONDS,
+                max_attempts=self.config.JOB_MAX_ATTEMPTS,
+                max_pending_per_user=self.config.MAX_QUEUED_DOWNLOADS_PER_USER
+            )
+        self.progress_limiter = KeyedRateLimiter(
+            rate=self.config.PROGRESS_EDITS_PER_SECOND,
+            capacity=self.config.PROGRESS_EDITS_PER_SECOND,
+            key_rate=1 / self.config.PROGRESS_CHAT_INTERVAL,
+            key_capacity=1
+        )
+        # Les hooks de yt-dlp notent l'état, ce thread envoie les éditions
+        self.progress_flusher = ProgressFlusher()
+        # Admission par utilisateur, puis débit sortant vers l'API Telegram
+        self.user_limiters = {
+            'search': KeyedRateLimiter(
+                None, None,
+                key_rate=self.config.USER_SEARCHES_PER_MINUTE / 60,
+                key_capacity=self.config.USER_SEARCH_BURST
+            ),
+            'download': KeyedRateLimiter(
+                None, None,
+                key_rate=1 / self.config.RATE_LIMIT_SECONDS,
+                key_capacity=self.config.USER_DOWNLOAD_BURST
+            )
+        }
+        # Avec des workers, le plafond global de Telegram est partagé par tous les processus
+        outbound_bucket = None
+        if self.config.JOB_QUEUE_URL:
+            outbound_bucket = open_token_bucket(
+                self.config.JOB_QUEUE_URL, 'telegram',
+                rate=self.config.TELEGRAM_MESSAGES_PER_SECOND,
+                capacity=self.config.TELEGRAM_MESSAGES_PER_SECOND
+            )
+        self.outbound_limiter = KeyedRateLimiter(
+            rate=self.config.TELEGRAM_MESSAGES_PER_SECOND,
+            capacity=self.config.TELEGRAM_MESSAGES_PER_SECOND,
+            key_rate=self.config.TELEGRAM_CHAT_MESSAGES_PER_SECOND,
+            key_capacity=self.config.TELEGRAM_CHAT_BURST,
+            global_bucket=outbound_bucket
+        )
+        # Playlists à part : elles ne bloquent pas les workers des vidéos seules
+        self.playlist_scheduler = DownloadScheduler(
+            max_workers=self.config.MAX_ACTIVE_PLAYLISTS, max_pending_per_user=1
+        )
+        # Même limite dans un worker de la file partagée, qui reçoit n'importe quelle tâche
+        self._playlist_slots = threading.BoundedSemaphore(self.config.MAX_ACTIVE_PLAYLISTS)
+        # Le MP3 spéculatif reste dans ce processus : inutile avec des workers séparés
+        self.speculative = None
+        if self.config.SPECULATIVE_DOWNLOADS and not self.job_queue:
+            self.speculative = SpeculativeDownloader(
+                self.download_manager,
+                max_active=self.config.SPECULATIVE_MAX_ACTIVE,
+                ttl=self.config.SPECULATIVE_TTL
+            )
+        self.sessions = SessionStore(
+            ttl=self.config.SESSION_TTL,
+            max_sessions=self.config.MAX_SESSIONS,
+            on_evict=self._end_session
+        )
+        self.bot = None
+        self._dispatcher = None
+        self.webhook_bridge = None
 
         # Amélioration de la gestion des instances
         self._request = Request(
@@ -57,9 +166,118 @@ class YouTubeAudioDownloaderBot:
         self.retry_attempts = {}
         self.max_retries = 3
         self._tmp_dir = tempfile.mkdtemp()
+        self._register_metrics()
+
+    def _register_metrics(self):
+        """Expose queue and cache state, read only when /metrics is scraped"""
+        REGISTRY.gauge_callback(
+            'ytdl_active_downloads', 'Jobs being downloaded or uploaded',
+            lambda: len(self.active_downloads)
+        )
+        REGISTRY.gauge_callback(
+            'ytdl_queued_jobs', 'Jobs waiting for a download worker',
+            lambda: self.job_queue.pending() if self.job_queue else self.scheduler.pending
+        )
+        REGISTRY.gauge_callback(
+            'ytdl_busy_workers', 'Download workers running a job',
+            lambda: self.scheduler.active
+        )
+        REGISTRY.gauge_callback(
+            'ytdl_db_pending_writes', 'Rows waiting for the write-behind thread',
+            lambda: self.db.pending_writes
+        )
+        REGISTRY.gauge_callback(
+            'ytdl_webhook_queue_depth', 'Updates waiting for the dispatcher',
+            lambda: self.webhook_bridge.queue.qsize() if self.webhook_bridge else 0
+        )
+        REGISTRY.gauge_callback(
+            'ytdl_speculation_hit_ratio', 'Speculative MP3 downloads claimed by their user',
+            lambda: self.speculative.hit_rate() if self.speculative else 0
+        )
+        REGISTRY.gauge_callback(
+            'ytdl_sessions', 'Live conversation sessions', lambda: len(self.sessions)
+        )
+        REGISTRY.gauge_callback(
+            'ytdl_media_cache_bytes', 'Size of the on-disk media cache',
+            lambda: self.media_cache.stats()['bytes']
+        )
+        REGISTRY.counter_callback(
+            'ytdl_cache_lookups_total', 'Cache lookups by cache and result',
+            self._cache_lookups, ('cache', 'result')
+        )
+
+    def _create_bot(self, request: Request) -> RateLimitedBot:
+        return RateLimitedBot(
+            self.config.TELEGRAM_BOT_TOKEN,
+            base_url=self.config.TELEGRAM_API_BASE_URL,
+            base_file_url=self.config.TELEGRAM_API_FILE_URL,
+            request=request,
+            limiter=self.outbound_limiter,
+            max_retry_after=self.config.TELEGRAM_MAX_RETRY_AFTER
+        )
+
+    def _interactive(self, callback):
+        """Handler callback whose replies never wait for the outbound limiter"""
+        def handle(update: Update, context):
+            # Le dispatcher sert tous les utilisateurs : une discussion chargée
+            # ne doit pas le bloquer
+            with self.bot.interactive():
+                return callback(update, context)
+        return handle
+
+    def _admit(self, user_id: int, action: str, tokens: int = 1) -> Optional[str]:
+        """None if the user may search/download now, else the refusal message"""
+        limiter = self.user_limiters[action]
+        if limiter.try_acquire(user_id, tokens):
+            return None
+        wait = max(1, round(limiter.wait_time(user_id, tokens)))
+        return MESSAGES['fr']['rate_limited'].format(wait)
+
+    def _end_session(self, user_id: int, session: Session):
+        """Forget what python-telegram-bot keeps per user once the session is gone.
+
+        The conversation itself ends on its own timeout (SESSION_TTL), or on
+        the next button, which finds no session and returns END.
+        """
+        if self.speculative:
+            self.speculative.cancel(user_id, outcome='expired')
+        if self._dispatcher:
+            self._dispatcher.user_data.pop(user_id, None)
+            self._dispatcher.chat_data.pop(session.chat_id, None)
+
+    def conversation_timeout(self, update: Update, context):
+        """Conversation idle for SESSION_TTL: end the session with it"""
+        user_id = update.effective_user.id
+        session = self.sessions.discard(user_id)
+        if session is not None:
+            self._end_session(user_id, session)
+
+    def _is_cached(self, video_id: str, format_type: str, quality: str) -> bool:
+        """Whether a delivery would come from a cache, without counting a lookup"""
+        return (
+            (video_id, format_type, quality) in self.media_cache
+            or self.db.get_telegram_file(video_id, format_type, quality) is not None
+        )
+
+    def _session_for(self, query) -> Optional[Session]:
+        """Live session whose buttons are on the message of this callback"""
+        session = self.sessions.get(query.from_user.id)
+        if session is None or session.message_id != query.message.message_id:
+            return None
+        return session
+
+    def _cache_lookups(self) -> Dict[tuple, int]:
+        lookups = {}
+        for name, stats in (('search', self.cache.stats()),
+                            ('file_id', self.file_id_cache.stats()),
+                            ('media', self.media_cache.stats())):
+            lookups[(name, 'hit')] = stats['hits']
+            lookups[(name, 'miss')] = stats['misses']
+        return lookups
 
     def start_command(self, update: Update, context) -> int:
         """Commande de démarrage du bot"""
+        self.sessions.open(update.effective_user.id, update.effective_chat.id)
         keyboard = [
             [
                 InlineKeyboardButton("🔍 Rechercher", callback_data='search'),
@@ -82,6 +300,7 @@ class YouTubeAudioDownloaderBot:
         """Gérer les interactions avec les boutons"""
         query = update.callback_query
         query.answer()
+        self.sessions.open(update.effective_user.id, update.effective_chat.id)
 
         if query.data == 'search':
             query.edit_message_text(
@@ -96,8 +315,9 @@ class YouTubeAudioDownloaderBot:
                 "• Le bot vous proposera les résultats\n"
                 "• Sélectionnez la vidéo à télécharger\n\n"
                 "_Limitations_ :\n"
-                "• Fichiers < 50 MB\n"
-                "• Téléchargement toutes les 30 secondes"
+                f"• Fichiers < {self.config.MAX_FILE_SIZE_MB} MB\n"
+                f"• {self.config.USER_DOWNLOAD_BURST} téléchargements d'affilée, "
+                f"puis un toutes les {self.config.RATE_LIMIT_SECONDS} secondes"
             )
             query.edit_message_text(
                 help_text,
@@ -113,21 +333,43 @@ class YouTubeAudioDownloaderBot:
         """Rechercher et proposer des résultats audio"""
         query = update.message.text
 
-        search_message = update.message.reply_text(
-            "🔍 Recherche en cours...\nVeuillez patienter quelques secondes ⏳",
-            parse_mode=ParseMode.MARKDOWN
-        )
+        refusal = self._admit(update.effective_user.id, 'search')
+        if refusal:
+            update.message.reply_text(refusal)
+            return self.SEARCH_QUERY
+
+        if PLAYLIST_URL_RE.search(query):
+            return self.show_playlist(update, context, query.strip())
+
+        # Les résultats en cache sont affichés directement
+        search_results = self.cache.get_search_results(query)
+        if search_results is not None:
+            reply = update.message.reply_text
+        else:
+            search_message = update.message.reply_text(
+                "🔍 Recherche en cours...\nVeuillez patienter quelques secondes ⏳",
+                parse_mode=ParseMode.MARKDOWN
+            )
+            reply = search_message.edit_text
 
         try:
-            search_results = self.download_manager.search_video(query)
+            if search_results is None:
+                search_results = tuple(
+                    MediaRef.from_summary(video)
+                    for video in self.download_manager.search_video(query)
+                )
+                # Une erreur a levé une exception avant : seul un vrai « aucun
+                # résultat » est mis en cache négatif
+                self.cache.set_search_results(query, search_results)
 
             if not search_results:
-                search_message.edit_text("❌ Aucun résultat trouvé.")
+                reply("❌ Aucun résultat trouvé.")
                 return ConversationHandler.END
 
             keyboard = []
-            for i, video in enumerate(search_results[:self.config.MAX_SEARCH_RESULTS]):
-                title = video['title'][:50] + ('...' if len(video['title']) > 50 else '')
+            search_results = search_results[:self.config.MAX_SEARCH_RESULTS]
+            for i, video in enumerate(search_results):
+                title = video.title[:50] + ('...' if len(video.title) > 50 else '')
                 keyboard.append([
                     InlineKeyboardButton(
                         f"{i+1}. {title}",
@@ -139,101 +381,218 @@ class YouTubeAudioDownloaderBot:
                 InlineKeyboardButton("🔙 Annuler", callback_data="cancel")
             ])
 
-            search_message.edit_text(
+            message = reply(
                 "🎵 Sélectionnez une vidéo :",
                 reply_markup=InlineKeyboardMarkup(keyboard)
             )
 
-            context.user_data['search_results'] = search_results
+            if self.speculative:
+                self.speculative.cancel(update.effective_user.id)
+            session = self.sessions.open(update.effective_user.id, update.effective_chat.id)
+            session.results = search_results
+            session.selected = session.playlist = None
+            session.message_id = message.message_id
+            self.download_manager.prefetch_video(search_results[0].as_dict())
             return self.SELECT_RESULT
 
         except Exception as e:
             logger.error(f"Erreur de recherche : {e}")
-            search_message.edit_text(f"❌ Erreur lors de la recherche : {str(e)}")
+            reply(f"❌ Erreur lors de la recherche : {str(e)}")
+            return ConversationHandler.END
+
+    def show_playlist(self, update: Update, context, url: str) -> int:
+        """Afficher la première page d'une playlist et proposer de tout télécharger"""
+        message = update.message.reply_text("📑 Chargement de la playlist... ⏳")
+        try:
+            page = self.download_manager.get_playlist_page(url)
+        except Exception as e:
+            logger.error(f"Erreur de playlist : {e}")
+            message.edit_text(f"❌ Erreur lors du chargement de la playlist : {str(e)}")
+            return ConversationHandler.END
+
+        if not page['entries']:
+            message.edit_text("❌ Playlist vide.")
+            return ConversationHandler.END
+
+        # Seules les métadonnées sont gardées, les pistes sont relues à la demande
+        session = self.sessions.open(update.effective_user.id, update.effective_chat.id)
+        session.playlist = {
+            'id': page['id'], 'title': page['title'], 'url': url, 'count': page['count']
+        }
+        session.results, session.selected = (), None
+        session.message_id = message.message_id
+        text, markup = self._render_playlist_page(page)
+        message.edit_text(text, reply_markup=markup, parse_mode=ParseMode.MARKDOWN)
+        return self.SELECT_RESULT
+
+    def show_playlist_page(self, query, context, page_number: int) -> int:
+        """Afficher une autre page d'une playlist"""
+        session = self._session_for(query)
+        playlist = session and session.playlist
+        if not playlist:
+            query.edit_message_text(MESSAGES['fr']['session_expired'])
             return ConversationHandler.END
 
+        page = self.download_manager.get_playlist_page(playlist['url'], max(page_number, 0))
+        playlist['count'] = page['count'] or playlist['count']
+        text, markup = self._render_playlist_page(page)
+        query.edit_message_text(text, reply_markup=markup, parse_mode=ParseMode.MARKDOWN)
+        return self.SELECT_RESULT
+
+    def _render_playlist_page(self, page: Dict[str, Any]):
+        first = page['page'] * self.config.PLAYLIST_PAGE_SIZE
+        lines = [
+            f"{first + i + 1}. {escape_markdown(entry['title'][:50])}"
+            for i, entry in enumerate(page['entries'])
+        ]
+        text = (
+            MESSAGES['fr']['playlist_info'].format(page['title'], page['count'] or '?')
+            + "\n\n" + "\n".join(lines)
+        )
+
+        navigation = []
+        if page['page'] > 0:
+            navigation.append(
+                InlineKeyboardButton("◀️ Précédente", callback_data=f"plpage_{page['page'] - 1}")
+            )
+        if page['has_more']:
+            navigation.append(
+                InlineKeyboardButton("Suivante ▶️", callback_data=f"plpage_{page['page'] + 1}")
+            )
+        keyboard = [navigation] if navigation else []
+        keyboard += [
+            [
+                InlineKeyboardButton("🎵 Tout en MP3", callback_data='playlist_mp3'),
+                InlineKeyboardButton("🎥 Tout en MP4", callback_data='playlist_mp4')
+            ],
+            [InlineKeyboardButton("🎧 Tout en audio natif", callback_data='playlist_audio')],
+            [InlineKeyboardButton("🔙 Annuler", callback_data='cancel')]
+        ]
+        return text, InlineKeyboardMarkup(keyboard)
+
+    def start_playlist(self, query, context, user_id: int, format_type: str) -> int:
+        """Lancer le pipeline de téléchargement d'une playlist"""
+        session = self._session_for(query)
+        playlist = session and session.playlist
+        if not playlist:
+            query.edit_message_text(MESSAGES['fr']['session_expired'])
+            return ConversationHandler.END
+
+        # Une playlist consomme toute la rafale de téléchargements de l'utilisateur
+        tokens = min(playlist['count'] or self.config.USER_DOWNLOAD_BURST,
+                     self.config.USER_DOWNLOAD_BURST)
+        refusal = self._admit(user_id, 'download', tokens)
+        if refusal:
+            query.edit_message_text(refusal)
+            return ConversationHandler.END
+
+        job = {
+            'user_id': user_id,
+            'chat_id': query.message.chat_id,
+            'message_id': query.message.message_id,
+            'playlist': dict(playlist),
+            'format': format_type,
+            'quality': 'medium'
+        }
+        try:
+            if self.job_queue:
+                position = self.job_queue.put(user_id, job)
+            else:
+                position = self.playlist_scheduler.submit(user_id, self.execute_playlist, job)
+        except QueueFull:
+            self.user_limiters['download'].refund(user_id, tokens)
+            query.edit_message_text(
+                "⏳ Vous avez déjà trop de téléchargements en attente. "
+                "Réessayez quand ils seront terminés."
+            )
+            return ConversationHandler.END
+
+        text = (
+            MESSAGES['fr']['playlist_info'].format(playlist['title'], playlist['count'] or '?')
+            + "\n🔽 Téléchargement en cours..."
+        )
+        if position > 0:
+            text += "\n\n" + MESSAGES['fr']['queue_position'].format(position)
+        query.edit_message_text(text, parse_mode=ParseMode.MARKDOWN)
+        return ConversationHandler.END
+
     def process_download(self, update: Update, context) -> int:
         """Process download with format selection"""
         query = update.callback_query
         user_id = update.effective_user.id
 
         if query.data == 'cancel':
+            if self.speculative:
+                self.speculative.cancel(user_id)
             query.edit_message_text("❌ Recherche annulée.")
             return ConversationHandler.END
 
         try:
+            if query.data.startswith('playlist_'):
+                return self.start_playlist(query, context, user_id, query.data.split('_')[1])
+
+            if query.data.startswith('plpage_'):
+                return self.show_playlist_page(query, context, int(query.data.split('_')[1]))
+
             if query.data.startswith('format_'):
                 format_type = query.data.split('_')[1]
-                video_data = context.user_data.get('selected_video')
+                session = self._session_for(query)
+                if not session or not session.selected:
+                    query.edit_message_text(MESSAGES['fr']['session_expired'])
+                    return ConversationHandler.END
+                video_data = session.selected.as_dict()
+
+                job = {
+                    'user_id': user_id,
+                    'chat_id': query.message.chat_id,
+                    'message_id': query.message.message_id,
+                    'video': video_data,
+                    'format': format_type,
+                    'quality': 'medium'
+                }
 
-                if not video_data:
-                    query.edit_message_text("❌ Erreur : vidéo non trouvée.")
+                refusal = self._admit(user_id, 'download')
+                if refusal:
+                    # La conversation s'arrête : le MP3 spéculatif ne sera pas réclamé
+                    if self.speculative:
+                        self.speculative.cancel(user_id)
+                    query.edit_message_text(refusal)
+                    return ConversationHandler.END
+
+                if self.speculative:
+                    # Objet local : seulement sans file partagée (jamais sérialisé)
+                    job['speculation'] = self.speculative.claim(
+                        user_id, video_data['id'], format_type, job['quality']
+                    )
+
+                try:
+                    if self.job_queue:
+                        position = self.job_queue.put(user_id, job)
+                    else:
+                        position = self.scheduler.submit(user_id, self.execute_download, job)
+                except QueueFull:
+                    if job.get('speculation'):
+                        self.speculative.discard(job['speculation'])
+                    self.user_limiters['download'].refund(user_id)
+                    query.edit_message_text(
+                        "⏳ Vous avez déjà trop de téléchargements en attente. "
+                        "Réessayez quand ils seront terminés."
+                    )
                     return ConversationHandler.END
 
                 # Message de téléchargement avec limite de taille
                 download_message = (
                     f"🔽 Téléchargement en cours : *{video_data['title']}*\n"
-                    f"Format : {'🎵 MP3' if format_type == 'mp3' else '🎥 MP4'}\n"
+                    f"Format : {FORMAT_LABELS[format_type]}\n"
                     f"Taille maximale autorisée : {self.config.MAX_FILE_SIZE_MB}MB"
                 )
+                if position > 0:
+                    download_message += "\n\n" + MESSAGES['fr']['queue_position'].format(position)
                 query.edit_message_text(
                     download_message,
                     parse_mode=ParseMode.MARKDOWN
                 )
-
-                try:
-                    file_path, info, file_size = self.download_manager.download_media(
-                        video_data['url'],
-                        format_type=format_type
-                    )
-
-                    if format_type == 'mp3':
-                        with open(file_path, 'rb') as audio:
-                            update.effective_chat.send_audio(
-                                audio,
-                                title=video_data['title'],
-                                performer=info.get('uploader', 'Unknown'),
-                                duration=info.get('duration', 0)
-                            )
-                    else:  # mp4
-                        with open(file_path, 'rb') as video:
-                            update.effective_chat.send_video(
-                                video,
-                                caption=video_data['title'],
-                                supports_streaming=True,
-                                duration=info.get('duration', 0)
-                            )
-
-                    self.db.log_download(
-                        user_id,
-                        info,
-                        self.download_manager._calculate_file_hash(file_path),
-                        format_type,
-                        file_size
-                    )
-
-                    os.remove(file_path)
-                    success_message = (
-                        f"✅ Téléchargé : *{video_data['title']}*\n"
-                        f"Format : {'🎵 MP3' if format_type == 'mp3' else '🎥 MP4'}\n"
-                        f"Taille : {file_size:.1f}MB"
-                    )
-                    query.edit_message_text(
-                        success_message,
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                    return ConversationHandler.END
-
-                except ValueError as e:
-                    error_message = (
-                        f"❌ *Erreur* : {str(e)}\n"
-                        "Essayez une vidéo plus courte ou un format différent."
-                    )
-                    query.edit_message_text(
-                        error_message,
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                    return ConversationHandler.END
+                return ConversationHandler.END
 
             match = re.match(r'select_video_(\d+)', query.data)
             if not match:
@@ -241,14 +600,27 @@ class YouTubeAudioDownloaderBot:
                 return ConversationHandler.END
 
             index = int(match.group(1))
-            search_results = context.user_data.get('search_results', [])
+            session = self._session_for(query)
+            if session is None:
+                query.edit_message_text(MESSAGES['fr']['session_expired'])
+                return ConversationHandler.END
 
-            if index >= len(search_results):
+            if index >= len(session.results):
                 query.edit_message_text("❌ Vidéo non trouvée.")
                 return ConversationHandler.END
 
-            video = search_results[index]
-            context.user_data['selected_video'] = video
+            video = session.results[index]
+            if not video.resolved:
+                # Métadonnées complètes uniquement pour la vidéo choisie
+                try:
+                    video = MediaRef.from_summary(
+                        self.download_manager.resolve_video(video.as_dict())
+                    )
+                except Exception as e:
+                    logger.warning(f"Métadonnées indisponibles pour {video.id} : {e}")
+            session.selected = video
+            if self.speculative and not self._is_cached(video.id, 'mp3', 'medium'):
+                self.speculative.start(user_id, video.as_dict())
 
             # Afficher les options de format
             keyboard = [
@@ -256,14 +628,15 @@ class YouTubeAudioDownloaderBot:
                     InlineKeyboardButton("🎵 MP3 (Audio)", callback_data='format_mp3'),
                     InlineKeyboardButton("🎥 MP4 (Vidéo)", callback_data='format_mp4')
                 ],
+                [InlineKeyboardButton(MESSAGES['fr']['format_audio'], callback_data='format_audio')],
                 [InlineKeyboardButton("🔙 Annuler", callback_data='cancel')]
             ]
 
-            estimated_size = video.get('filesize', 0) / (1024 * 1024)  # Convert to MB
+            estimated_size = video.filesize / (1024 * 1024)  # Convert to MB
             format_message = (
-                f"*{video['title']}*\n\n"
-                f"📊 Durée : {int(video['duration'] / 60)}:{int(video['duration'] % 60):02d}\n"
-                f"👤 Chaîne : {video['uploader']}\n"
+                f"*{video.title}*\n\n"
+                f"📊 Durée : {int(video.duration / 60)}:{int(video.duration % 60):02d}\n"
+                f"👤 Chaîne : {video.uploader}\n"
                 f"💾 Taille estimée : {estimated_size:.1f} MB\n\n"
                 "Choisissez le format de téléchargement :"
             )
@@ -280,6 +653,304 @@ class YouTubeAudioDownloaderBot:
             query.edit_message_text(f"❌ Erreur : {str(e)}")
             return ConversationHandler.END
 
+    def execute_download(self, job: Dict[str, Any]):
+        """Download, upload and log one queued job (runs on a scheduler worker)"""
+        video_data = job['video']
+        format_type = job['format']
+        quality = job['quality']
+        speculation = job.pop('speculation', None)
+        self.active_downloads[(job['chat_id'], job['message_id'])] = job
+
+        try:
+            if self._send_cached_media(job) or self._send_from_media_cache(job):
+                return
+
+            progress = ProgressReporter(
+                self.bot, job['chat_id'], job['message_id'],
+                video_data['title'], self.progress_limiter, self.progress_flusher
+            )
+            try:
+                # Téléchargement spéculatif terminé : le fichier est déjà là
+                prefetched = speculation.take() if speculation else None
+                streamed = None
+                if prefetched:
+                    file_path, info, file_size = prefetched
+                # Serveur Bot API local : l'envoi par chemin ne copie déjà rien
+                elif self.config.STREAMING_UPLOADS and not self.config.TELEGRAM_LOCAL_MODE:
+                    # Envoyé pendant la lecture, sauf si un autre téléchargement l'a précédé
+                    (file_path, info, file_size), streamed = self.download_manager.stream_media(
+                        video_data['url'],
+                        partial(self._post_stream, job),
+                        format_type=format_type,
+                        quality=quality,
+                        video_id=video_data['id'],
+                        progress_callback=progress
+                    )
+                else:
+                    # S'il est encore en cours, download_media s'y rattache
+                    file_path, info, file_size = self.download_manager.download_media(
+                        video_data['url'],
+                        format_type=format_type,
+                        quality=quality,
+                        video_id=video_data['id'],
+                        progress_callback=progress
+                    )
+
+                try:
+                    if streamed:
+                        message, file_hash = streamed
+                        self._record_upload(job, message, file_path, info, file_hash, file_size)
+                    else:
+                        progress.update('upload')
+                        self._upload_file(job, file_path, info, file_size)
+                finally:
+                    # D'autres utilisateurs peuvent encore avoir besoin du fichier
+                    self.download_manager.release(file_path)
+            finally:
+                # Aucune édition de progression ne doit suivre le message final
+                progress.close()
+
+            self._show_download_success(job, file_size)
+
+        except ValueError as e:
+            error_message = (
+                f"❌ *Erreur* : {str(e)}\n"
+                "Essayez une vidéo plus courte ou un format différent."
+            )
+            self._edit_job_message(job, error_message, parse_mode=ParseMode.MARKDOWN)
+
+        except Exception as e:
+            logger.error(f"Erreur de téléchargement : {e}")
+            self._edit_job_message(job, f"❌ Erreur : {str(e)}")
+
+        finally:
+            if speculation:
+                self.speculative.discard(speculation)
+            self.active_downloads.pop((job['chat_id'], job['message_id']), None)
+
+    def execute_playlist(self, job: Dict[str, Any]):
+        """Deliver every track of a playlist through the streaming pipeline"""
+        playlist = job['playlist']
+
+        def deliver(item):
+            track_job = dict(job, video=item['entry'])
+            if 'cached' in item:
+                cached = item['cached']
+                self._send_media(track_job, cached['file_id'], item['entry'])
+                self.db.log_download(
+                    job['user_id'], item['entry'], cached['file_hash'],
+                    job['format'], cached['file_size'] or 0
+                )
+            else:
+                self._upload_file(track_job, item['path'], item['info'], item['size'])
+
+        def lookup(entry):
+            return self.file_id_cache.get(entry['id'], job['format'], job['quality'])
+
+        def on_progress(summary):
+            progress.show(self._playlist_status(playlist, summary))
+
+        progress = ProgressReporter(
+            self.bot, job['chat_id'], job['message_id'], playlist['title'],
+            self.progress_limiter, self.progress_flusher
+        )
+        try:
+            # Les pistes sont extraites au fil de l'eau, page par page
+            entries = self.download_manager.iter_playlist(playlist['url'])
+            pipeline = PlaylistPipeline(
+                self.download_manager, self.db, playlist['id'], entries,
+                job['chat_id'], job['format'], job['quality'],
+                deliver=deliver, lookup=lookup, on_progress=on_progress,
+                concurrency=self.config.PLAYLIST_CONCURRENCY
+            )
+            summary = pipeline.run()
+            progress.close()
+            self._edit_job_message(
+                job, self._playlist_status(playlist, summary, done=True),
+                parse_mode=ParseMode.MARKDOWN
+            )
+        except Exception as e:
+            logger.error(f"Erreur de playlist : {e}")
+            progress.close()
+            self._edit_job_message(job, f"❌ Erreur : {str(e)}")
+
+    def _playlist_status(self, playlist: Dict, summary: Dict, done: bool = False) -> str:
+        text = (
+            MESSAGES['fr']['playlist_info'].format(
+                playlist['title'], playlist.get('count') or summary['total']
+            )
+            + f"\n✅ Envoyées : {summary['delivered'] + summary['skipped']}"
+        )
+        if summary['failed']:
+            text += f"\n❌ Échecs : {len(summary['failed'])}"
+        if done:
+            text += "\n\n" + ("🏁 Terminé" if not summary['failed'] else "🏁 Terminé avec des erreurs :")
+            for title, error in summary['failed'][:10]:
+                text += f"\n• {title[:40]} : {error[:80]}"
+            if summary['failed']:
+                text += "\n\nRenvoyez le lien pour réessayer les pistes manquantes."
+        return text
+
+    def _upload_file(self, job: Dict[str, Any], file_path: str, info: Dict,
+                     file_size: float, cache_file: bool = True):
+        """Upload a downloaded file, then log it and remember its file_id and content"""
+        if self.config.TELEGRAM_LOCAL_MODE:
+            # Le serveur local lit le fichier lui-même : aucun octet ne passe par ici
+            with track('upload'):
+                message = self._send_media(
+                    job, Path(file_path).resolve().as_uri(), info,
+                    timeout=self.config.LOCAL_API_UPLOAD_TIMEOUT
+                )
+            file_hash = hash_file(file_path)
+        else:
+            # Le hash est calculé pendant la lecture de l'envoi
+            filename = f"{info.get('id', job['video']['id'])}{os.path.splitext(file_path)[1]}"
+            with track('upload'), HashingReader(open(file_path, 'rb')) as media:
+                message = self._send_media(job, media, info, filename=filename)
+                file_hash = media.hexdigest()
+            TRANSFERRED_BYTES.inc(media.bytes_read, direction='upload')
+
+        self._record_upload(job, message, file_path, info, file_hash, file_size, cache_file)
+
+    def _record_upload(self, job: Dict[str, Any], message, file_path: str, info: Dict,
+                       file_hash: str, file_size: float, cache_file: bool = True):
+        """Log a delivered file and remember its file_id and content"""
+        self.db.log_download(
+            job['user_id'],
+            info,
+            file_hash,
+            job['format'],
+            file_size
+        )
+
+        video_id = info.get('id', job['video']['id'])
+        file_id = self._get_file_id(message)
+        if file_id:
+            self.file_id_cache.put(
+                video_id, job['format'], job['quality'], file_id, file_hash, file_size
+            )
+        if cache_file:
+            # Déjà livré : une erreur de cache ne doit pas transformer l'envoi en échec
+            try:
+                self.media_cache.commit(
+                    video_id, job['format'], job['quality'], file_path, file_hash
+                )
+            except Exception as e:
+                logger.warning(f"Mise en cache de {video_id} impossible : {e}")
+
+    def _post_stream(self, job: Dict[str, Any], stream, info: Dict, filename: str):
+        """Upload a stream while it is read, return the sent message and its hash"""
+        video_data = job['video']
+        if job['format'] in ('mp3', 'audio'):
+            method, field, fields = 'sendAudio', 'audio', {
+                'title': video_data['title'],
+                'performer': info.get('uploader', 'Unknown')
+            }
+        else:
+            method, field, fields = 'sendVideo', 'video', {
+                'caption': video_data['title'],
+                'supports_streaming': 'true'
+            }
+        fields.update(chat_id=job['chat_id'], duration=int(info.get('duration') or 0))
+
+        # Taille limite vérifiée pendant l'envoi, sans fichier intermédiaire
+        # Envoi hors de Bot._post : même limite de débit par discussion
+        self.outbound_limiter.acquire(job['chat_id'])
+        with track('upload'), HashingReader(stream) as media:
+            result = post_stream(
+                f"{self.bot.base_url}/{method}", fields, field, filename, media
+            )
+            file_hash = media.hexdigest()
+        TRANSFERRED_BYTES.inc(media.bytes_read, direction='upload')
+        return Message.de_json(result, self.bot), file_hash
+
+    def _send_media(self, job: Dict[str, Any], media, info: Dict, **kwargs):
+        """Send a file object, a file:// URI or a Telegram file_id in the requested format"""
+        title = job['video']['title']
+        if job['format'] in ('mp3', 'audio'):
+            return self.bot.send_audio(
+                job['chat_id'],
+                media,
+                title=title,
+                performer=info.get('uploader', 'Unknown'),
+                duration=info.get('duration', 0),
+                **kwargs
+            )
+        return self.bot.send_video(
+            job['chat_id'],
+            media,
+            caption=title,
+            supports_streaming=True,
+            duration=info.get('duration', 0),
+            **kwargs
+        )
+
+    def _get_file_id(self, message) -> Optional[str]:
+        """Extract the file_id of the media attached to a sent message"""
+        media = message and (message.audio or message.video or message.document)
+        return media.file_id if media else None
+
+    def _send_cached_media(self, job: Dict[str, Any]) -> bool:
+        """Resend an already uploaded file by file_id, return True on success"""
+        video_data = job['video']
+        key = (video_data['id'], job['format'], job['quality'])
+        cached = self.file_id_cache.get(*key)
+        if not cached:
+            return False
+
+        try:
+            self._send_media(job, cached['file_id'], video_data)
+        except telegram_error.BadRequest as e:
+            # file_id refusé par Telegram : on l'oublie et on retélécharge
+            logger.warning(f"file_id invalide pour {video_data['id']} : {e}")
+            self.file_id_cache.invalidate(*key)
+            return False
+
+        file_size = cached['file_size'] or 0
+        self.db.log_download(
+            job['user_id'], video_data, cached['file_hash'], job['format'], file_size
+        )
+        self._show_download_success(job, file_size)
+        return True
+
+    def _send_from_media_cache(self, job: Dict[str, Any]) -> bool:
+        """Upload a file kept in the media cache, return True on success"""
+        video_data = job['video']
+        cached = self.media_cache.acquire(video_data['id'], job['format'], job['quality'])
+        if not cached:
+            return False
+
+        try:
+            self._upload_file(job, cached['path'], video_data, cached['file_size'],
+                              cache_file=False)
+        except FileNotFoundError:
+            # Évincé par un autre worker qui partage le cache : on retélécharge
+            logger.warning(f"Fichier en cache disparu pour {video_data['id']}")
+            return False
+        finally:
+            self.media_cache.release(cached['path'])
+        self._show_download_success(job, cached['file_size'])
+        return True
+
+    def _edit_job_message(self, job: Dict[str, Any], text: str, **kwargs):
+        try:
+            self.bot.edit_message_text(
+                text,
+                chat_id=job['chat_id'],
+                message_id=job['message_id'],
+                **kwargs
+            )
+        except telegram_error.TelegramError as e:
+            logger.error(f"Impossible de modifier le message : {e}")
+
+    def _show_download_success(self, job: Dict[str, Any], file_size: float):
+        success_message = (
+            f"✅ Téléchargé : *{job['video']['title']}*\n"
+            f"Format : {FORMAT_LABELS[job['format']]}\n"
+            f"Taille : {file_size:.1f}MB"
+        )
+        self._edit_job_message(job, success_message, parse_mode=ParseMode.MARKDOWN)
+
     def show_stats(self, update: Update, context):
         """Display enhanced user statistics"""
         query = update.callback_query
@@ -313,39 +984,67 @@ class YouTubeAudioDownloaderBot:
         """Setup bot with enhanced conversation handler"""
         # Utilisation d'un seul updater avec timeout optimisé
         updater = Updater(
-            self.config.TELEGRAM_BOT_TOKEN,
+            bot=self._create_bot(self._request),
             use_context=True,
-            request_kwargs={'read_timeout': 30, 'connect_timeout': 30},
             workers=4
         )
         dp = updater.dispatcher
+        self.bot = updater.bot
+        self._dispatcher = dp
 
         conv_handler = ConversationHandler(
             entry_points=[
-                CommandHandler('start', self.start_command),
-                CallbackQueryHandler(self.callback_handler)
+                CommandHandler('start', self._interactive(self.start_command)),
+                CallbackQueryHandler(self._interactive(self.callback_handler))
             ],
             states={
                 self.SEARCH_QUERY: [
                     MessageHandler(
                         Filters.text & ~Filters.command,
-                        self.search_audio
+                        self._interactive(self.search_audio)
                     )
                 ],
                 self.SELECT_RESULT: [
-                    CallbackQueryHandler(self.process_download)
+                    CallbackQueryHandler(self._interactive(self.process_download))
                 ],
                 self.SELECT_FORMAT: [
-                    CallbackQueryHandler(self.process_download)
-                ]
+                    CallbackQueryHandler(self._interactive(self.process_download))
+                ],
+                ConversationHandler.TIMEOUT: [TypeHandler(Update, self.conversation_timeout)]
             },
-            fallbacks=[CommandHandler('cancel', self.start_command)]
+            fallbacks=[CommandHandler('cancel', self._interactive(self.start_command))],
+            conversation_timeout=self.config.SESSION_TTL
         )
 
         dp.add_handler(conv_handler)
         return updater
 
-    def run(self, stop_event=None):
+    def start_webhook(self, updater) -> bool:
+        """Register the webhook and start feeding its updates to the dispatcher"""
+        url = self.config.WEBHOOK_URL.rstrip('/') + self.config.WEBHOOK_PATH
+        try:
+            updater.bot.set_webhook(
+                url,
+                allowed_updates=self.ALLOWED_UPDATES,
+                drop_pending_updates=True,
+                api_kwargs={'secret_token': self.config.WEBHOOK_SECRET}
+            )
+        except telegram_error.TelegramError as e:
+            logger.error(f"Webhook indisponible, passage en mode polling : {e}")
+            return False
+
+        self.webhook_bridge = WebhookBridge(
+            updater.dispatcher,
+            self.config.WEBHOOK_SECRET,
+            maxsize=self.config.WEBHOOK_QUEUE_SIZE
+        )
+        self.webhook_bridge.start()
+        # start_polling() le ferait : nécessaire aux délais des conversations
+        updater.job_queue.start()
+        logger.info(f"Webhook actif sur {url}")
+        return True
+
+    def run(self, stop_event=None, webhook: bool = False):
         """Run bot with improved instance management"""
         retries = 0
         max_retries = 3
@@ -357,20 +1056,28 @@ class YouTubeAudioDownloaderBot:
                 return True
             return False
 
+        self._startup()
+
         while retries < max_retries and not (stop_event and stop_event.is_set()):
             try:
                 logger.info("🚀 Bot YouTube Audio démarré...")
                 updater = self.setup_bot()
+                if not self.job_queue:
+                    self.scheduler.start()
+                    self.playlist_scheduler.start()
 
-                # Nettoyage des mises à jour en attente
-                updater.start_polling(
-                    drop_pending_updates=True,
-                    timeout=30,
-                    bootstrap_retries=3,
-                    poll_interval=2.0,
-                    read_latency=4.0,
-                    allowed_updates=['message', 'callback_query']
-                )
+                # Webhook si configuré, sinon long polling
+                if not (webhook and self.config.WEBHOOK_URL and self.start_webhook(updater)):
+                    # Nettoyage des mises à jour en attente
+                    updater.start_polling(
+                        drop_pending_updates=True,
+                        timeout=30,
+                        bootstrap_retries=3,
+                        poll_interval=0.0,
+                        read_latency=4.0,
+                        allowed_updates=self.ALLOWED_UPDATES
+                    )
+                self._warm_up()
 
                 # Gestion propre de l'arrêt
                 if stop_event:
@@ -393,6 +1100,13 @@ class YouTubeAudioDownloaderBot:
                 raise
 
             finally:
+                if self.webhook_bridge:
+                    self.webhook_bridge.stop()
+                    self.webhook_bridge = None
+                self.scheduler.stop(wait=False)
+                self.playlist_scheduler.stop(wait=False)
+                self.db.flush()
+
                 # Nettoyage des fichiers temporaires
                 if hasattr(self, '_tmp_dir') and os.path.exists(self._tmp_dir):
                     try:
@@ -401,6 +1115,97 @@ class YouTubeAudioDownloaderBot:
                     except Exception as e:
                         logger.error(f"Erreur lors du nettoyage: {e}")
 
+        if self.speculative:
+            self.speculative.shutdown()
+        self.db.close()
+
+    def _startup(self):
+        """Startup phase: database schema, then leftovers of an interrupted run"""
+        self.db.initialize()
+        self._clean_startup_files()
+
+    def _warm_up(self):
+        """Load yt-dlp in the background once updates are being received"""
+        if not self.config.YDL_WARM_UP:
+            return
+
+        def warm_up():
+            try:
+                self.download_manager.warm_up()
+            except Exception as e:
+                logger.warning(f"Préchauffage de yt-dlp impossible : {e}")
+
+        threading.Thread(target=warm_up, name='ydl-warm-up', daemon=True).start()
+
+    def _clean_startup_files(self):
+        """Remove files of an interrupted run, then index the file cache"""
+        # Avec des workers, les fichiers récents peuvent appartenir à un autre processus
+        grace = self.config.PARTIAL_FILE_GRACE if self.job_queue else 0
+        self.download_manager.remove_partial_downloads(min_age=grace)
+        self.media_cache.rebuild(min_age=grace)
+
+    def run_worker(self, stop_event: threading.Event, threads: Optional[int] = None):
+        """Process jobs of the shared queue until stop_event is set (worker.py)"""
+        if not self.job_queue:
+            raise RuntimeError("JOB_QUEUE_URL is not configured")
+        threads = threads or self.config.WORKER_THREADS
+        # Pas de polling : le worker ne fait qu'appeler l'API pour envoyer et éditer
+        self.bot = self._create_bot(
+            Request(con_pool_size=threads + 4, connect_timeout=30, read_timeout=30)
+        )
+        self._startup()
+        self._warm_up()
+        owner = worker_id()
+        logger.info(f"Worker {owner} démarré ({threads} threads)")
+
+        def loop():
+            while not stop_event.is_set():
+                try:
+                    lease = self.job_queue.lease(owner, timeout=1)
+                except Exception as e:
+                    logger.error(f"File de tâches indisponible : {e}")
+                    stop_event.wait(5)
+                    continue
+                if lease is None:
+                    continue
+                playlist = 'playlist' in lease.job
+                if playlist and not self._playlist_slots.acquire(blocking=False):
+                    # Rendue sans tentative comptée ; un autre worker peut la prendre
+                    try:
+                        self.job_queue.release(lease, delay=self.PLAYLIST_RETRY_DELAY)
+                    except Exception as e:
+                        logger.error(f"Remise en file de la tâche {lease.job_id} impossible : {e}")
+                    continue
+                try:
+                    # execute_download signale ses erreurs à l'utilisateur lui-même
+                    with self.job_queue.keep_alive(lease):
+                        if playlist:
+                            self.execute_playlist(lease.job)
+                        else:
+                            self.execute_download(lease.job)
+                finally:
+                    if playlist:
+                        self._playlist_slots.release()
+                    try:
+                        self.job_queue.ack(lease)
+                    except Exception as e:
+                        logger.error(f"Acquittement de la tâche {lease.job_id} impossible : {e}")
+
+        workers = [
+            threading.Thread(target=loop, name=f'job-worker-{i}', daemon=True)
+            for i in range(threads)
+        ]
+        for thread in workers:
+            thread.start()
+        try:
+            for thread in workers:
+                thread.join()
+        finally:
+            self.db.flush()
+            self.db.close()
+            self.job_queue.close()
+            logger.info(f"Worker {owner} arrêté")
+
 if __name__ == "__main__":
     bot = YouTubeAudioDownloaderBot()
     bot.run()
\ No newline at end of file
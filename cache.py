@@ -1,48 +1,150 @@
+import re
 import time
+import threading
+from datetime import datetime
 from typing import Dict, Any, Optional, List
 from collections import OrderedDict
 
+_YOUTUBE_ID_RE = re.compile(
+    r'(?:youtube\.com/(?:watch\?(?:\S*&)?v=|shorts/|embed/|live/|v/)|youtu\.be/)'
+    r'([A-Za-z0-9_-]{11})'
+)
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a search query so equivalent queries share a cache entry"""
+    match = _YOUTUBE_ID_RE.search(query)
+    if match:
+        # Toutes les formes d'URL d'une même vidéo
+        return f"video:{match.group(1)}"
+    return ' '.join(query.split()).casefold()
+
+
 class Cache:
-    def __init__(self, max_size: int = 1000):
+    """Search results cache with TTL expiry and O(1) LRU eviction.
+
+    Empty results are cached too, but only for ``negative_ttl`` seconds.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 24 * 60 * 60,
+                 negative_ttl: float = 60):
         self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
         self._search_cache: OrderedDict = OrderedDict()
-        self._download_queue: Dict[int, List[str]] = {}
-        self._results_cache: Dict[str, List[Dict]] = {}
-        self._cache_timestamps: Dict[str, float] = {}
-        
+        self._lock = threading.Lock()
+
     def get_search_results(self, query: str) -> Optional[List[Dict]]:
         """Get cached search results"""
-        if query in self._results_cache:
-            # Check if cache is still valid
-            if time.time() - self._cache_timestamps[query] < 24 * 60 * 60:
-                return self._results_cache[query]
-            else:
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._search_cache.get(key)
+            if entry is not None:
+                expires_at, results = entry
+                if time.monotonic() < expires_at:
+                    self._search_cache.move_to_end(key)
+                    self.hits += 1
+                    return results
                 # Remove expired cache
-                del self._results_cache[query]
-                del self._cache_timestamps[query]
+                del self._search_cache[key]
+            self.misses += 1
         return None
 
     def set_search_results(self, query: str, results: List[Dict]):
         """Cache search results"""
-        self._results_cache[query] = results
-        self._cache_timestamps[query] = time.time()
-        
-        # Remove oldest entries if cache is too large
-        while len(self._results_cache) > self.max_size:
-            oldest_query = min(self._cache_timestamps, key=self._cache_timestamps.get)
-            del self._results_cache[oldest_query]
-            del self._cache_timestamps[oldest_query]
-
-    def add_to_download_queue(self, user_id: int, video_id: str) -> int:
-        """Add video to user's download queue"""
-        if user_id not in self._download_queue:
-            self._download_queue[user_id] = []
-            
-        self._download_queue[user_id].append(video_id)
-        return len(self._download_queue[user_id])
-
-    def get_next_download(self, user_id: int) -> Optional[str]:
-        """Get next video from user's download queue"""
-        if user_id in self._download_queue and self._download_queue[user_id]:
-            return self._download_queue[user_id].pop(0)
-        return None
+        key = normalize_query(query)
+        ttl = self.ttl if results else self.negative_ttl
+        with self._lock:
+            self._search_cache[key] = (time.monotonic() + ttl, results)
+            self._search_cache.move_to_end(key)
+
+            # Remove least recently used entries if cache is too large
+            while len(self._search_cache) > self.max_size:
+                self._search_cache.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit rate and size of the search cache"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'size': len(self._search_cache),
+                'max_size': self.max_size
+            }
+
+
+class FileIdCache:
+    """Reuse Telegram file_ids of already uploaded files.
+
+    Entries are persisted in the database and keyed by (video_id, format,
+    quality). They expire after ``max_age`` seconds, the least recently used
+    ones are pruned above ``max_size`` and an entry rejected by Telegram is
+    invalidated by the caller.
+    """
+
+    def __init__(self, db, max_size: int = 10000, max_age: float = 30 * 24 * 60 * 60,
+                 prune_every: int = 100):
+        self.db = db
+        self.max_size = max_size
+        self.max_age = max_age
+        self.prune_every = prune_every
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+
+    def get(self, video_id: str, format_type: str, quality: str) -> Optional[Dict[str, Any]]:
+        """Get cached file info, or None on miss"""
+        entry = self.db.get_telegram_file(video_id, format_type, quality)
+        if entry and self._is_expired(entry):
+            self.db.delete_telegram_file(video_id, format_type, quality)
+            entry = None
+
+        with self._lock:
+            if entry:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entry
+
+    def put(self, video_id: str, format_type: str, quality: str, file_id: str,
+            file_hash: str, file_size: float):
+        """Remember the file_id returned by an upload"""
+        self.db.save_telegram_file(
+            video_id, format_type, quality, file_id, file_hash, file_size
+        )
+        with self._lock:
+            self._puts += 1
+            should_prune = self._puts % self.prune_every == 0
+        if should_prune:
+            self.db.prune_telegram_files(self.max_size, self.max_age)
+
+    def invalidate(self, video_id: str, format_type: str, quality: str):
+        """Forget a file_id Telegram no longer accepts"""
+        self.db.delete_telegram_file(video_id, format_type, quality)
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+    def _is_expired(self, entry: Dict[str, Any]) -> bool:
+        created = entry.get('created_date')
+        if not created:
+            return False
+        if isinstance(created, str):
+            created = datetime.fromisoformat(created)
+        return (datetime.now() - created).total_seconds() > self.max_age
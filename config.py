@@ -1,25 +1,69 @@
 import os
-from dotenv import load_dotenv
+import secrets
+
+
+def _flag(name: str) -> bool:
+    return os.getenv(name, '').lower() in ('1', 'true', 'yes')
+
 
 class Config:
-    # Load environment variables
-    load_dotenv()
+    """Settings; environment-dependent ones are set by _read_environment().
+
+    Importing this module has no side effect. Config.load() is the startup
+    phase: it reads .env and creates the working directories.
+    """
 
-    # Bot configuration
-    TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '7315635157:AAGNDO3SIUsP8-09P3UljrKlU9avxrKnAcU')
-    ADMIN_ID = int(os.getenv('ADMIN_TELEGRAM_ID', 0))
+    _loaded = False
 
-    # Paths
-    BASE_DIR = os.getcwd()
-    DOWNLOAD_DIR = os.path.join(BASE_DIR, 'downloads')
-    DB_PATH = os.path.join(BASE_DIR, 'bot_database.sqlite')
+    # Webhook delivery (polling is used when WEBHOOK_URL is empty)
+    WEBHOOK_PATH = '/telegram/webhook'
+    WEBHOOK_QUEUE_SIZE = 256
 
-    # Limits
-    MAX_FILE_SIZE_MB = 50
+    # Durable job queue shared with worker processes (see JOB_QUEUE_URL)
+    JOB_LEASE_SECONDS = 60  # a job is redelivered when its worker stops heartbeating
+    JOB_MAX_ATTEMPTS = 3
+    PARTIAL_FILE_GRACE = 600  # leftovers younger than this may belong to another worker
+
+    # Limits (MAX_FILE_SIZE_MB depends on TELEGRAM_LOCAL_MODE)
+    CLOUD_API_MAX_FILE_SIZE_MB = 50
+    LOCAL_API_UPLOAD_TIMEOUT = 600  # the local server answers once Telegram has the file
     MAX_SEARCH_RESULTS = 5
-    RATE_LIMIT_SECONDS = 30
+    USER_SEARCHES_PER_MINUTE = 10
+    USER_SEARCH_BURST = 5
+    MAX_QUEUED_DOWNLOADS_PER_USER = 3
+    MAX_ACTIVE_PLAYLISTS = 2
+    PLAYLIST_CONCURRENCY = 3  # parallel downloads/transcodes per playlist
+    PLAYLIST_PAGE_SIZE = 10  # tracks listed per playlist page
+
+    # Download the MP3 of a selected video while the user picks the format (see
+    # SPECULATIVE_DOWNLOADS)
+    SPECULATIVE_MAX_ACTIVE = 2  # speculations running or waiting to be claimed
+    SPECULATIVE_TTL = 120  # seconds before an unclaimed speculation is dropped
+
+    # Conversation state (search results, selected video) per user
+    SESSION_TTL = 30 * 60  # seconds of inactivity
+    MAX_SESSIONS = 20000
+
+    # Progress message edits (Telegram allows ~30 messages/s, ~1/s per chat)
+    PROGRESS_EDITS_PER_SECOND = 10
+    PROGRESS_CHAT_INTERVAL = 3  # seconds between edits in one chat
+
+    # Outbound Bot API calls (flood limits: ~30 messages/s, ~1/s per chat)
+    TELEGRAM_MESSAGES_PER_SECOND = 25
+    TELEGRAM_CHAT_MESSAGES_PER_SECOND = 1
+    TELEGRAM_CHAT_BURST = 3
+    TELEGRAM_MAX_RETRY_AFTER = 10  # longer flood waits are not retried
+
+    # Pooled YoutubeDL instances (per option profile)
+    YDL_MAX_JOBS = 100  # recycle an instance after this many jobs
     CLEANUP_INTERVAL = 3600  # 1 hour
     MAX_CACHE_AGE = 24 * 60 * 60  # 24 hours
+    SEARCH_CACHE_SIZE = 1000
+    NEGATIVE_CACHE_TTL = 60  # empty search results
+
+    # Telegram file_id reuse cache
+    FILE_ID_CACHE_SIZE = 10000
+    FILE_ID_MAX_AGE = 30 * 24 * 60 * 60  # 30 days
 
     # Available formats
     FORMATS = {
@@ -31,6 +75,15 @@ class Config:
                 'preferredcodec': 'mp3',
             }]
         },
+        # Flux audio natif de YouTube : simple changement de conteneur si besoin
+        'audio': {
+            'ext': 'm4a',
+            'format': 'bestaudio[ext=m4a]/bestaudio[acodec=opus]/bestaudio/best',
+            'postprocessors': [{
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': 'webm>opus/mp4>m4a',  # copie du flux, sans réencodage
+            }]
+        },
         'mp4': {
             'ext': 'mp4',
             'format': 'best[height<=720]',
@@ -45,5 +98,80 @@ class Config:
         'high': '320'
     }
 
-    # Create required directories
-    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
\ No newline at end of file
+    @classmethod
+    def _read_environment(cls):
+        # Bot configuration
+        cls.TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '7315635157:AAGNDO3SIUsP8-09P3UljrKlU9avxrKnAcU')
+        cls.ADMIN_ID = int(os.getenv('ADMIN_TELEGRAM_ID', 0))
+        cls.TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL', 'https://api.telegram.org/bot')
+        cls.TELEGRAM_API_FILE_URL = os.getenv('TELEGRAM_API_FILE_URL', 'https://api.telegram.org/file/bot')
+
+        # Self-hosted Bot API server started with --local, sharing our file system:
+        # files are sent by path and may be much larger
+        cls.TELEGRAM_LOCAL_MODE = _flag('TELEGRAM_LOCAL_MODE')
+        cls.LOCAL_API_MAX_FILE_SIZE_MB = int(os.getenv('LOCAL_API_MAX_FILE_SIZE_MB', 2000))
+        cls.MAX_FILE_SIZE_MB = (
+            cls.LOCAL_API_MAX_FILE_SIZE_MB if cls.TELEGRAM_LOCAL_MODE
+            else cls.CLOUD_API_MAX_FILE_SIZE_MB
+        )
+
+        # One download per user every RATE_LIMIT_SECONDS, after a burst of USER_DOWNLOAD_BURST
+        cls.RATE_LIMIT_SECONDS = int(os.getenv('RATE_LIMIT_SECONDS', 30))
+        cls.USER_DOWNLOAD_BURST = int(os.getenv('USER_DOWNLOAD_BURST', 3))
+
+        # Webhook delivery
+        cls.WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+        cls.WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+
+        # Upload while downloading (download → FFmpeg → Telegram), the file is kept for the caches
+        cls.STREAMING_UPLOADS = _flag('STREAMING_UPLOADS')
+
+        # Durable job queue (empty: in-process workers)
+        # sqlite:///jobs.sqlite on one machine, redis://host:6379/0 across machines
+        cls.JOB_QUEUE_URL = os.getenv('JOB_QUEUE_URL', '')
+        cls.MAX_CONCURRENT_DOWNLOADS = int(os.getenv('MAX_CONCURRENT_DOWNLOADS', 2))
+        cls.WORKER_THREADS = int(os.getenv('WORKER_THREADS', cls.MAX_CONCURRENT_DOWNLOADS))
+        # Une instance 'playlist' de plus que de playlists actives pour parcourir les pages
+        cls.YDL_POOL_SIZE = max(cls.MAX_CONCURRENT_DOWNLOADS, cls.MAX_ACTIVE_PLAYLISTS) + 1
+        cls.SPECULATIVE_DOWNLOADS = _flag('SPECULATIVE_DOWNLOADS')
+
+        # Import yt-dlp in the background once the bot listens (0 to disable)
+        cls.YDL_WARM_UP = os.getenv('YDL_WARM_UP', '1').lower() in ('1', 'true', 'yes')
+
+        # Paths
+        cls.BASE_DIR = os.getcwd()
+        cls.DOWNLOAD_DIR = os.path.join(cls.BASE_DIR, 'downloads')
+        cls.DB_PATH = os.path.join(cls.BASE_DIR, 'bot_database.sqlite')
+
+        # On-disk cache of delivered files (content addressed, LRU above the quota)
+        cls.MEDIA_CACHE_DIR = os.path.join(cls.DOWNLOAD_DIR, 'cache')
+        cls.MEDIA_CACHE_MAX_MB = int(os.getenv('MEDIA_CACHE_MAX_MB', 2048))
+
+        # Hash of delivered files (any hashlib algorithm)
+        cls.HASH_ALGORITHM = os.getenv('HASH_ALGORITHM', 'blake2b')
+
+    @classmethod
+    def validate(cls):
+        """Reject settings that would break the invariants the components rely on"""
+        if cls.MAX_CONCURRENT_DOWNLOADS < 1 or cls.WORKER_THREADS < 1:
+            raise ValueError("MAX_CONCURRENT_DOWNLOADS and WORKER_THREADS must be at least 1")
+        if cls.RATE_LIMIT_SECONDS < 1 or cls.USER_DOWNLOAD_BURST < 1:
+            raise ValueError("RATE_LIMIT_SECONDS and USER_DOWNLOAD_BURST must be at least 1")
+
+    @classmethod
+    def load(cls):
+        """Startup phase: read .env, then create the working directories (once)"""
+        if cls._loaded:
+            return
+        from dotenv import load_dotenv
+
+        # .env ne remplace pas les variables déjà définies
+        load_dotenv()
+        cls._read_environment()
+        cls.validate()
+        os.makedirs(cls.DOWNLOAD_DIR, exist_ok=True)
+        cls._loaded = True
+
+
+# Valeurs de l'environnement courant, sans .env tant que load() n'a pas été appelé
+Config._read_environment()
\ No newline at end of file
@@ -1,15 +1,254 @@
 import sqlite3
+import logging
+import queue
+import threading
+import time
 from datetime import datetime
 from typing import Dict, Any, Optional, Tuple, List
 
+from config import Config
+from metrics import DB_SECONDS, timed
+
+logger = logging.getLogger(__name__)
+
+# Connection settings applied to every pooled connection
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA busy_timeout = 5000',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -8000',
+)
+
+_STOP = object()
+
+# Lot rejoué sur erreur transitoire (base verrouillée par un autre processus...)
+WRITE_ATTEMPTS = 3
+WRITE_RETRY_DELAY = 0.5  # seconds, doubled after each attempt
+
+# Schema migrations, applied in order; PRAGMA user_version stores how many ran
+MIGRATIONS = [
+    # 1: per-user aggregates maintained by triggers, plus lookup indexes
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            total_downloads INTEGER NOT NULL DEFAULT 0,
+            unique_videos INTEGER NOT NULL DEFAULT 0,
+            favorites_count INTEGER NOT NULL DEFAULT 0,
+            total_size REAL NOT NULL DEFAULT 0,
+            last_download_date DATETIME
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_downloads_user_video ON downloads(user_id, video_id)',
+        'CREATE INDEX IF NOT EXISTS idx_downloads_video ON downloads(video_id)',
+        'CREATE INDEX IF NOT EXISTS idx_favorites_user ON favorites(user_id)',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_downloads_stats AFTER INSERT ON downloads
+        BEGIN
+            INSERT INTO user_stats
+            (user_id, total_downloads, unique_videos, total_size, last_download_date)
+            VALUES (NEW.user_id, 1, 1, COALESCE(NEW.file_size, 0), NEW.download_date)
+            ON CONFLICT(user_id) DO UPDATE SET
+                total_downloads = total_downloads + 1,
+                unique_videos = unique_videos + NOT EXISTS (
+                    SELECT 1 FROM downloads
+                    WHERE user_id = NEW.user_id AND video_id = NEW.video_id
+                    AND id != NEW.id
+                ),
+                total_size = total_size + excluded.total_size,
+                last_download_date = excluded.last_download_date;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_favorites_insert_stats AFTER INSERT ON favorites
+        BEGIN
+            INSERT INTO user_stats (user_id, favorites_count) VALUES (NEW.user_id, 1)
+            ON CONFLICT(user_id) DO UPDATE SET favorites_count = favorites_count + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_favorites_delete_stats AFTER DELETE ON favorites
+        BEGIN
+            UPDATE user_stats SET favorites_count = MAX(favorites_count - 1, 0)
+            WHERE user_id = OLD.user_id;
+        END
+        ''',
+        # Backfill existing databases
+        '''
+        INSERT OR REPLACE INTO user_stats
+        (user_id, total_downloads, unique_videos, favorites_count, total_size,
+         last_download_date)
+        SELECT
+            u.user_id,
+            (SELECT COUNT(*) FROM downloads d WHERE d.user_id = u.user_id),
+            (SELECT COUNT(DISTINCT video_id) FROM downloads d WHERE d.user_id = u.user_id),
+            (SELECT COUNT(*) FROM favorites f WHERE f.user_id = u.user_id),
+            (SELECT COALESCE(SUM(file_size), 0) FROM downloads d WHERE d.user_id = u.user_id),
+            (SELECT MAX(download_date) FROM downloads d WHERE d.user_id = u.user_id)
+        FROM (
+            SELECT user_id FROM downloads UNION SELECT user_id FROM favorites
+        ) u
+        ''',
+    ],
+    # 2: tracks of a playlist already delivered to a chat, to resume playlists
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS playlist_items (
+            chat_id INTEGER,
+            playlist_id TEXT,
+            format TEXT,
+            video_id TEXT,
+            delivered_date DATETIME,
+            PRIMARY KEY (chat_id, playlist_id, format, video_id)
+        )
+        ''',
+    ],
+    # 3: index of the on-disk media cache
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS media_files (
+            video_id TEXT,
+            format TEXT,
+            quality TEXT,
+            file_hash TEXT NOT NULL,
+            path TEXT NOT NULL,
+            file_size INTEGER NOT NULL,
+            last_used_date DATETIME,
+            PRIMARY KEY (video_id, format, quality)
+        )
+        ''',
+    ],
+]
+
+
 class Database:
-    def __init__(self):
-        self.db_path = 'bot_database.sqlite'
+    """SQLite storage with one persistent WAL connection per thread.
+
+    Download logs are written behind: log_download() only queues the row and
+    a background writer commits queued rows in batches. Nothing touches the
+    file until initialize() creates the schema and starts the writer.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, batch_size: int = 100):
+        self.db_path = db_path or Config.DB_PATH
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._connections: Dict[threading.Thread, sqlite3.Connection] = {}
+        self._connections_lock = threading.Lock()
+        self._write_queue: queue.Queue = queue.Queue()
+        self._writer = threading.Thread(
+            target=self._writer_loop, name='db-writer', daemon=True
+        )
+
+    def initialize(self):
+        """Create or migrate the schema and start the background writer (once)"""
+        if self._writer.ident is not None:
+            return
         self._init_database()
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get the calling thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._close_dead_connections()
+                self._connections[threading.current_thread()] = conn
+        return conn
+
+    def _close_dead_connections(self):
+        # Threads éphémères (étages de playlist...) : une connexion chacun, fermée
+        # à la prochaine ouverture plutôt que gardée à vie
+        for thread in [t for t in self._connections if not t.is_alive()]:
+            try:
+                self._connections.pop(thread).close()
+            except sqlite3.Error as e:
+                logger.warning(f"Error closing connection of {thread.name}: {e}")
+
+    @property
+    def pending_writes(self) -> int:
+        """Writes queued for the background writer"""
+        return self._write_queue.qsize()
+
+    def flush(self):
+        """Wait until every queued write is committed"""
+        self._write_queue.join()
+
+    def close(self):
+        """Flush pending writes, stop the writer and close all connections"""
+        if self._writer.is_alive():
+            self._write_queue.put(_STOP)
+            self._writer.join()
+        with self._connections_lock:
+            for conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    def _writer_loop(self):
+        while True:
+            batch = [self._write_queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._write_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            writes = [item for item in batch if item is not _STOP]
+            try:
+                if writes:
+                    self._write_batch(writes)
+            except Exception as e:
+                # Le writer ne doit jamais s'arrêter : flush() l'attendrait indéfiniment
+                logger.error(f"Write-behind batch of {len(writes)} rows lost: {e}")
+            finally:
+                for _ in batch:
+                    self._write_queue.task_done()
+
+            if len(writes) < len(batch):
+                return
+
+    def _write_batch(self, writes: List[Tuple]):
+        """Commit writes in one transaction, else one by one so a bad row only loses itself"""
+        delay = WRITE_RETRY_DELAY
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            try:
+                self._commit(writes)
+                return
+            except sqlite3.OperationalError as e:
+                # Verrou, disque plein... : le lot entier peut passer plus tard
+                if attempt == WRITE_ATTEMPTS:
+                    logger.warning(f"Write-behind batch of {len(writes)} rows failed: {e}")
+                    break
+                time.sleep(delay)
+                delay *= 2
+            except Exception as e:
+                logger.warning(f"Write-behind batch of {len(writes)} rows failed: {e}")
+                break
+        if len(writes) == 1:
+            logger.error(f"Write-behind row dropped: {writes[0][0].__name__}")
+            return
+
+        for write in writes:
+            try:
+                self._commit([write])
+            except Exception as e:
+                logger.error(f"Write-behind row dropped ({write[0].__name__}): {e}")
+
+    def _commit(self, writes: List[Tuple]):
+        with DB_SECONDS.time(operation='write_batch'), self._connect() as conn:
+            cursor = conn.cursor()
+            for write, args in writes:
+                write(cursor, *args)
 
     def _init_database(self):
         """Initialize database with enhanced schema"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             # Users table with additional fields
@@ -53,66 +292,96 @@ class Database:
                 FOREIGN KEY (user_id) REFERENCES users(user_id)
             )
             ''')
-            
-            conn.commit()
 
-    def log_download(self, user_id: int, info: Dict[str, Any], file_hash: str,
-                    quality: str, file_size: float):
-        """Log download with enhanced information"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Update user stats
+            # Telegram file_id cache (one uploaded file per video/format/quality)
             cursor.execute('''
-            INSERT OR REPLACE INTO users 
-            (user_id, total_downloads, total_size, last_download_date)
-            VALUES (
-                ?,
-                COALESCE((SELECT total_downloads + 1 FROM users WHERE user_id = ?), 1),
-                COALESCE((SELECT total_size + ? FROM users WHERE user_id = ?), ?),
-                ?
+            CREATE TABLE IF NOT EXISTS telegram_files (
+                video_id TEXT,
+                format TEXT,
+                quality TEXT,
+                file_id TEXT NOT NULL,
+                file_hash TEXT,
+                file_size REAL,
+                created_date DATETIME,
+                last_used_date DATETIME,
+                PRIMARY KEY (video_id, format, quality)
             )
-            ''', (user_id, user_id, file_size, user_id, file_size, datetime.now()))
-            
-            # Log download
+            ''')
             cursor.execute('''
-            INSERT INTO downloads 
-            (user_id, video_id, title, download_date, file_hash, quality, file_size)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                user_id,
-                info.get('id', 'unknown'),
-                info.get('title', 'Unknown Title'),
-                datetime.now(),
-                file_hash,
-                quality,
-                file_size
-            ))
+            CREATE INDEX IF NOT EXISTS idx_telegram_files_last_used
+            ON telegram_files(last_used_date)
+            ''')
             
             conn.commit()
 
+        self._migrate()
+
+    def _migrate(self):
+        """Apply the schema migrations this database has not seen yet"""
+        conn = self._connect()
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            with conn:
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {number}')
+            logger.info(f"Database migrated to version {number}")
+
+    def log_download(self, user_id: int, info: Dict[str, Any], file_hash: str,
+                    quality: str, file_size: float):
+        """Queue a download log entry (committed by the background writer)"""
+        self._write_queue.put((self._write_download, (
+            user_id,
+            info.get('id', 'unknown'),
+            info.get('title', 'Unknown Title'),
+            datetime.now(),
+            file_hash,
+            quality,
+            file_size
+        )))
+
+    def _write_download(self, cursor: sqlite3.Cursor, user_id: int, video_id: str,
+                        title: str, download_date: datetime, file_hash: str,
+                        quality: str, file_size: float):
+        # Update user stats without touching the other user columns
+        cursor.execute('''
+        INSERT INTO users
+        (user_id, join_date, total_downloads, total_size, last_download_date)
+        VALUES (?, ?, 1, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            total_downloads = COALESCE(total_downloads, 0) + 1,
+            total_size = COALESCE(total_size, 0) + excluded.total_size,
+            last_download_date = excluded.last_download_date
+        ''', (user_id, download_date, file_size, download_date))
+
+        # Log download
+        cursor.execute('''
+        INSERT INTO downloads
+        (user_id, video_id, title, download_date, file_hash, quality, file_size)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, video_id, title, download_date, file_hash, quality, file_size))
+
+    @timed(DB_SECONDS, operation='get_user_stats')
     def get_user_stats(self, user_id: int) -> Optional[Tuple]:
-        """Get enhanced user statistics"""
-        with sqlite3.connect(self.db_path) as conn:
+        """Get user statistics from the incrementally maintained aggregates"""
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT 
+                SELECT
                     total_downloads,
                     last_download_date,
-                    COUNT(DISTINCT d.video_id) as unique_downloads,
-                    COUNT(f.id) as favorites_count,
+                    unique_videos,
+                    favorites_count,
                     total_size
-                FROM users u
-                LEFT JOIN downloads d ON u.user_id = d.user_id
-                LEFT JOIN favorites f ON u.user_id = f.user_id
-                WHERE u.user_id = ?
-                GROUP BY u.user_id
+                FROM user_stats
+                WHERE user_id = ?
             ''', (user_id,))
             return cursor.fetchone()
 
+    @timed(DB_SECONDS, operation='get_user_favorites')
     def get_user_favorites(self, user_id: int) -> List[Dict]:
         """Get user's favorite tracks"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT video_id, title, added_date
@@ -129,4 +398,184 @@ class Database:
                     'added_date': row[2]
                 })
                 
-            return favorites
\ No newline at end of file
+            return favorites
+
+    @timed(DB_SECONDS, operation='get_telegram_file')
+    def get_telegram_file(self, video_id: str, format_type: str,
+                          quality: str) -> Optional[Dict[str, Any]]:
+        """Get the cached Telegram file_id of an already uploaded file"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT file_id, file_hash, file_size, created_date
+                FROM telegram_files
+                WHERE video_id = ? AND format = ? AND quality = ?
+            ''', (video_id, format_type, quality))
+            row = cursor.fetchone()
+            if not row:
+                return None
+
+        self._write_queue.put((self._touch_telegram_file, (
+            datetime.now(), video_id, format_type, quality
+        )))
+        return {
+            'file_id': row[0],
+            'file_hash': row[1],
+            'file_size': row[2],
+            'created_date': row[3]
+        }
+
+    def _touch_telegram_file(self, cursor: sqlite3.Cursor, used_date: datetime,
+                             video_id: str, format_type: str, quality: str):
+        cursor.execute('''
+            UPDATE telegram_files SET last_used_date = ?
+            WHERE video_id = ? AND format = ? AND quality = ?
+        ''', (used_date, video_id, format_type, quality))
+
+    @timed(DB_SECONDS, operation='save_telegram_file')
+    def save_telegram_file(self, video_id: str, format_type: str, quality: str,
+                           file_id: str, file_hash: str, file_size: float):
+        """Store the Telegram file_id returned by an upload"""
+        now = datetime.now()
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+            INSERT INTO telegram_files
+            (video_id, format, quality, file_id, file_hash, file_size,
+             created_date, last_used_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(video_id, format, quality) DO UPDATE SET
+                file_id = excluded.file_id,
+                file_hash = excluded.file_hash,
+                file_size = excluded.file_size,
+                created_date = excluded.created_date,
+                last_used_date = excluded.last_used_date
+            ''', (video_id, format_type, quality, file_id, file_hash,
+                  file_size, now, now))
+            conn.commit()
+
+    @timed(DB_SECONDS, operation='delete_telegram_file')
+    def delete_telegram_file(self, video_id: str, format_type: str, quality: str):
+        """Invalidate a cached Telegram file_id"""
+        with self._connect() as conn:
+            conn.execute('''
+                DELETE FROM telegram_files
+                WHERE video_id = ? AND format = ? AND quality = ?
+            ''', (video_id, format_type, quality))
+            conn.commit()
+
+    @timed(DB_SECONDS, operation='prune_telegram_files')
+    def prune_telegram_files(self, max_entries: int, max_age: float) -> int:
+        """Drop expired entries, then the least recently used ones above max_entries"""
+        cutoff = datetime.fromtimestamp(datetime.now().timestamp() - max_age)
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'DELETE FROM telegram_files WHERE created_date < ?', (cutoff,)
+            )
+            removed = cursor.rowcount
+            cursor.execute('''
+                DELETE FROM telegram_files
+                WHERE rowid IN (
+                    SELECT rowid FROM telegram_files
+                    ORDER BY last_used_date DESC
+                    LIMIT -1 OFFSET ?
+                )
+            ''', (max_entries,))
+            removed += cursor.rowcount
+            conn.commit()
+            return removed
+
+    @timed(DB_SECONDS, operation='get_delivered_items')
+    def get_delivered_items(self, chat_id: int, playlist_id: str, format_type: str) -> set:
+        """Video ids of a playlist already delivered to a chat"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT video_id FROM playlist_items
+                WHERE chat_id = ? AND playlist_id = ? AND format = ?
+            ''', (chat_id, playlist_id, format_type))
+            return {row[0] for row in cursor.fetchall()}
+
+    def mark_item_delivered(self, chat_id: int, playlist_id: str, format_type: str,
+                            video_id: str):
+        """Queue a delivered playlist track (committed by the background writer)"""
+        self._write_queue.put((self._write_playlist_item, (
+            chat_id, playlist_id, format_type, video_id, datetime.now()
+        )))
+
+    def _write_playlist_item(self, cursor: sqlite3.Cursor, chat_id: int, playlist_id: str,
+                             format_type: str, video_id: str, delivered_date: datetime):
+        cursor.execute('''
+        INSERT INTO playlist_items
+        (chat_id, playlist_id, format, video_id, delivered_date)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(chat_id, playlist_id, format, video_id) DO NOTHING
+        ''', (chat_id, playlist_id, format_type, video_id, delivered_date))
+
+    @timed(DB_SECONDS, operation='get_media_files')
+    def get_media_files(self) -> List[Dict[str, Any]]:
+        """Index of the media cache, least recently used first"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT video_id, format, quality, file_hash, path, file_size
+                FROM media_files
+                ORDER BY last_used_date
+            ''')
+            return [
+                {
+                    'video_id': row[0],
+                    'format': row[1],
+                    'quality': row[2],
+                    'file_hash': row[3],
+                    'path': row[4],
+                    'file_size': row[5]
+                }
+                for row in cursor.fetchall()
+            ]
+
+    def save_media_file(self, video_id: str, format_type: str, quality: str,
+                        file_hash: str, path: str, file_size: int):
+        """Queue a media cache index entry (committed by the background writer)"""
+        self._write_queue.put((self._write_media_file, (
+            video_id, format_type, quality, file_hash, path, file_size, datetime.now()
+        )))
+
+    def _write_media_file(self, cursor: sqlite3.Cursor, video_id: str, format_type: str,
+                          quality: str, file_hash: str, path: str, file_size: int,
+                          used_date: datetime):
+        cursor.execute('''
+        INSERT INTO media_files
+        (video_id, format, quality, file_hash, path, file_size, last_used_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(video_id, format, quality) DO UPDATE SET
+            file_hash = excluded.file_hash,
+            path = excluded.path,
+            file_size = excluded.file_size,
+            last_used_date = excluded.last_used_date
+        ''', (video_id, format_type, quality, file_hash, path, file_size, used_date))
+
+    def touch_media_file(self, video_id: str, format_type: str, quality: str):
+        """Queue a last-used update of a media cache entry"""
+        self._write_queue.put((self._touch_media_file, (
+            datetime.now(), video_id, format_type, quality
+        )))
+
+    def _touch_media_file(self, cursor: sqlite3.Cursor, used_date: datetime,
+                          video_id: str, format_type: str, quality: str):
+        cursor.execute('''
+            UPDATE media_files SET last_used_date = ?
+            WHERE video_id = ? AND format = ? AND quality = ?
+        ''', (used_date, video_id, format_type, quality))
+
+    def delete_media_file(self, video_id: str, format_type: str, quality: str):
+        """Queue the removal of a media cache entry"""
+        self._write_queue.put((self._delete_media_file, (video_id, format_type, quality)))
+
+    def _delete_media_file(self, cursor: sqlite3.Cursor, video_id: str, format_type: str,
+                           quality: str):
+        cursor.execute('''
+            DELETE FROM media_files
+            WHERE video_id = ? AND format = ? AND quality = ?
+        ''', (video_id, format_type, quality))
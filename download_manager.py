@@ -1,16 +1,34 @@
+import copy
 import os
-import asyncio
-import hashlib
+import re
+import time
+import subprocess
+import tempfile
 import logging
-from typing import Dict, Any, Tuple, List
-from datetime import datetime, timedelta
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, Dict, Any, Iterator, Tuple, List, Optional
 
-from yt_dlp import YoutubeDL
 from config import Config
+from format_planner import FormatPlan, plan_format
+from metrics import TRANSFERRED_BYTES, observe_stage, track
+from singleflight import SingleFlight
+from streaming import LimitedStream, TeeStream, open_ffmpeg_stream, open_http_stream
+from ydl_pool import YoutubeDLPool
 
 logger = logging.getLogger(__name__)
 
+
+class DownloadCancelled(Exception):
+    """Raised by a progress callback to abort a download nobody else waits for"""
+
+
 class DownloadManager:
+    # Full metadata of resolved videos (stream URLs expire after a few hours)
+    RESOLVED_CACHE_SIZE = 128
+    RESOLVED_TTL = 60 * 60
+
     def __init__(self):
         self.config = Config()
         self.base_opts = {
@@ -23,109 +41,605 @@ class DownloadManager:
             'max_filesize': self.config.MAX_FILE_SIZE_MB * 1024 * 1024,
             'cookiefile': 'cookies.txt'  # Added this line to use the cookies file
         }
+        self._pool = YoutubeDLPool(
+            self._build_profiles(),
+            max_per_profile=self.config.YDL_POOL_SIZE,
+            max_jobs=self.config.YDL_MAX_JOBS,
+            # Levée par un hook de progression : rien d'anormal dans l'instance
+            expected_errors=(DownloadCancelled,)
+        )
+        self._inflight = SingleFlight()
+        self._listeners: Dict[tuple, List[Callable]] = {}
+        self._listeners_lock = threading.Lock()
+        self._local = threading.local()
+        self._file_refs: Dict[str, int] = {}
+        self._refs_lock = threading.Lock()
+        self._resolved: OrderedDict = OrderedDict()
+        self._resolved_lock = threading.Lock()
+        self._prefetch_executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix='metadata-prefetch'
+        )
+
+    def warm_up(self):
+        """Import yt-dlp and prepare the search and resolve instances ahead of the first request"""
+        with track('warm_up'):
+            for profile in ('search', 'resolve'):
+                self._pool.warm_up(profile, 'Youtube', 'YoutubeSearch', 'Generic')
+
+            from yt_dlp.extractor import gen_extractor_classes
+
+            # Le premier extract_info compile les motifs d'URL de ~1900 extracteurs
+            # (motifs mis en cache sur les classes, donc pour tout le processus)
+            for ie in gen_extractor_classes():
+                try:
+                    ie.suitable('https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+                except Exception:
+                    pass
 
     def search_video(self, query: str) -> List[Dict]:
-        """Search videos with enhanced metadata"""
-        with YoutubeDL(self.base_opts) as ydl:
-            try:
-                results = ydl.extract_info(
-                    f"ytsearch{self.config.MAX_SEARCH_RESULTS}:{query}",
-                    download=False
-                )
-                if results and 'entries' in results:
-                    return [{
-                        'id': entry['id'],
-                        'title': entry['title'],
-                        'duration': entry['duration'],
-                        'url': entry['webpage_url'],
-                        'thumbnail': entry.get('thumbnail'),
-                        'uploader': entry.get('uploader', 'Unknown'),
-                        'height': entry.get('height', 0),
-                        'filesize': entry.get('filesize', 0)
-                    } for entry in results['entries']]
-            except Exception as e:
-                logger.error(f"Search error: {str(e)}")
-                return []
-        return []
+        """Search videos using flat extraction.
+
+        Only the fields shown in the result list are returned; the full
+        metadata of a result is fetched on demand with resolve_video().
+        Extraction errors are raised, so that an empty list always means
+        that nothing matched.
+        """
+        if re.match(r'https?://', query.strip()):
+            target = query.strip()
+        else:
+            target = f"ytsearch{self.config.MAX_SEARCH_RESULTS}:{query}"
+
+        with track('search'), self._pool.acquire('search') as ydl:
+            results = ydl.extract_info(target, download=False)
+        if not results:
+            return []
+        if 'entries' not in results:
+            # Une URL de vidéo est résolue complètement
+            self._store_resolved(results)
+            return [self._summarize(results, resolved=True)]
+        return [
+            self._summarize(entry)
+            for entry in results['entries'] if entry
+        ]
+
+    def resolve_video(self, video: Dict) -> Dict:
+        """Fetch full metadata (duration, uploader, estimated size) of a search result"""
+        if video.get('resolved'):
+            return video
+        info, _ = self._inflight.do(
+            ('resolve', video['id']), self._resolve_info, video['id'], video['url']
+        )
+        return self._summarize(info, resolved=True)
+
+    def prefetch_video(self, video: Dict):
+        """Resolve a search result in the background"""
+        if video.get('resolved') or self._get_resolved(video['id']):
+            return
+        self._prefetch_executor.submit(self._prefetch, video)
+
+    def _prefetch(self, video: Dict):
+        try:
+            self.resolve_video(video)
+        except Exception as e:
+            logger.warning(f"Prefetch of {video['id']} failed: {e}")
+
+    def _resolve_info(self, video_id: str, url: str) -> Dict:
+        info = self._get_resolved(video_id)
+        if info is None:
+            with track('resolve'), self._pool.acquire('resolve') as ydl:
+                info = ydl.extract_info(url, download=False)
+            self._store_resolved(info)
+        return info
+
+    def _get_resolved(self, video_id: str) -> Optional[Dict]:
+        with self._resolved_lock:
+            entry = self._resolved.get(video_id)
+            if entry is None:
+                return None
+            resolved_at, info = entry
+            if time.monotonic() - resolved_at > self.RESOLVED_TTL:
+                del self._resolved[video_id]
+                return None
+            self._resolved.move_to_end(video_id)
+            return info
+
+    def _store_resolved(self, info: Dict):
+        with self._resolved_lock:
+            self._resolved[info['id']] = (time.monotonic(), info)
+            self._resolved.move_to_end(info['id'])
+            while len(self._resolved) > self.RESOLVED_CACHE_SIZE:
+                self._resolved.popitem(last=False)
+
+    def _summarize(self, entry: Dict, resolved: bool = False) -> Dict:
+        return {
+            'id': entry['id'],
+            'title': entry.get('title') or entry['id'],
+            'duration': entry.get('duration') or 0,
+            'url': entry.get('webpage_url') or entry.get('url'),
+            'thumbnail': entry.get('thumbnail'),
+            'uploader': entry.get('uploader') or entry.get('channel') or 'Unknown',
+            'height': entry.get('height') or 0,
+            'filesize': self._estimate_filesize(entry) if resolved else 0,
+            'resolved': resolved
+        }
+
+    @staticmethod
+    def _media_info(info: Dict) -> Dict:
+        """Fields used after a download, instead of the whole yt-dlp info (formats...)"""
+        return {
+            'id': info['id'],
+            'title': info.get('title') or info['id'],
+            'duration': info.get('duration') or 0,
+            'uploader': info.get('uploader') or info.get('channel') or 'Unknown'
+        }
+
+    @staticmethod
+    def _estimate_filesize(info: Dict) -> int:
+        formats = info.get('requested_formats') or [info]
+        return sum(
+            f.get('filesize') or f.get('filesize_approx') or 0 for f in formats
+        )
 
     def process_playlist(self, url: str) -> List[Dict]:
         """Process YouTube playlist"""
-        ydl_opts = dict(self.base_opts)
-        ydl_opts['noplaylist'] = False
+        try:
+            return list(self.iter_playlist(url))
+        except Exception as e:
+            logger.error(f"Playlist error: {str(e)}")
+            return []
+
+    def get_playlist_page(self, url: str, page: int = 0,
+                          page_size: Optional[int] = None) -> Dict:
+        """One window of a playlist: title, known track count and flat entries.
 
-        with YoutubeDL(ydl_opts) as ydl:
+        Only the pages of the playlist up to the requested window are fetched,
+        so the first page of a channel with thousands of uploads comes back as
+        fast as a short playlist.
+        """
+        page_size = page_size or self.config.PLAYLIST_PAGE_SIZE
+        start = page * page_size + 1
+        with self._pool.acquire('playlist') as ydl:
+            # Une entrée de plus pour savoir s'il reste une page
+            ydl.params['playlist_items'] = f"{start}:{start + page_size}"
             try:
                 results = ydl.extract_info(url, download=False)
-                if results and 'entries' in results:
-                    return [{
-                        'id': entry['id'],
-                        'title': entry['title'],
-                        'duration': entry['duration'],
-                        'url': entry['webpage_url'],
-                        'uploader': entry.get('uploader', 'Unknown')
-                    } for entry in results['entries']]
-            except Exception as e:
-                logger.error(f"Playlist error: {str(e)}")
-                return []
-        return []
-
-    def download_media(self, url: str, format_type: str = 'mp3', quality: str = 'medium') -> Tuple[str, Dict, float]:
-        """Download media in specified format"""
-        format_config = self.config.FORMATS[format_type].copy()
-        ydl_opts = dict(self.base_opts)
-
-        # Add format specific options
-        ydl_opts.update({
-            'format': format_config['format'],
-            'postprocessors': format_config['postprocessors']
-        })
-
-        # Add quality for MP3
-        if format_type == 'mp3':
-            ydl_opts['postprocessors'][0]['preferredquality'] = self.config.AUDIO_QUALITIES[quality]
+            finally:
+                ydl.params.pop('playlist_items', None)
+
+        entries = [self._summarize(entry) for entry in results.get('entries') or [] if entry]
+        return {
+            'id': results.get('id') or url,
+            'title': results.get('title') or 'Playlist',
+            'count': results.get('playlist_count'),
+            'page': page,
+            'entries': entries[:page_size],
+            'has_more': len(entries) > page_size
+        }
+
+    def iter_playlist(self, url: str) -> Iterator[Dict]:
+        """Yield the flat entries of a playlist as its pages are fetched.
+
+        The pooled instance stays checked out until the generator is exhausted
+        or closed; YDL_POOL_SIZE is derived above MAX_ACTIVE_PLAYLISTS so that
+        browsing pages is never starved by running playlists.
+        """
+        with self._pool.acquire('playlist') as ydl:
+            results = ydl.extract_info(url, download=False, process=False)
+            # Une chaîne redirige vers son onglet de vidéos
+            for _ in range(3):
+                if not results or results.get('_type') not in ('url', 'url_transparent'):
+                    break
+                results = ydl.extract_info(results['url'], download=False, process=False)
+            for entry in (results or {}).get('entries') or []:
+                if entry and entry.get('id'):
+                    yield self._summarize(entry)
+
+    def download_source(self, url: str, quality: str = 'medium',
+                        video_id: Optional[str] = None) -> Tuple[str, Dict, str]:
+        """Download the best audio stream as is, leaving the transcode to the caller.
+
+        Returns the stream path, its info and the MP3 quality that fits the
+        size limit, which may be lower than the requested one. Like
+        download_media(), requests for the same stream share one download and
+        each caller must release() the stream.
+        """
+        info = self._fetch_info(url, video_id)
+        plan = self._plan(info, 'mp3', quality)
+        key = (info['id'], 'source', plan.format_id)
+        result, shared = self._inflight.do(
+            key, self._download_source, info, plan, on_done=self._acquire_file
+        )
+        if shared:
+            logger.info(f"Source download of {info['id']} shared with an in-flight request")
+        return result
 
+    def _download_source(self, info: Dict, plan: FormatPlan) -> Tuple[str, Dict, str]:
+        info = self._download_planned(info, 'audio-source', plan)
+        return self._output_path(info), self._media_info(info), plan.quality
+
+    def transcode_audio(self, source_path: str, quality: str = 'medium') -> Tuple[str, float]:
+        """Encode a downloaded stream to MP3 with FFmpeg.
+
+        The source is left to the caller, who may share it; the MP3 gets a
+        path of its own.
+        """
+        bitrate = self.config.AUDIO_QUALITIES[quality]
+        base = os.path.splitext(os.path.basename(source_path))[0]
+        fd, output_path = tempfile.mkstemp(
+            suffix=f".{bitrate}k.mp3", prefix=f"{base}.", dir=os.path.dirname(source_path)
+        )
+        os.close(fd)
         try:
-            with YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
-                file_path = ydl.prepare_filename(info)
+            with track('transcode'):
+                subprocess.run(
+                    ['ffmpeg', '-y', '-loglevel', 'error', '-i', source_path,
+                     '-vn', '-codec:a', 'libmp3lame', '-b:a', f'{bitrate}k', output_path],
+                    check=True, capture_output=True
+                )
+        except BaseException as e:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            if isinstance(e, subprocess.CalledProcessError):
+                raise RuntimeError(f"FFmpeg error: {e.stderr.decode(errors='replace').strip()}")
+            raise
+        return output_path, self._check_size(output_path)
 
-                # Adjust extension based on format
-                if format_type == 'mp3':
-                    file_path = file_path.replace('.webm', '.mp3').replace('.m4a', '.mp3')
-                elif format_type == 'mp4':
-                    file_path = file_path.replace('.webm', '.mp4')
+    def download_media(self, url: str, format_type: str = 'mp3', quality: str = 'medium',
+                       video_id: Optional[str] = None,
+                       progress_callback: Optional[Callable] = None) -> Tuple[str, Dict, float]:
+        """Download media in specified format.
 
-                file_size = os.path.getsize(file_path) / (1024 * 1024)  # Convert to MB
+        Concurrent requests for the same video, format and quality share a
+        single download. Every caller gets a reference on the resulting file
+        and must hand it back with release() once done with it.
 
-                # Vérifier la taille du fichier
-                if file_size > self.config.MAX_FILE_SIZE_MB:
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                    raise ValueError(f"Le fichier est trop volumineux ({file_size:.1f}MB > {self.config.MAX_FILE_SIZE_MB}MB)")
+        ``progress_callback(phase, percent)`` receives the 'download' and
+        'transcode' progress of the (possibly shared) download.
+        """
+        key = (video_id or url, format_type, quality)
+        return self._share(
+            key, progress_callback, self._download_media, url, format_type, quality, key
+        )
 
-                return file_path, info, file_size
+    def stream_media(self, url: str, consume: Callable[[BinaryIO, Dict, str], Any],
+                     format_type: str = 'mp3', quality: str = 'medium',
+                     video_id: Optional[str] = None,
+                     progress_callback: Optional[Callable] = None
+                     ) -> Tuple[Tuple[str, Dict, float], Any]:
+        """Like download_media(), but pipe the media into consume() as it arrives.
 
-        except Exception as e:
+        ``consume(stream, info, filename)`` runs when this call leads the
+        download and the planned format is a direct stream (see open_stream).
+        The stream is written to a file at the same time, so requests for the
+        same key share it exactly as with download_media() and the caller
+        gets a reference on it too. Returns the download_media() result and
+        what consume() returned, or None when it did not run: the caller then
+        uses the file. If consume() fails, the error is raised once the file
+        is complete for the other callers, and the reference is released.
+        """
+        key = (video_id or url, format_type, quality)
+        outcome: Dict[str, Any] = {}
+        result = self._share(
+            key, progress_callback, self._stream_media, url, format_type, quality, key,
+            consume, outcome
+        )
+        if 'error' in outcome:
+            self.release(result[0])
+            raise outcome['error']
+        return result, outcome.get('consumed')
+
+    def _share(self, key: tuple, progress_callback: Optional[Callable], fn: Callable,
+               *args: Any) -> Tuple[str, Dict, float]:
+        """Run a download once for all concurrent callers of key, with their listeners"""
+        if progress_callback:
+            with self._listeners_lock:
+                self._listeners.setdefault(key, []).append(progress_callback)
+        try:
+            result, shared = self._inflight.do(key, fn, *args, on_done=self._acquire_file)
+        finally:
+            if progress_callback:
+                with self._listeners_lock:
+                    listeners = self._listeners[key]
+                    listeners.remove(progress_callback)
+                    if not listeners:
+                        del self._listeners[key]
+        if shared:
+            logger.info(f"Download of {key[0]} shared with an in-flight request")
+        return result
+
+    def open_stream(self, url: str, format_type: str = 'mp3', quality: str = 'medium',
+                    video_id: Optional[str] = None,
+                    progress_callback: Optional[Callable] = None
+                    ) -> Optional[Tuple[LimitedStream, Dict, str]]:
+        """Open the planned format as a byte stream, without writing any file.
+
+        MP3 is encoded by FFmpeg on the fly, native audio and MP4 are passed on
+        as served (Opus is only remuxed to Ogg). Reading past MAX_FILE_SIZE_MB
+        raises SizeLimitExceeded. Returns None when the planned format is not
+        a single direct HTTP stream, the caller then downloads to a file.
+
+        ``progress_callback('download', percent)`` is called as the stream is
+        read, with the percentage of the expected size (None if unknown).
+        """
+        info = self._fetch_info(url, video_id)
+        plan = self._plan(info, format_type, quality)
+        fmt = next(
+            (f for f in info.get('formats') or [] if f.get('format_id') == plan.format_id),
+            None
+        )
+        if not fmt or fmt.get('protocol') not in ('http', 'https'):
+            return None
+
+        headers = fmt.get('http_headers') or {}
+        expected = fmt.get('filesize') or fmt.get('filesize_approx') or 0
+        if format_type == 'mp3':
+            bitrate = self.config.AUDIO_QUALITIES[plan.quality]
+            stream = open_ffmpeg_stream(
+                fmt['url'], headers, ['-codec:a', 'libmp3lame', '-b:a', f'{bitrate}k', '-f', 'mp3']
+            )
+            ext = 'mp3'
+            expected = (info.get('duration') or 0) * bitrate * 1000 / 8
+        elif format_type == 'audio' and fmt.get('ext') != 'm4a':
+            stream = open_ffmpeg_stream(fmt['url'], headers, ['-codec:a', 'copy', '-f', 'ogg'])
+            ext = 'ogg'
+        else:
+            stream = open_http_stream(fmt['url'], headers)
+            ext = fmt.get('ext') or format_type
+
+        def on_read(bytes_read):
+            percent = min(bytes_read * 100 / expected, 100) if expected else None
+            progress_callback('download', percent)
+
+        limited = LimitedStream(
+            stream, self.config.MAX_FILE_SIZE_MB * 1024 * 1024,
+            on_read if progress_callback else None
+        )
+        return limited, self._media_info(info), f"{info['id']}.{ext}"
+
+    def _stream_media(self, url: str, format_type: str, quality: str, key: tuple,
+                      consume: Callable, outcome: Dict[str, Any]) -> Tuple[str, Dict, float]:
+        video_id = key[0] if key[0] != url else None
+        # Progression du flux transmise aux appelants qui attendent la même clé
+        self._local.key = key
+        try:
+            opened = self.open_stream(
+                url, format_type, quality, video_id, progress_callback=self._notify
+            )
+            if opened is not None:
+                return self._tee(opened, format_type, quality, consume, outcome)
+        finally:
+            self._local.key = None
+        # Pas un flux direct : téléchargement dans un fichier, partagé de la même façon
+        return self._download_media(url, format_type, quality, key)
+
+    def _tee(self, opened: Tuple[LimitedStream, Dict, str], format_type: str, quality: str,
+             consume: Callable, outcome: Dict[str, Any]) -> Tuple[str, Dict, float]:
+        """Feed a stream to consume() while writing it to a file of its own"""
+        stream, info, filename = opened
+        base, ext = os.path.splitext(filename)
+        file_path = os.path.join(
+            self.config.DOWNLOAD_DIR, f"{base}.stream-{format_type}-{quality}.{os.getpid()}{ext}"
+        )
+        try:
+            with track('stream'), open(file_path, 'wb') as sink:
+                tee = TeeStream(stream, sink)
+                try:
+                    outcome['consumed'] = consume(tee, info, filename)
+                except Exception as e:
+                    # Erreur de la source : relue ci-dessous ; sinon le fichier sert aux autres
+                    outcome['error'] = e
+                for _ in iter(tee.read, b''):
+                    pass
+        except BaseException as e:
             if os.path.exists(file_path):
                 os.remove(file_path)
-            logger.error(f"Erreur de téléchargement : {str(e)}")
+            if isinstance(e, DownloadCancelled):
+                logger.info(f"Stream of {info['id']} cancelled")
+            else:
+                logger.error(f"Erreur de téléchargement : {str(e)}")
             raise
+        finally:
+            stream.close()
+        TRANSFERRED_BYTES.inc(stream.bytes_read, direction='download')
+        return file_path, info, stream.bytes_read / (1024 * 1024)
+
+    def release(self, file_path: str):
+        """Drop a reference on a downloaded file, deleting it with the last one"""
+        with self._refs_lock:
+            refs = self._file_refs.get(file_path, 1) - 1
+            if refs > 0:
+                self._file_refs[file_path] = refs
+                return
+            self._file_refs.pop(file_path, None)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+    def _acquire_file(self, result: Tuple[str, Dict, float], callers: int):
+        with self._refs_lock:
+            file_path = result[0]
+            self._file_refs[file_path] = self._file_refs.get(file_path, 0) + callers
 
-    def _calculate_file_hash(self, file_path: str) -> str:
-        """Calculate file hash for deduplication"""
-        hash_md5 = hashlib.md5()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+    def _download_media(self, url: str, format_type: str, quality: str,
+                        key: Optional[tuple] = None) -> Tuple[str, Dict, float]:
+        file_path = None
+        # Les hooks yt-dlp s'exécutent dans ce thread
+        self._local.key = key
 
-    async def cleanup_old_files(self):
-        """Clean up old temporary files"""
         try:
-            cutoff_time = datetime.now() - timedelta(hours=1)
-            for filename in os.listdir(self.config.DOWNLOAD_DIR):
-                file_path = os.path.join(self.config.DOWNLOAD_DIR, filename)
-                if os.path.getctime(file_path) < cutoff_time.timestamp():
-                    os.remove(file_path)
+            video_id = key[0] if key and key[0] != url else None
+            info = self._fetch_info(url, video_id)
+            plan = self._plan(info, format_type, quality)
+            info = self._download_planned(
+                info, self._download_profile(format_type, plan.quality), plan
+            )
+            file_path = self._output_path(info)
+            file_size = self._check_size(file_path)
+            return file_path, self._media_info(info), file_size
+
         except Exception as e:
-            logger.error(f"Cleanup error: {str(e)}")
\ No newline at end of file
+            # Fichier final ou fragment .part d'un téléchargement interrompu
+            for path in (file_path, getattr(self._local, 'partial', None)):
+                if path and os.path.exists(path):
+                    os.remove(path)
+            if isinstance(e, DownloadCancelled):
+                logger.info(f"Download of {key[0] if key else url} cancelled")
+            else:
+                logger.error(f"Erreur de téléchargement : {str(e)}")
+            raise
+
+        finally:
+            self._local.key = None
+            self._local.partial = None
+
+    def _fetch_info(self, url: str, video_id: Optional[str] = None) -> Dict:
+        """Full metadata of a video, shared with resolve_video() and its cache"""
+        if video_id is None:
+            return self._resolve_info(None, url)
+        info, _ = self._inflight.do(('resolve', video_id), self._resolve_info, video_id, url)
+        return info
+
+    def _plan(self, info: Dict, format_type: str, quality: str) -> FormatPlan:
+        """Choose the format to download, rejecting videos that cannot fit"""
+        plan = plan_format(
+            info, format_type, quality, self.config.AUDIO_QUALITIES,
+            self.config.MAX_FILE_SIZE_MB * 1024 * 1024
+        )
+        logger.info(f"Planned {info.get('id')} as {format_type}: {plan}")
+        return plan
+
+    def _download_planned(self, info: Dict, profile: str, plan: FormatPlan) -> Dict:
+        """Download already extracted metadata with the planned format"""
+        start = time.perf_counter()
+        self._local.fetched_at = None
+        with track('download'), self._pool.acquire(profile) as ydl:
+            # yt-dlp compile le sélecteur de format une seule fois, dans __init__ :
+            # modifier params['format'] ne suffit pas
+            default_format, default_selector = ydl.params.get('format'), ydl.format_selector
+            ydl.params['format'] = plan.format_id
+            ydl.format_selector = ydl.build_format_selector(plan.format_id)
+            try:
+                # Les métadonnées en cache ne doivent pas être modifiées
+                info = ydl.process_ie_result(copy.deepcopy(info), download=True)
+            finally:
+                ydl.params['format'], ydl.format_selector = default_format, default_selector
+
+        # Réseau jusqu'à la fin du téléchargement, post-traitement ensuite
+        end = time.perf_counter()
+        fetched_at = self._local.fetched_at or end
+        observe_stage('fetch', fetched_at - start)
+        observe_stage('postprocess', end - fetched_at)
+        return info
+
+    @staticmethod
+    def _output_path(info: Dict) -> str:
+        """Final path of a download, after the postprocessors renamed it"""
+        downloads = info.get('requested_downloads') or [{}]
+        file_path = downloads[0].get('filepath') or info.get('filepath')
+        if not file_path or not os.path.exists(file_path):
+            raise RuntimeError(f"Fichier téléchargé introuvable pour {info.get('id')}")
+        return file_path
+
+    def _check_size(self, file_path: str) -> float:
+        """Size in MB, deleting the file if Telegram would refuse it"""
+        with track('size_check'):
+            file_size = os.path.getsize(file_path) / (1024 * 1024)  # Convert to MB
+
+            # Vérifier la taille du fichier
+            if file_size > self.config.MAX_FILE_SIZE_MB:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                raise ValueError(f"Le fichier est trop volumineux ({file_size:.1f}MB > {self.config.MAX_FILE_SIZE_MB}MB)")
+        return file_size
+
+    def _on_progress(self, d: Dict[str, Any]):
+        """yt-dlp progress hook"""
+        if d.get('status') == 'finished':
+            self._local.fetched_at = time.perf_counter()
+            TRANSFERRED_BYTES.inc(
+                d.get('total_bytes') or d.get('downloaded_bytes') or 0, direction='download'
+            )
+            return
+        if d.get('status') != 'downloading':
+            return
+        self._local.partial = d.get('tmpfilename')
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        percent = d.get('downloaded_bytes', 0) * 100 / total if total else None
+        self._notify('download', percent)
+
+    def _on_postprocess(self, d: Dict[str, Any]):
+        """yt-dlp postprocessor hook"""
+        if d.get('status') == 'started' and d.get('postprocessor') != 'MoveFiles':
+            self._notify('transcode')
+
+    def _notify(self, phase: str, percent: Optional[float] = None):
+        key = getattr(self._local, 'key', None)
+        with self._listeners_lock:
+            listeners = list(self._listeners.get(key, ()))
+        for callback in listeners:
+            try:
+                callback(phase, percent)
+            except DownloadCancelled:
+                # Abandon seulement si personne d'autre n'attend ce téléchargement
+                if self._inflight.callers(key) <= 1:
+                    raise
+            except Exception as e:
+                logger.warning(f"Progress callback error: {e}")
+
+    def _build_profiles(self) -> Dict[str, Dict[str, Any]]:
+        """yt-dlp options of each pooled instance profile"""
+        profiles = {
+            'search': dict(self.base_opts, extract_flat='in_playlist'),
+            'resolve': dict(self.base_opts),
+            'playlist': dict(self.base_opts, noplaylist=False, extract_flat='in_playlist'),
+            'audio-source': dict(
+                self.base_opts,
+                format=self.config.FORMATS['mp3']['format'],
+                outtmpl=self._outtmpl('source-%(format_id)s')
+            )
+        }
+        for format_type, format_config in self.config.FORMATS.items():
+            qualities = self.config.AUDIO_QUALITIES if format_type == 'mp3' else {'medium': None}
+            for quality, bitrate in qualities.items():
+                postprocessors = [dict(pp) for pp in format_config['postprocessors']]
+                if bitrate:
+                    postprocessors[0]['preferredquality'] = bitrate
+                profile = self._download_profile(format_type, quality)
+                profiles[profile] = dict(
+                    self.base_opts,
+                    # Un fichier par profil : l'extraction MP3 supprime sa source,
+                    # qui ne doit pas être le .m4a d'un envoi en audio natif
+                    outtmpl=self._outtmpl(profile),
+                    format=format_config['format'],
+                    postprocessors=postprocessors,
+                    progress_hooks=[self._on_progress],
+                    postprocessor_hooks=[self._on_postprocess]
+                )
+        return profiles
+
+    def _outtmpl(self, profile: str) -> str:
+        # SingleFlight et les références ne valent que dans ce processus : les workers
+        # qui partagent DOWNLOAD_DIR écrivent chacun leurs propres fichiers
+        return os.path.join(self.config.DOWNLOAD_DIR, f'%(id)s.{profile}.{os.getpid()}.%(ext)s')
+
+    @staticmethod
+    def _download_profile(format_type: str, quality: str) -> str:
+        return f"{format_type}-{quality}" if format_type == 'mp3' else format_type
+
+    def remove_partial_downloads(self, min_age: float = 0):
+        """Delete files left in the download directory by an interrupted run
+
+        Files changed less than min_age seconds ago are kept: with worker
+        processes sharing the directory they may still be in use.
+        """
+        now = time.time()
+        for entry in os.scandir(self.config.DOWNLOAD_DIR):
+            # Le cache de fichiers est dans un sous-répertoire
+            if entry.is_file():
+                # ctime : yt-dlp recale mtime sur la date de publication
+                stat = entry.stat()
+                if now - max(stat.st_mtime, stat.st_ctime) < min_age:
+                    continue
+                try:
+                    os.remove(entry.path)
+                except OSError as e:
+                    logger.error(f"Cleanup error: {str(e)}")
@@ -0,0 +1,131 @@
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Marge pour les en-têtes, tags ID3 et approximations de débit
+SIZE_MARGIN = 1.05
+
+
+class FormatPlan:
+    """Format and quality chosen for a download, with its predicted size"""
+
+    __slots__ = ('format_id', 'quality', 'estimated_bytes')
+
+    def __init__(self, format_id: str, quality: str, estimated_bytes: Optional[int]):
+        self.format_id = format_id
+        self.quality = quality
+        self.estimated_bytes = estimated_bytes
+
+    def __repr__(self):
+        return f"FormatPlan({self.format_id!r}, {self.quality!r}, {self.estimated_bytes})"
+
+
+def estimate_format_size(fmt: Dict[str, Any], duration: Optional[float]) -> Optional[int]:
+    """Size of a format in bytes from its filesize, approximation or bitrate"""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return int(size)
+    if fmt.get('tbr') and duration:
+        return int(fmt['tbr'] * 1000 / 8 * duration)
+    return None
+
+
+def estimate_mp3_size(bitrate: str, duration: Optional[float]) -> Optional[int]:
+    """Size of an MP3 encoded at bitrate (kbps) for duration seconds"""
+    if not duration:
+        return None
+    return int(int(bitrate) * 1000 / 8 * duration)
+
+
+def plan_format(info: Dict[str, Any], format_type: str, quality: str,
+                qualities: Dict[str, str], max_bytes: int) -> FormatPlan:
+    """Pick the best format (and MP3 quality) whose predicted size fits max_bytes.
+
+    For MP3 the requested quality is lowered when the encoded file would be
+    too large. Formats of unknown size are only used when no format of known
+    size fits. Raises ValueError when nothing can fit.
+    """
+    duration = info.get('duration')
+    if format_type == 'mp3':
+        candidates = _audio_formats(info)
+        bitrates = _qualities_down_from(qualities, quality)
+    elif format_type == 'audio':
+        candidates = _audio_formats(info, native=True)
+        bitrates = [(quality, None)]
+    else:
+        candidates = _video_formats(info)
+        bitrates = [(quality, None)]
+
+    if not candidates:
+        raise ValueError("Aucun format disponible pour cette vidéo")
+
+    smallest = None
+    for plan_quality, bitrate in bitrates:
+        output = estimate_mp3_size(bitrate, duration) if bitrate else None
+        if output is not None and output * SIZE_MARGIN > max_bytes:
+            smallest = output if smallest is None else min(smallest, output)
+            continue
+
+        unknown = None
+        for fmt in candidates:
+            size = estimate_format_size(fmt, duration)
+            if size is None:
+                unknown = unknown or fmt
+                continue
+            if size * SIZE_MARGIN <= max_bytes:
+                if plan_quality != quality:
+                    logger.info(f"Quality lowered from {quality} to {plan_quality} to fit the size limit")
+                return FormatPlan(fmt['format_id'], plan_quality, output or size)
+            smallest = size if smallest is None else min(smallest, size)
+
+        if unknown is not None:
+            # Taille inconnue : max_filesize et la vérification finale restent en place
+            return FormatPlan(unknown['format_id'], plan_quality, output)
+
+    raise ValueError(
+        f"Le fichier serait trop volumineux (~{smallest / (1024 * 1024):.1f}MB > "
+        f"{max_bytes // (1024 * 1024)}MB)"
+    )
+
+
+def _audio_formats(info: Dict[str, Any], native: bool = False) -> List[Dict[str, Any]]:
+    """Audio-only formats, best first (or muxed formats when there are none).
+
+    With ``native``, AAC streams come first since Telegram plays them as is.
+    """
+    formats = [
+        f for f in info.get('formats') or [info]
+        if f.get('format_id') and f.get('acodec') != 'none'
+    ]
+    audio_only = [f for f in formats if f.get('vcodec') == 'none']
+    return sorted(
+        audio_only or formats,
+        key=lambda f: (
+            native and f.get('ext') == 'm4a', f.get('abr') or f.get('tbr') or 0
+        ),
+        reverse=True
+    )
+
+
+def _video_formats(info: Dict[str, Any], max_height: int = 720) -> List[Dict[str, Any]]:
+    """Formats carrying both audio and video up to max_height, best first"""
+    formats = [
+        f for f in info.get('formats') or [info]
+        if f.get('format_id')
+        and f.get('vcodec') != 'none' and f.get('acodec') != 'none'
+        and (f.get('height') or 0) <= max_height
+    ]
+    return sorted(
+        formats,
+        key=lambda f: (f.get('height') or 0, f.get('tbr') or 0),
+        reverse=True
+    )
+
+
+def _qualities_down_from(qualities: Dict[str, str], quality: str) -> List[tuple]:
+    """(quality, bitrate) pairs from the requested one down to the lowest"""
+    ordered = sorted(qualities.items(), key=lambda item: int(item[1]), reverse=True)
+    names = [name for name, _ in ordered]
+    start = names.index(quality) if quality in names else 0
+    return ordered[start:]
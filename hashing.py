@@ -0,0 +1,62 @@
+import hashlib
+import mmap
+import os
+from typing import BinaryIO, Optional
+
+from config import Config
+
+CHUNK_SIZE = 1024 * 1024  # 1 MiB
+
+
+def new_hash(algorithm: Optional[str] = None):
+    """Create a hash object for the configured algorithm (BLAKE2b by default)"""
+    return hashlib.new(algorithm or Config.HASH_ALGORITHM)
+
+
+def hash_file(file_path: str, algorithm: Optional[str] = None) -> str:
+    """Hash a whole file through a memory map"""
+    file_hash = new_hash(algorithm)
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return file_hash.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            file_hash.update(mapped)
+    return file_hash.hexdigest()
+
+
+class HashingReader:
+    """Read-only file wrapper that hashes the bytes as they are read.
+
+    Handing it to an upload computes the file hash without reading the file
+    a second time.
+    """
+
+    def __init__(self, fileobj: BinaryIO, algorithm: Optional[str] = None):
+        self._file = fileobj
+        self._hash = new_hash(algorithm)
+        self.bytes_read = 0
+
+    @property
+    def name(self) -> str:
+        return self._file.name
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._file.read(size)
+        self._hash.update(data)
+        self.bytes_read += len(data)
+        return data
+
+    def hexdigest(self) -> str:
+        """Digest of the whole file, reading whatever the consumer left"""
+        for chunk in iter(lambda: self.read(CHUNK_SIZE), b''):
+            pass
+        return self._hash.hexdigest()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
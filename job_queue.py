@@ -0,0 +1,418 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+from urllib.parse import urlsplit
+
+from scheduler import QueueFull
+
+logger = logging.getLogger(__name__)
+
+
+def worker_id() -> str:
+    """Identifier of this worker process, unique across machines"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class Lease:
+    """A job handed to one worker until it is acked or its lease expires"""
+
+    __slots__ = ('job_id', 'job', 'owner', 'attempts')
+
+    def __init__(self, job_id: str, job: Dict[str, Any], owner: str, attempts: int):
+        self.job_id = job_id
+        self.job = job
+        self.owner = owner
+        self.attempts = attempts
+
+
+class JobQueue(ABC):
+    """Durable queue of download jobs shared by several worker processes.
+
+    A worker leases a job for ``lease_seconds`` and keeps the lease alive with
+    heartbeats while it runs. A job whose lease expires (worker crashed or
+    stuck) is handed to another worker, up to ``max_attempts`` times.
+    """
+
+    def __init__(self, lease_seconds: float = 60, max_attempts: int = 3,
+                 max_pending_per_user: int = 3):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.max_pending_per_user = max_pending_per_user
+
+    @abstractmethod
+    def put(self, user_id: int, job: Dict[str, Any]) -> int:
+        """Queue a job and return the number of jobs ahead of it"""
+
+    @abstractmethod
+    def lease(self, owner: str, timeout: float = 5) -> Optional[Lease]:
+        """Take the next job, waiting up to timeout seconds for one"""
+
+    @abstractmethod
+    def heartbeat(self, lease: Lease) -> bool:
+        """Extend a lease, False when it was lost to another worker"""
+
+    @abstractmethod
+    def ack(self, lease: Lease):
+        """Remove a finished job"""
+
+    @abstractmethod
+    def release(self, lease: Lease, delay: float = 0):
+        """Give a job back without running it, leasable again after delay seconds.
+
+        The attempt is not counted: the job was refused, not failed.
+        """
+
+    @abstractmethod
+    def pending(self) -> int:
+        """Jobs waiting for a worker"""
+
+    def close(self):
+        pass
+
+    @contextmanager
+    def keep_alive(self, lease: Lease) -> Iterator[Lease]:
+        """Heartbeat the lease in the background while the block runs"""
+        done = threading.Event()
+
+        def beat():
+            while not done.wait(self.lease_seconds / 3):
+                try:
+                    if not self.heartbeat(lease):
+                        logger.warning(f"Lease of job {lease.job_id} lost")
+                        return
+                except Exception as e:
+                    logger.error(f"Heartbeat of job {lease.job_id} failed: {e}")
+
+        thread = threading.Thread(target=beat, name=f"heartbeat-{lease.job_id}", daemon=True)
+        thread.start()
+        try:
+            yield lease
+        finally:
+            done.set()
+            thread.join()
+
+
+class SQLiteJobQueue(JobQueue):
+    """Job queue in a SQLite database, for workers on a single machine.
+
+    Users are served round-robin: each job gets its rank among the user's
+    pending jobs and jobs are leased by rank, then by the time they reached
+    that rank.
+    """
+
+    POLL_INTERVAL = 0.2
+
+    def __init__(self, path: str, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                user_rank INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires REAL,
+                created REAL NOT NULL,
+                ranked REAL NOT NULL DEFAULT 0
+            )
+            ''')
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(jobs)')}
+            if 'ranked' not in columns:
+                # File créée par une version précédente
+                conn.execute('ALTER TABLE jobs ADD COLUMN ranked REAL NOT NULL DEFAULT 0')
+                conn.execute('UPDATE jobs SET ranked = created')
+            conn.execute('DROP INDEX IF EXISTS idx_jobs_order')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_rank ON jobs(user_rank, ranked, id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_user ON jobs(user_id)')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Transactions explicites (BEGIN IMMEDIATE) entre processus
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def put(self, user_id: int, job: Dict[str, Any]) -> int:
+        with self._transaction() as conn:
+            rank = conn.execute(
+                'SELECT COUNT(*) FROM jobs WHERE user_id = ?', (user_id,)
+            ).fetchone()[0]
+            if rank >= self.max_pending_per_user:
+                raise QueueFull(f"Too many pending downloads for user {user_id}")
+            ahead = conn.execute(
+                'SELECT COUNT(*) FROM jobs WHERE user_rank <= ? AND lease_owner IS NULL',
+                (rank,)
+            ).fetchone()[0]
+            now = time.time()
+            conn.execute(
+                'INSERT INTO jobs (user_id, user_rank, payload, created, ranked) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (user_id, rank, json.dumps(job), now, now)
+            )
+        return ahead
+
+    def lease(self, owner: str, timeout: float = 5) -> Optional[Lease]:
+        deadline = time.monotonic() + timeout
+        while True:
+            lease = self._try_lease(owner)
+            if lease or time.monotonic() >= deadline:
+                return lease
+            time.sleep(self.POLL_INTERVAL)
+
+    def _try_lease(self, owner: str) -> Optional[Lease]:
+        now = time.time()
+        with self._transaction() as conn:
+            # Baux expirés : travailleur mort ou bloqué
+            dropped = conn.execute(
+                'SELECT id, user_id FROM jobs WHERE lease_expires < ? AND attempts >= ?',
+                (now, self.max_attempts)
+            ).fetchall()
+            for job_id, user_id in dropped:
+                self._delete(conn, job_id, user_id)
+            if dropped:
+                logger.error(f"Dropped {len(dropped)} job(s) after {self.max_attempts} attempts")
+            row = conn.execute('''
+                SELECT id, payload, attempts FROM jobs
+                WHERE lease_expires IS NULL OR lease_expires < ?
+                ORDER BY user_rank, ranked, id
+                LIMIT 1
+            ''', (now,)).fetchone()
+            if row is None:
+                return None
+            conn.execute('''
+                UPDATE jobs SET lease_owner = ?, lease_expires = ?, attempts = attempts + 1
+                WHERE id = ?
+            ''', (owner, now + self.lease_seconds, row[0]))
+        if row[2]:
+            logger.warning(f"Redelivering job {row[0]} (attempt {row[2] + 1})")
+        return Lease(str(row[0]), json.loads(row[1]), owner, row[2] + 1)
+
+    def heartbeat(self, lease: Lease) -> bool:
+        conn = self._connect()
+        cursor = conn.execute(
+            'UPDATE jobs SET lease_expires = ? WHERE id = ? AND lease_owner = ?',
+            (time.time() + self.lease_seconds, int(lease.job_id), lease.owner)
+        )
+        return cursor.rowcount == 1
+
+    def ack(self, lease: Lease):
+        with self._transaction() as conn:
+            row = conn.execute(
+                'SELECT user_id FROM jobs WHERE id = ? AND lease_owner = ?',
+                (int(lease.job_id), lease.owner)
+            ).fetchone()
+            if row is not None:
+                self._delete(conn, int(lease.job_id), row[0])
+
+    def release(self, lease: Lease, delay: float = 0):
+        # Sans propriétaire, l'échéance du bail ne sert plus que de date de disponibilité
+        self._connect().execute('''
+            UPDATE jobs SET lease_owner = NULL, lease_expires = ?, attempts = attempts - 1
+            WHERE id = ? AND lease_owner = ?
+        ''', (time.time() + delay, int(lease.job_id), lease.owner))
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, job_id: int, user_id: int):
+        """Remove a job inside a transaction, keeping the user's ranks contiguous"""
+        conn.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+        # Les tâches suivantes de l'utilisateur avancent d'un rang, derrière
+        # celles des autres utilisateurs qui l'occupent déjà
+        conn.execute(
+            'UPDATE jobs SET user_rank = user_rank - 1, ranked = ? WHERE user_id = ? AND id > ?',
+            (time.time(), user_id, job_id)
+        )
+
+    def pending(self) -> int:
+        return self._connect().execute(
+            'SELECT COUNT(*) FROM jobs WHERE lease_expires IS NULL OR lease_expires < ?',
+            (time.time(),)
+        ).fetchone()[0]
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class RedisJobQueue(JobQueue):
+    """Job queue in Redis, for workers spread over several machines.
+
+    Ready job ids are in a list, leases in a sorted set scored by expiry and
+    payloads in a hash. Every state change is a Lua script, so it is atomic
+    across workers. Jobs are served in arrival order.
+    """
+
+    _LEASE = '''
+    local now = tonumber(ARGV[1])
+    for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now)) do
+        redis.call('ZREM', KEYS[2], id)
+        if tonumber(redis.call('HGET', KEYS[4], id) or 0) >= tonumber(ARGV[4]) then
+            local user = redis.call('HGET', KEYS[5], id)
+            redis.call('HDEL', KEYS[3], id)
+            redis.call('HDEL', KEYS[4], id)
+            redis.call('HDEL', KEYS[5], id)
+            redis.call('HDEL', KEYS[6], id)
+            if user then redis.call('HINCRBY', KEYS[7], user, -1) end
+        else
+            redis.call('RPUSH', KEYS[1], id)
+        end
+    end
+    local id = redis.call('LPOP', KEYS[1])
+    if not id then return nil end
+    redis.call('ZADD', KEYS[2], now + tonumber(ARGV[3]), id)
+    redis.call('HSET', KEYS[6], id, ARGV[2])
+    local attempts = redis.call('HINCRBY', KEYS[4], id, 1)
+    return {id, redis.call('HGET', KEYS[3], id), attempts}
+    '''
+
+    _HEARTBEAT = '''
+    if redis.call('HGET', KEYS[2], ARGV[1]) ~= ARGV[2] then return 0 end
+    if not redis.call('ZSCORE', KEYS[1], ARGV[1]) then return 0 end
+    redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+    return 1
+    '''
+
+    _ACK = '''
+    if redis.call('HGET', KEYS[5], ARGV[1]) ~= ARGV[2] then return 0 end
+    local user = redis.call('HGET', KEYS[4], ARGV[1])
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    redis.call('HDEL', KEYS[2], ARGV[1])
+    redis.call('HDEL', KEYS[3], ARGV[1])
+    redis.call('HDEL', KEYS[4], ARGV[1])
+    redis.call('HDEL', KEYS[5], ARGV[1])
+    if user then redis.call('HINCRBY', KEYS[6], user, -1) end
+    return 1
+    '''
+
+    _RELEASE = '''
+    if redis.call('HGET', KEYS[2], ARGV[1]) ~= ARGV[2] then return 0 end
+    if not redis.call('ZSCORE', KEYS[1], ARGV[1]) then return 0 end
+    redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+    redis.call('HDEL', KEYS[2], ARGV[1])
+    redis.call('HINCRBY', KEYS[3], ARGV[1], -1)
+    return 1
+    '''
+
+    _PUT = '''
+    if tonumber(redis.call('HGET', KEYS[5], ARGV[2]) or 0) >= tonumber(ARGV[4]) then
+        return -1
+    end
+    redis.call('HINCRBY', KEYS[5], ARGV[2], 1)
+    redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+    redis.call('HSET', KEYS[3], ARGV[1], 0)
+    redis.call('HSET', KEYS[4], ARGV[1], ARGV[2])
+    return redis.call('RPUSH', KEYS[1], ARGV[1]) - 1
+    '''
+
+    POLL_INTERVAL = 0.2
+
+    def __init__(self, url: str, prefix: str = 'ytdl:jobs', **kwargs: Any):
+        super().__init__(**kwargs)
+        import redis  # dépendance optionnelle, seulement pour ce backend
+
+        self._redis = redis.Redis.from_url(url)
+        self._keys = {
+            name: f"{prefix}:{name}"
+            for name in ('ready', 'leases', 'payloads', 'attempts', 'users', 'owners',
+                         'per_user')
+        }
+        self._lease_script = self._redis.register_script(self._LEASE)
+        self._heartbeat_script = self._redis.register_script(self._HEARTBEAT)
+        self._ack_script = self._redis.register_script(self._ACK)
+        self._release_script = self._redis.register_script(self._RELEASE)
+        self._put_script = self._redis.register_script(self._PUT)
+
+    def put(self, user_id: int, job: Dict[str, Any]) -> int:
+        k = self._keys
+        ahead = self._put_script(
+            keys=[k['ready'], k['payloads'], k['attempts'], k['users'], k['per_user']],
+            args=[uuid.uuid4().hex, user_id, json.dumps(job), self.max_pending_per_user]
+        )
+        if ahead < 0:
+            raise QueueFull(f"Too many pending downloads for user {user_id}")
+        return ahead
+
+    def lease(self, owner: str, timeout: float = 5) -> Optional[Lease]:
+        k = self._keys
+        deadline = time.monotonic() + timeout
+        while True:
+            result = self._lease_script(
+                keys=[k['ready'], k['leases'], k['payloads'], k['attempts'], k['users'],
+                      k['owners'], k['per_user']],
+                args=[time.time(), owner, self.lease_seconds, self.max_attempts]
+            )
+            if result:
+                job_id, payload, attempts = result
+                if attempts > 1:
+                    logger.warning(f"Redelivering job {job_id.decode()} (attempt {attempts})")
+                return Lease(job_id.decode(), json.loads(payload), owner, attempts)
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.POLL_INTERVAL)
+
+    def heartbeat(self, lease: Lease) -> bool:
+        k = self._keys
+        return bool(self._heartbeat_script(
+            keys=[k['leases'], k['owners']],
+            args=[lease.job_id, lease.owner, time.time() + self.lease_seconds]
+        ))
+
+    def ack(self, lease: Lease):
+        k = self._keys
+        self._ack_script(
+            keys=[k['leases'], k['payloads'], k['attempts'], k['users'], k['owners'],
+                  k['per_user']],
+            args=[lease.job_id, lease.owner]
+        )
+
+    def release(self, lease: Lease, delay: float = 0):
+        # Le bail reste dans 'leases' jusqu'à l'échéance, puis revient dans 'ready'
+        k = self._keys
+        self._release_script(
+            keys=[k['leases'], k['owners'], k['attempts']],
+            args=[lease.job_id, lease.owner, time.time() + delay]
+        )
+
+    def pending(self) -> int:
+        return self._redis.llen(self._keys['ready'])
+
+    def close(self):
+        self._redis.close()
+
+
+def open_job_queue(url: str, **kwargs: Any) -> JobQueue:
+    """Job queue for a ``sqlite:///path`` or ``redis://host:port/db`` URL"""
+    scheme = urlsplit(url).scheme
+    if scheme == 'sqlite':
+        return SQLiteJobQueue(url[len('sqlite:///'):] or 'jobs.sqlite', **kwargs)
+    if scheme in ('redis', 'rediss', 'unix'):
+        return RedisJobQueue(url, **kwargs)
+    raise ValueError(f"Unsupported job queue URL: {url}")
@@ -7,6 +7,8 @@ MESSAGES = {
         ),
         'search_prompt': "🔍 Send me a video title or URL to search:",
         'downloading': "⏳ Downloading: *{}*\nProgress: {}%",
+        'converting': "⚙️ Converting: *{}*",
+        'uploading': "📤 Uploading: *{}*",
         'download_complete': "✅ Downloaded: *{}*",
         'no_results': "❌ No results found.",
         'error': "❌ Error: {}",
@@ -14,7 +16,10 @@ MESSAGES = {
         'playlist_info': "📑 Playlist: *{}*\nTotal tracks: {}",
         'select_format': "Choose download format:",
         'format_mp3': "🎵 MP3 (Audio)",
-        'format_mp4': "🎥 MP4 (Video)"
+        'format_mp4': "🎥 MP4 (Video)",
+        'format_audio': "🎧 Native audio (M4A/Opus, no conversion)",
+        'rate_limited': "⏳ Too many requests. Try again in {} s.",
+        'session_expired': "⌛ This search has expired, please search again."
     },
     'fr': {
         'welcome': (
@@ -24,6 +29,8 @@ MESSAGES = {
         ),
         'search_prompt': "🔍 Envoyez un titre ou une URL à rechercher :",
         'downloading': "⏳ Téléchargement : *{}*\nProgression : {}%",
+        'converting': "⚙️ Conversion : *{}*",
+        'uploading': "📤 Envoi : *{}*",
         'download_complete': "✅ Téléchargé : *{}*",
         'no_results': "❌ Aucun résultat trouvé.",
         'error': "❌ Erreur : {}",
@@ -31,6 +38,9 @@ MESSAGES = {
         'playlist_info': "📑 Playlist : *{}*\nTotal pistes : {}",
         'select_format': "Choisissez le format :",
         'format_mp3': "🎵 MP3 (Audio)",
-        'format_mp4': "🎥 MP4 (Vidéo)"
+        'format_mp4': "🎥 MP4 (Vidéo)",
+        'format_audio': "🎧 Audio natif (M4A/Opus, sans conversion)",
+        'rate_limited': "⏳ Trop de demandes. Réessayez dans {} s.",
+        'session_expired': "⌛ Cette recherche a expiré, relancez-la."
     }
 }
\ No newline at end of file
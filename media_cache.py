@@ -0,0 +1,248 @@
+import fcntl
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TMP_SUFFIX = '.tmp'
+LOCK_FILE = '.lock'
+
+
+class MediaCache:
+    """Delivered files kept on disk so repeat requests skip the network.
+
+    Files are stored once per content hash under ``root`` and indexed by
+    (video_id, format, quality) in memory and in the database. The total
+    size stays under ``max_bytes`` by evicting the least recently used
+    entries. The quota is counted from the database, under a lock file in
+    ``root``, so processes sharing both see the whole cache. Files pinned by
+    an ongoing upload in this process are only deleted once released. The
+    in-memory index is rebuilt from the database on startup.
+    """
+
+    def __init__(self, db, root: str, max_bytes: int):
+        self.db = db
+        self.root = root
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # (video_id, format, quality) -> (path, file_hash, size), du plus ancien au plus récent
+        self._entries: OrderedDict = OrderedDict()
+        self._keys_per_path: Dict[str, int] = {}
+        self._pins: Dict[str, int] = {}
+        self._doomed = set()
+        self._lock = threading.Lock()
+
+    def rebuild(self, min_age: float = 0):
+        """Load the index from the database and drop files it does not know
+
+        Unknown files changed less than min_age seconds ago are kept, they may
+        be a commit of another process not yet written to the database.
+        """
+        now = time.time()
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock:
+            self._entries.clear()
+            self._keys_per_path.clear()
+            self.total_bytes = 0
+            for row in self.db.get_media_files():
+                key = (row['video_id'], row['format'], row['quality'])
+                path = row['path']
+                if not os.path.isfile(path) or os.path.getsize(path) != row['file_size']:
+                    self.db.delete_media_file(*key)
+                    continue
+                self._add(key, path, row['file_hash'], row['file_size'])
+
+            known = set(self._keys_per_path)
+            # Seul parcours du répertoire : fichiers temporaires et orphelins
+            for directory, _, filenames in os.walk(self.root):
+                for filename in filenames:
+                    path = os.path.join(directory, filename)
+                    if path in known or filename == LOCK_FILE:
+                        continue
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    if now - max(stat.st_mtime, stat.st_ctime) >= min_age:
+                        self._remove_file(path)
+        self._enforce_quota()
+        logger.info(
+            f"Media cache: {len(self._entries)} entries, "
+            f"{self.total_bytes / (1024 * 1024):.1f}MB"
+        )
+
+    def acquire(self, video_id: str, format_type: str, quality: str) -> Optional[Dict[str, Any]]:
+        """Pin and return a cached file, or None on miss; release() it after use"""
+        key = (video_id, format_type, quality)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            path, file_hash, size = entry
+            if not os.path.exists(path):
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._pins[path] = self._pins.get(path, 0) + 1
+            self.hits += 1
+
+        self.db.touch_media_file(*key)
+        return {'path': path, 'file_hash': file_hash, 'file_size': size / (1024 * 1024)}
+
+    def release(self, path: str):
+        """Unpin a file returned by acquire()"""
+        with self._lock:
+            pins = self._pins.get(path, 1) - 1
+            if pins > 0:
+                self._pins[path] = pins
+                return
+            self._pins.pop(path, None)
+            if path in self._doomed:
+                self._doomed.discard(path)
+                self._remove_file(path)
+
+    def commit(self, video_id: str, format_type: str, quality: str,
+               source_path: str, file_hash: str) -> Optional[str]:
+        """Store a copy of a delivered file under its content hash (None if not cached)"""
+        ext = os.path.splitext(source_path)[1]
+        path = os.path.join(self.root, file_hash[:2], file_hash + ext)
+        key = (video_id, format_type, quality)
+        try:
+            # La source peut avoir disparu depuis l'envoi : le cache est facultatif
+            size = os.path.getsize(source_path)
+            if size > self.max_bytes:
+                return None
+            if not os.path.exists(path):
+                self._store(source_path, path)
+        except OSError as e:
+            logger.warning(f"Media cache commit of {video_id} failed: {e}")
+            return None
+
+        with self._lock:
+            self._doomed.discard(path)
+            previous = self._entries.get(key)
+            if previous and previous[0] == path:
+                self._entries.move_to_end(key)
+            else:
+                if previous:
+                    self._drop(key)
+                self._add(key, path, file_hash, size)
+        self.db.save_media_file(video_id, format_type, quality, file_hash, path, size)
+        self._enforce_quota()
+        return path
+
+    def __contains__(self, key: Tuple[str, str, str]) -> bool:
+        """Whether (video_id, format, quality) is cached, without counting a lookup"""
+        with self._lock:
+            return key in self._entries
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+    # -- internals (called with the lock held unless noted) ------------------------
+
+    def _store(self, source_path: str, path: str):
+        """Link or copy source_path to a temporary name, then rename it (no lock)"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}{TMP_SUFFIX}"
+        try:
+            try:
+                os.link(source_path, tmp_path)
+            except OSError:
+                # Autre système de fichiers ou liens non supportés
+                shutil.copyfile(source_path, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _add(self, key: Tuple[str, str, str], path: str, file_hash: str, size: int):
+        self._entries[key] = (path, file_hash, size)
+        count = self._keys_per_path.get(path, 0)
+        if count == 0:
+            self.total_bytes += size
+        self._keys_per_path[path] = count + 1
+
+    def _drop(self, key: Tuple[str, str, str]):
+        path, _, size = self._entries.pop(key)
+        count = self._keys_per_path[path] - 1
+        if count:
+            self._keys_per_path[path] = count
+            return
+        del self._keys_per_path[path]
+        self.total_bytes -= size
+        if self._pins.get(path):
+            self._doomed.add(path)
+        else:
+            self._remove_file(path)
+
+    def _enforce_quota(self):
+        """Evict the least recently used entries of every process sharing the cache (no lock)"""
+        with self._shared_lock():
+            # Les écritures en attente de ce processus d'abord, pour compter son dernier ajout
+            self.db.flush()
+            rows = self.db.get_media_files()
+            sizes = {row['path']: row['file_size'] for row in rows}
+            refs = Counter(row['path'] for row in rows)
+            total = sum(sizes.values())
+            for row in rows:
+                if total <= self.max_bytes:
+                    break
+                key = (row['video_id'], row['format'], row['quality'])
+                path = row['path']
+                self.db.delete_media_file(*key)
+                refs[path] -= 1
+                if not refs[path]:
+                    total -= sizes[path]
+                with self._lock:
+                    if key in self._entries:
+                        self._drop(key)
+                    elif not refs[path] and path not in self._keys_per_path:
+                        # Entrée d'un autre processus
+                        if self._pins.get(path):
+                            self._doomed.add(path)
+                        else:
+                            self._remove_file(path)
+                    self.evictions += 1
+            self.db.flush()
+
+    @contextmanager
+    def _shared_lock(self) -> Iterator[None]:
+        """Exclusive lock of the cache, across threads and processes"""
+        os.makedirs(self.root, exist_ok=True)
+        # Un descripteur par appel : flock exclut aussi les threads entre eux
+        with open(os.path.join(self.root, LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _remove_file(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove {path}: {e}")
@@ -0,0 +1,185 @@
+import logging
+import os
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class PlaylistPipeline:
+    """Deliver a playlist as a stream of tracks.
+
+    Extraction, download, transcode and upload run as separate stages linked
+    by bounded queues, so the first tracks are uploaded while later ones are
+    still being fetched. At most ``concurrency`` downloads and transcodes run
+    at once for one playlist. Tracks already delivered to the chat are
+    skipped, so a failed or interrupted playlist can simply be resubmitted.
+    """
+
+    def __init__(self, download_manager, db, playlist_id: str, entries: Iterable[Dict],
+                 chat_id: int, format_type: str, quality: str,
+                 deliver: Callable[[Dict[str, Any]], None],
+                 lookup: Optional[Callable[[Dict], Optional[Dict]]] = None,
+                 on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 concurrency: int = 3):
+        self.download_manager = download_manager
+        self.db = db
+        self.playlist_id = playlist_id
+        self.entries = entries
+        self.chat_id = chat_id
+        self.format_type = format_type
+        self.quality = quality
+        self.deliver = deliver
+        self.lookup = lookup
+        self.on_progress = on_progress
+        self.concurrency = concurrency
+        self.summary: Dict[str, Any] = {
+            'total': 0, 'delivered': 0, 'skipped': 0, 'failed': []
+        }
+        self._lock = threading.Lock()
+
+    def run(self) -> Dict[str, Any]:
+        """Run every stage to completion and return the summary"""
+        download_q: queue.Queue = queue.Queue(self.concurrency)
+        transcode_q: queue.Queue = queue.Queue(self.concurrency)
+        upload_q: queue.Queue = queue.Queue(self.concurrency)
+
+        threads = [
+            threading.Thread(target=self._extract, args=(download_q, upload_q),
+                             name='playlist-extract', daemon=True)
+        ]
+        threads += self._stage('download', self.concurrency, download_q, transcode_q,
+                               self._download)
+        threads += self._stage('transcode', self.concurrency, transcode_q, upload_q,
+                               self._transcode)
+        threads += self._stage('upload', 1, upload_q, None, self._upload)
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.summary
+
+    # -- stages ----------------------------------------------------------------
+
+    def _extract(self, download_q: queue.Queue, upload_q: queue.Queue):
+        delivered = self.db.get_delivered_items(self.chat_id, self.playlist_id, self.format_type)
+        try:
+            for entry in self.entries:
+                with self._lock:
+                    self.summary['total'] += 1
+                if entry['id'] in delivered:
+                    with self._lock:
+                        self.summary['skipped'] += 1
+                    continue
+
+                item = {'entry': entry}
+                cached = self.lookup(entry) if self.lookup else None
+                if cached:
+                    # Déjà envoyé ailleurs : pas de téléchargement
+                    item['cached'] = cached
+                    upload_q.put(item)
+                else:
+                    download_q.put(item)
+        except Exception as e:
+            logger.error(f"Playlist extraction error: {e}")
+            with self._lock:
+                self.summary['failed'].append(('Playlist', str(e)))
+        finally:
+            download_q.put(_DONE)
+
+    def _download(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        entry = item['entry']
+        if self.format_type == 'mp3':
+            item['path'], item['info'], item['quality'] = self.download_manager.download_source(
+                entry['url'], self.quality, video_id=entry['id']
+            )
+        else:
+            item['path'], item['info'], item['size'] = self.download_manager.download_media(
+                entry['url'], format_type=self.format_type, quality=self.quality,
+                video_id=entry['id']
+            )
+        # Référence sur un fichier partagé avec les autres téléchargements
+        item['shared'] = True
+        return item
+
+    def _transcode(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        if self.format_type == 'mp3':
+            source = item['path']
+            path, size = self.download_manager.transcode_audio(source, item['quality'])
+            self.download_manager.release(source)
+            # Le MP3 n'appartient qu'à cette playlist
+            item.update(path=path, size=size, shared=False)
+        return item
+
+    def _upload(self, item: Dict[str, Any]):
+        try:
+            self.deliver(item)
+        finally:
+            self._cleanup(item)
+        self.db.mark_item_delivered(
+            self.chat_id, self.playlist_id, self.format_type, item['entry']['id']
+        )
+        with self._lock:
+            self.summary['delivered'] += 1
+        self._report()
+
+    # -- plumbing ----------------------------------------------------------------
+
+    def _stage(self, name: str, workers: int, inbox: queue.Queue,
+               outbox: Optional[queue.Queue], fn: Callable) -> List[threading.Thread]:
+        """Worker threads applying fn to inbox items; the last one to stop closes outbox"""
+        remaining = [workers]
+
+        def worker():
+            while True:
+                item = inbox.get()
+                if item is _DONE:
+                    inbox.put(_DONE)  # pour les autres workers du même étage
+                    break
+                try:
+                    result = fn(item)
+                except Exception as e:
+                    self._fail(item, e)
+                    continue
+                if outbox is not None and result is not None:
+                    outbox.put(result)
+
+            with self._lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last and outbox is not None:
+                outbox.put(_DONE)
+
+        return [
+            threading.Thread(target=worker, name=f"playlist-{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+
+    def _fail(self, item: Dict[str, Any], error: Exception):
+        logger.error(f"Playlist item {item['entry']['id']} failed: {error}")
+        self._cleanup(item)
+        with self._lock:
+            self.summary['failed'].append((item['entry']['title'], str(error)))
+        self._report()
+
+    def _cleanup(self, item: Dict[str, Any]):
+        path = item.pop('path', None)
+        if not path:
+            return
+        if item.get('shared'):
+            self.download_manager.release(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def _report(self):
+        if self.on_progress:
+            with self._lock:
+                summary = dict(self.summary, failed=list(self.summary['failed']))
+            try:
+                self.on_progress(summary)
+            except Exception as e:
+                logger.warning(f"Playlist progress error: {e}")
@@ -0,0 +1,148 @@
+import logging
+import threading
+import time
+from typing import Optional, Set
+
+from telegram import ParseMode
+from telegram import error as telegram_error
+
+from locales import MESSAGES
+from rate_limit import KeyedRateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressReporter:
+    """Live progress of one job, shown by editing its Telegram message.
+
+    Updates only record the latest text, so yt-dlp hooks never wait for
+    Telegram. The ProgressFlusher sends it later, when the text changed and
+    the shared limiter allows it; intermediate states are dropped. The
+    percentage is rounded to ``step``.
+    """
+
+    PHASES = ('download', 'transcode', 'upload')
+
+    def __init__(self, bot, chat_id: int, message_id: int, title: str,
+                 limiter: KeyedRateLimiter, flusher: 'ProgressFlusher',
+                 language: str = 'fr', step: int = 5):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.title = title
+        self.limiter = limiter
+        self.flusher = flusher
+        self.messages = MESSAGES[language]
+        self.step = step
+        self._pending: Optional[str] = None
+        self._last_text: Optional[str] = None
+        self._blocked_until = 0.0
+        self._closed = False
+        self._lock = threading.Lock()
+        # Tenu pendant l'envoi d'une édition, pour que close() l'attende
+        self._send_lock = threading.Lock()
+
+    def __call__(self, phase: str, percent: Optional[float] = None):
+        self.update(phase, percent)
+
+    def update(self, phase: str, percent: Optional[float] = None):
+        """Report the current phase and, while downloading, its percentage"""
+        self.show(self._render(phase, percent))
+
+    def show(self, text: str):
+        """Record the text to show at the next flush"""
+        with self._lock:
+            if self._closed:
+                return
+            self._pending = text
+        self.flusher.register(self)
+
+    def flush(self):
+        """Send the pending text, if any, changed and allowed by the limiter"""
+        with self._send_lock:
+            with self._lock:
+                text = self._pending
+                if (self._closed or text is None or text == self._last_text
+                        or time.monotonic() < self._blocked_until):
+                    return
+                if not self.limiter.try_acquire(self.chat_id):
+                    return
+                self._pending = None
+                self._last_text = text
+
+            try:
+                # Un seul thread pour tous les messages : jamais d'attente
+                with self.bot.interactive():
+                    self.bot.edit_message_text(
+                        text,
+                        chat_id=self.chat_id,
+                        message_id=self.message_id,
+                        parse_mode=ParseMode.MARKDOWN
+                    )
+            except telegram_error.RetryAfter as e:
+                # Telegram demande de ralentir : plus d'éditions pour ce message
+                with self._lock:
+                    self._blocked_until = time.monotonic() + e.retry_after
+            except telegram_error.TelegramError as e:
+                logger.debug(f"Progress edit skipped: {e}")
+
+    def close(self):
+        """Stop editing the message, after an edit being sent, before the final text"""
+        with self._send_lock, self._lock:
+            self._closed = True
+            self._pending = None
+        self.flusher.unregister(self)
+
+    def _render(self, phase: str, percent: Optional[float]) -> str:
+        if phase == 'download':
+            percent = int(min(max(percent or 0, 0), 100) // self.step * self.step)
+            return self.messages['downloading'].format(self.title, percent)
+        if phase == 'transcode':
+            return self.messages['converting'].format(self.title)
+        return self.messages['uploading'].format(self.title)
+
+
+class ProgressFlusher:
+    """Background thread sending the pending edits of live ProgressReporters.
+
+    Every ``interval`` seconds each reporter gets one flush, so a message is
+    edited at most once per interval whatever the number of updates.
+    """
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self._reporters: Set[ProgressReporter] = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, reporter: ProgressReporter):
+        with self._lock:
+            self._reporters.add(reporter)
+            if self._thread is None:
+                # Démarré au premier besoin, dans le bot comme dans les workers
+                self._thread = threading.Thread(
+                    target=self._run, name='progress-flusher', daemon=True
+                )
+                self._thread.start()
+
+    def unregister(self, reporter: ProgressReporter):
+        with self._lock:
+            self._reporters.discard(reporter)
+
+    def __len__(self) -> int:
+        return len(self._reporters)
+
+    def flush(self):
+        """Flush every registered reporter once"""
+        with self._lock:
+            reporters = list(self._reporters)
+        for reporter in reporters:
+            try:
+                reporter.flush()
+            except Exception as e:
+                logger.warning(f"Progress flush error: {e}")
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
@@ -0,0 +1,373 @@
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, Hashable, Iterator, Optional, Tuple
+from urllib.parse import urlsplit
+
+from telegram import Bot
+from telegram.error import RetryAfter
+from telegram.utils.helpers import DEFAULT_NONE
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Classic token bucket: ``rate`` tokens per second, bursts up to ``capacity``"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        # now peut précéder la création du seau (horloge lue avant, sous verrou)
+        if now <= self.updated:
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1, now: Optional[float] = None) -> bool:
+        """Take tokens if available, without waiting"""
+        self._refill(time.monotonic() if now is None else now)
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def charge(self, tokens: float = 1, now: Optional[float] = None):
+        """Take tokens without waiting, going into debt if there are not enough"""
+        self._refill(time.monotonic() if now is None else now)
+        self.tokens -= tokens
+
+    def refund(self, tokens: float = 1):
+        """Give back tokens taken for an action that did not happen"""
+        self.tokens = min(self.capacity, self.tokens + tokens)
+
+    def wait_time(self, tokens: float = 1, now: Optional[float] = None) -> float:
+        """Seconds until tokens are available"""
+        self._refill(time.monotonic() if now is None else now)
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+    def is_full(self, now: float) -> bool:
+        """A full bucket is identical to a new one and can be dropped"""
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class SharedTokenBucket(ABC):
+    """Token bucket kept in a store shared by several processes.
+
+    Same interface as TokenBucket. The ``now`` arguments are ignored: the
+    processes share no monotonic clock, so the store works in wall time.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: float):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+
+    @abstractmethod
+    def _apply(self, mode: str, tokens: float) -> Tuple[bool, float]:
+        """Refill, then atomically 'take' (if enough), 'charge', 'refund' or 'peek'.
+
+        Returns whether tokens were taken and the tokens left.
+        """
+
+    def try_acquire(self, tokens: float = 1, now: Optional[float] = None) -> bool:
+        return self._apply('take', tokens)[0]
+
+    def charge(self, tokens: float = 1, now: Optional[float] = None):
+        self._apply('charge', tokens)
+
+    def refund(self, tokens: float = 1):
+        self._apply('refund', tokens)
+
+    def wait_time(self, tokens: float = 1, now: Optional[float] = None) -> float:
+        left = self._apply('peek', tokens)[1]
+        return max(0.0, (tokens - left) / self.rate)
+
+    def close(self):
+        pass
+
+
+class SQLiteTokenBucket(SharedTokenBucket):
+    """Shared token bucket in a SQLite database, for processes on one machine"""
+
+    def __init__(self, path: str, name: str, rate: float, capacity: float):
+        super().__init__(name, rate, capacity)
+        self._lock = threading.Lock()
+        # Transactions explicites (BEGIN IMMEDIATE) entre processus
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.execute('PRAGMA synchronous = NORMAL')
+        self._conn.execute('''
+        CREATE TABLE IF NOT EXISTS token_buckets (
+            name TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL
+        )
+        ''')
+        self._conn.execute(
+            'INSERT OR IGNORE INTO token_buckets (name, tokens, updated) VALUES (?, ?, ?)',
+            (name, capacity, time.time())
+        )
+
+    def _apply(self, mode: str, tokens: float) -> Tuple[bool, float]:
+        with self._lock, self._transaction() as conn:
+            now = time.time()
+            left, updated = conn.execute(
+                'SELECT tokens, updated FROM token_buckets WHERE name = ?', (self.name,)
+            ).fetchone()
+            if now > updated:
+                left = min(self.capacity, left + (now - updated) * self.rate)
+                updated = now
+            taken = mode == 'charge' or (mode == 'take' and left >= tokens)
+            if taken:
+                left -= tokens
+            elif mode == 'refund':
+                left = min(self.capacity, left + tokens)
+            conn.execute(
+                'UPDATE token_buckets SET tokens = ?, updated = ? WHERE name = ?',
+                (left, updated, self.name)
+            )
+        return taken, left
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield self._conn
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
+
+    def close(self):
+        self._conn.close()
+
+
+class RedisTokenBucket(SharedTokenBucket):
+    """Shared token bucket in Redis, for processes spread over several machines"""
+
+    _APPLY = '''
+    local rate, capacity = tonumber(ARGV[1]), tonumber(ARGV[2])
+    local now, tokens, mode = tonumber(ARGV[3]), tonumber(ARGV[4]), ARGV[5]
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local left = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    if now > updated then
+        left = math.min(capacity, left + (now - updated) * rate)
+        updated = now
+    end
+    local taken = 0
+    if mode == 'charge' or (mode == 'take' and left >= tokens) then
+        left = left - tokens
+        taken = 1
+    elseif mode == 'refund' then
+        left = math.min(capacity, left + tokens)
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(left), 'updated', tostring(updated))
+    return {taken, tostring(left)}
+    '''
+
+    def __init__(self, url: str, name: str, rate: float, capacity: float,
+                 prefix: str = 'ytdl:buckets'):
+        super().__init__(name, rate, capacity)
+        import redis  # dépendance optionnelle, seulement pour ce backend
+
+        self._redis = redis.Redis.from_url(url)
+        self._key = f"{prefix}:{name}"
+        self._script = self._redis.register_script(self._APPLY)
+
+    def _apply(self, mode: str, tokens: float) -> Tuple[bool, float]:
+        # Les nombres Lua sont tronqués en entiers au retour : le solde passe en texte
+        taken, left = self._script(
+            keys=[self._key],
+            args=[self.rate, self.capacity, time.time(), tokens, mode]
+        )
+        return bool(taken), float(left)
+
+    def close(self):
+        self._redis.close()
+
+
+def open_token_bucket(url: str, name: str, rate: float, capacity: float) -> SharedTokenBucket:
+    """Shared bucket stored next to a ``sqlite:///path`` or ``redis://`` job queue"""
+    scheme = urlsplit(url).scheme
+    if scheme == 'sqlite':
+        return SQLiteTokenBucket(url[len('sqlite:///'):] or 'jobs.sqlite', name, rate, capacity)
+    if scheme in ('redis', 'rediss', 'unix'):
+        return RedisTokenBucket(url, name, rate, capacity)
+    raise ValueError(f"Unsupported token bucket URL: {url}")
+
+
+class KeyedRateLimiter:
+    """A global token bucket plus one sub-bucket per key (chat, user...)
+
+    The global bucket is optional (``rate=None``); a SharedTokenBucket lets
+    several processes share it. Idle key buckets are dropped once refilled,
+    so memory follows the number of recently active keys. ``pause`` holds a
+    key, or everything, after a flood-wait reply.
+    """
+
+    GC_INTERVAL = 60  # seconds between sweeps of idle buckets
+
+    def __init__(self, rate: Optional[float], capacity: Optional[float],
+                 key_rate: float, key_capacity: float,
+                 global_bucket: Optional[SharedTokenBucket] = None):
+        self.key_rate = key_rate
+        self.key_capacity = key_capacity
+        self._global = global_bucket or (TokenBucket(rate, capacity) if rate else None)
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+        self._paused: Dict[Hashable, float] = {}
+        self._paused_until = 0.0
+        self._next_gc = time.monotonic() + self.GC_INTERVAL
+        self._lock = threading.Lock()
+
+    def try_acquire(self, key: Hashable, tokens: float = 1) -> bool:
+        """Take tokens from both the key bucket and the global bucket"""
+        with self._lock:
+            return self._take(key, time.monotonic(), tokens) == 0
+
+    def acquire(self, key: Hashable, timeout: Optional[float] = None) -> bool:
+        """Wait for a token, False if none is available within timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._take(key, now)
+            if wait == 0:
+                return True
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def charge(self, key: Hashable, tokens: float = 1):
+        """Take tokens without waiting; the debt delays the next acquire()"""
+        with self._lock:
+            now = time.monotonic()
+            self._bucket(key).charge(tokens, now=now)
+            if self._global is not None:
+                self._global.charge(tokens, now=now)
+
+    def wait_time(self, key: Hashable, tokens: float = 1) -> float:
+        """Seconds before the key can take tokens"""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(self._paused_until, self._paused.get(key, 0)) - now
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                wait = max(wait, bucket.wait_time(tokens, now=now))
+            if self._global is not None:
+                wait = max(wait, self._global.wait_time(tokens, now=now))
+            return max(0.0, wait)
+
+    def refund(self, key: Hashable, tokens: float = 1):
+        """Give back the tokens of an action that did not happen"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.refund(tokens)
+            if self._global is not None:
+                self._global.refund(tokens)
+
+    def pause(self, seconds: float, key: Optional[Hashable] = None):
+        """Refuse tokens for a key (every key when None) during seconds"""
+        with self._lock:
+            until = time.monotonic() + seconds
+            if key is None:
+                self._paused_until = max(self._paused_until, until)
+            else:
+                self._paused[key] = max(self._paused.get(key, 0), until)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _take(self, key: Hashable, now: float, tokens: float = 1) -> float:
+        """Take tokens and return 0, or return the seconds to wait"""
+        if now >= self._next_gc:
+            self._collect(now)
+        paused = max(self._paused_until, self._paused.get(key, 0))
+        if now < paused:
+            return paused - now
+        bucket = self._bucket(key)
+        if not bucket.try_acquire(tokens, now=now):
+            return bucket.wait_time(tokens, now=now)
+        if self._global is not None and not self._global.try_acquire(tokens, now=now):
+            bucket.refund(tokens)
+            return self._global.wait_time(tokens, now=now)
+        return 0
+
+    def _bucket(self, key: Hashable) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.key_rate, self.key_capacity)
+        return bucket
+
+    def _collect(self, now: float):
+        # Balayage amorti : un parcours par intervalle
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items() if not bucket.is_full(now)
+        }
+        self._paused = {key: until for key, until in self._paused.items() if until > now}
+        self._next_gc = now + self.GC_INTERVAL
+
+
+class RateLimitedBot(Bot):
+    """Bot whose API calls to a chat wait for the outbound limiter.
+
+    Short flood waits (``RetryAfter``) pause the chat and are retried; longer
+    ones are raised to the caller. Calls made inside ``interactive()`` (the
+    handlers, on the dispatcher thread) never wait: their tokens are charged
+    as debt, which slows down the worker threads instead.
+    """
+
+    MAX_ATTEMPTS = 3
+
+    def __init__(self, *args: Any, limiter: KeyedRateLimiter, max_retry_after: float = 10,
+                 **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.limiter = limiter
+        self.max_retry_after = max_retry_after
+        self._thread_state = threading.local()
+
+    @contextmanager
+    def interactive(self) -> Iterator[None]:
+        """Send the API calls of this thread without waiting for the limiter"""
+        previous = getattr(self._thread_state, 'interactive', False)
+        self._thread_state.interactive = True
+        try:
+            yield
+        finally:
+            self._thread_state.interactive = previous
+
+    def _post(self, endpoint: str, data: Dict = None, timeout=DEFAULT_NONE,
+              api_kwargs: Dict = None):
+        chat_id = (data or {}).get('chat_id') or (api_kwargs or {}).get('chat_id')
+        if chat_id is None:
+            return super()._post(endpoint, data, timeout, api_kwargs)
+
+        if getattr(self._thread_state, 'interactive', False):
+            self.limiter.charge(chat_id)
+            try:
+                return super()._post(endpoint, data, timeout, api_kwargs)
+            except RetryAfter as e:
+                self.limiter.pause(e.retry_after, chat_id)
+                raise
+
+        for attempt in range(1, self.MAX_ATTEMPTS + 1):
+            self.limiter.acquire(chat_id)
+            try:
+                # Les InputFile sont déjà en mémoire : la requête peut être rejouée
+                return super()._post(endpoint, data, timeout, api_kwargs)
+            except RetryAfter as e:
+                self.limiter.pause(e.retry_after, chat_id)
+                if e.retry_after > self.max_retry_after or attempt == self.MAX_ATTEMPTS:
+                    raise
+                logger.warning(f"{endpoint} limited in chat {chat_id}, retry in {e.retry_after}s")
@@ -0,0 +1,128 @@
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Raised when a user already has too many pending downloads"""
+
+
+class DownloadScheduler:
+    """Bounded pool of download workers with per-user round-robin fairness.
+
+    Each user has their own FIFO of pending jobs and users with pending work
+    take turns in a ready ring, so one user queueing many downloads cannot
+    starve the others. Queueing and dequeueing are O(1); the position estimate
+    returned by submit() is O(max_pending_per_user), from a count of users
+    per queue length.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending_per_user: int = 3):
+        self.max_workers = max_workers
+        self.max_pending_per_user = max_pending_per_user
+        self._queues: Dict[int, Deque[Tuple[Callable, tuple]]] = {}
+        self._ready: Deque[int] = deque()
+        # Nombre d'utilisateurs ayant exactement n tâches en attente
+        self._depths: List[int] = [0] * (max_pending_per_user + 1)
+        self._pending = 0
+        self._active = 0
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._running = False
+
+    def start(self):
+        """Start the worker threads (idempotent)"""
+        with self._cond:
+            self._running = True
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for i in range(len(self._threads), self.max_workers):
+                thread = threading.Thread(
+                    target=self._worker, name=f"download-worker-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, wait: bool = True):
+        """Stop the workers once the queued jobs are drained"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def submit(self, user_id: int, fn: Callable, *args: Any) -> int:
+        """Queue a job and return its estimated position (0 = starts now)"""
+        with self._cond:
+            queue = self._queues.get(user_id)
+            if queue is None:
+                queue = self._queues[user_id] = deque()
+            if len(queue) >= self.max_pending_per_user:
+                raise QueueFull(f"Too many pending downloads for user {user_id}")
+
+            position = self._estimate_position(len(queue))
+            if not queue:
+                self._ready.append(user_id)
+            else:
+                self._depths[len(queue)] -= 1
+            queue.append((fn, args))
+            self._depths[len(queue)] += 1
+            self._pending += 1
+            self._cond.notify()
+            return position
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def _estimate_position(self, ahead_for_user: int) -> int:
+        """Jobs that will start before a new one under round-robin"""
+        free_slots = self.max_workers - self._active
+        # Chaque autre utilisateur passe au plus ahead_for_user + 1 tâches avant
+        ahead = sum(
+            users * min(depth, ahead_for_user + 1)
+            for depth, users in enumerate(self._depths)
+        )
+        # Les tâches de l'utilisateur lui-même ont été comptées dans la somme
+        return max(0, ahead - free_slots + 1)
+
+    def _next_job(self) -> Optional[Tuple[Callable, tuple]]:
+        with self._cond:
+            while self._running and not self._ready:
+                self._cond.wait()
+            if not self._ready:
+                return None
+
+            user_id = self._ready.popleft()
+            queue = self._queues[user_id]
+            self._depths[len(queue)] -= 1
+            job = queue.popleft()
+            if queue:
+                self._depths[len(queue)] += 1
+                self._ready.append(user_id)
+            else:
+                del self._queues[user_id]
+            self._pending -= 1
+            self._active += 1
+            return job
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            fn, args = job
+            try:
+                fn(*args)
+            except Exception as e:
+                logger.error(f"Download job failed: {e}")
+            finally:
+                with self._cond:
+                    self._active -= 1
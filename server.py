@@ -1,6 +1,8 @@
-from flask import Flask
+from flask import Flask, Response, request
 from threading import Thread, Event
 from bot import YouTubeAudioDownloaderBot
+from config import Config
+from metrics import REGISTRY
 import logging
 import sys
 import atexit
@@ -24,6 +26,21 @@ bot_lock = Event()
 def home():
     return "Bot is alive!", 200
 
+@app.route(Config.WEBHOOK_PATH, methods=['POST'])
+def telegram_webhook():
+    bridge = bot_instance.webhook_bridge if bot_instance else None
+    if bridge is None:
+        return "Webhook inactive", 503
+    status = bridge.submit(
+        request.get_json(silent=True),
+        request.headers.get('X-Telegram-Bot-Api-Secret-Token')
+    )
+    return "", status
+
+@app.route('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 def run_flask():
     port = int(os.environ.get("PORT", 8080))
     app.run(host='0.0.0.0', port=port)
@@ -35,7 +52,7 @@ def start_bot():
             bot_lock.set()  # Marquer que le bot est en cours de démarrage
             if bot_instance is None:
                 bot_instance = YouTubeAudioDownloaderBot()
-                bot_instance.run(stop_event)
+                bot_instance.run(stop_event, webhook=True)
         except Exception as e:
             logger.error(f"Erreur lors du démarrage du bot : {e}")
             if bot_instance:
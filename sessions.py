@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class MediaRef:
+    """The few fields of a search result the conversation needs"""
+
+    __slots__ = ('id', 'title', 'url', 'duration', 'uploader', 'filesize', 'resolved')
+
+    def __init__(self, id: str, title: str, url: str, duration: float = 0,
+                 uploader: str = 'Unknown', filesize: int = 0, resolved: bool = False):
+        self.id = id
+        self.title = title
+        self.url = url
+        self.duration = duration
+        self.uploader = uploader
+        self.filesize = filesize
+        self.resolved = resolved
+
+    @classmethod
+    def from_summary(cls, summary: Dict[str, Any]) -> 'MediaRef':
+        """Build from a DownloadManager search summary"""
+        return cls(
+            summary['id'], summary['title'], summary['url'],
+            duration=summary.get('duration') or 0,
+            uploader=summary.get('uploader') or 'Unknown',
+            filesize=summary.get('filesize') or 0,
+            resolved=bool(summary.get('resolved'))
+        )
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Plain dict, as stored in jobs"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Session:
+    """Conversation state of one user"""
+
+    __slots__ = ('chat_id', 'message_id', 'results', 'selected', 'playlist', 'expires_at')
+
+    def __init__(self, chat_id: int):
+        self.chat_id = chat_id
+        # Message portant les boutons : les anciens messages ne sont plus valides
+        self.message_id: Optional[int] = None
+        self.results: Tuple[MediaRef, ...] = ()
+        self.selected: Optional[MediaRef] = None
+        self.playlist: Optional[Dict[str, Any]] = None
+        self.expires_at = 0.0
+
+
+class SessionStore:
+    """Per-user sessions expiring after ``ttl`` idle seconds, at most ``max_sessions``.
+
+    Sessions are kept in last-use order with a uniform TTL, so expired ones
+    are always at the head and the sweep done on each access is O(1)
+    amortized. Beyond ``max_sessions`` the least recently used is dropped.
+    Each session holds at most one page of results, so the cap bounds memory.
+    """
+
+    def __init__(self, ttl: float, max_sessions: int,
+                 on_evict: Optional[Callable[[int, Session], None]] = None):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.on_evict = on_evict
+        self.evictions = 0
+        self._sessions: 'OrderedDict[int, Session]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[Session]:
+        """The live session of a user, refreshing its TTL"""
+        evicted = []
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now, evicted)
+            session = self._sessions.get(user_id)
+            if session is not None:
+                self._touch(user_id, session, now)
+        self._notify(evicted)
+        return session
+
+    def open(self, user_id: int, chat_id: int) -> Session:
+        """The session of a user, created if needed"""
+        evicted = []
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now, evicted)
+            session = self._sessions.get(user_id)
+            if session is None:
+                session = self._sessions[user_id] = Session(chat_id)
+                while len(self._sessions) > self.max_sessions:
+                    evicted.append(self._sessions.popitem(last=False))
+                    self.evictions += 1
+            self._touch(user_id, session, now)
+        self._notify(evicted)
+        return session
+
+    def discard(self, user_id: int) -> Optional[Session]:
+        """Remove a session without notifying on_evict, returning it"""
+        with self._lock:
+            return self._sessions.pop(user_id, None)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _touch(self, user_id: int, session: Session, now: float):
+        session.expires_at = now + self.ttl
+        self._sessions.move_to_end(user_id)
+
+    def _expire(self, now: float, evicted: list):
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.expires_at > now:
+                break
+            evicted.append(self._sessions.popitem(last=False))
+            self.evictions += 1
+
+    def _notify(self, evicted: list):
+        # Hors du verrou : le callback peut toucher à l'état du dispatcher
+        if self.on_evict:
+            for user_id, session in evicted:
+                self.on_evict(user_id, session)
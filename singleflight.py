@@ -0,0 +1,73 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'callers')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.callers = 1
+
+
+class SingleFlight:
+    """Coalesce concurrent calls sharing the same key into one execution.
+
+    The first caller for a key runs the function, later callers arriving while
+    it is in flight block and receive the same result, or the same exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable, *args: Any,
+           on_done: Optional[Callable[[Any, int], None]] = None,
+           **kwargs: Any) -> Tuple[Any, bool]:
+        """Run fn once for all concurrent callers of key.
+
+        Returns ``(result, shared)`` where ``shared`` is True for callers that
+        attached to another caller's execution. ``on_done(result, callers)``
+        runs once on success, after the last caller has attached.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.callers += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                if call.error is None and on_done is not None:
+                    on_done(call.result, call.callers)
+            call.done.set()
+        return call.result, False
+
+    def callers(self, key: Hashable) -> int:
+        """Number of callers waiting on key, 0 when not in flight"""
+        with self._lock:
+            call = self._calls.get(key)
+            return call.callers if call else 0
+
+    def in_flight(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._calls
+
+    def __len__(self) -> int:
+        return len(self._calls)
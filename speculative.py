@@ -0,0 +1,167 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from download_manager import DownloadCancelled
+from metrics import SPECULATIONS
+
+logger = logging.getLogger(__name__)
+
+
+class Speculation:
+    """One background download, waiting to be claimed by its user"""
+
+    __slots__ = ('user_id', 'key', 'video', 'result', 'cancelled', 'done', 'timer')
+
+    def __init__(self, user_id: int, key: Tuple[str, str, str], video: Dict[str, Any]):
+        self.user_id = user_id
+        self.key = key
+        self.video = video
+        self.result: Optional[Tuple[str, Dict, float]] = None
+        self.cancelled = False
+        self.done = threading.Event()
+        self.timer: Optional[threading.Timer] = None
+
+    def take(self) -> Optional[Tuple[str, Dict, float]]:
+        """(path, info, size) if the download is over, else None.
+
+        The caller then owns the reference on the file and must release() it.
+        """
+        if not self.done.is_set():
+            return None
+        result, self.result = self.result, None
+        return result
+
+
+class SpeculativeDownloader:
+    """Download the MP3 of a selected video while its user picks a format.
+
+    At most ``max_active`` speculations exist at once (running or waiting to
+    be claimed), one per user. Picking MP3 claims the speculation; picking
+    another format, cancelling or waiting ``ttl`` seconds cancels it. A
+    cancelled download is aborted from its progress hook, unless another
+    request shares it, and its file is released.
+    """
+
+    def __init__(self, download_manager, max_active: int = 2, ttl: float = 120,
+                 format_type: str = 'mp3', quality: str = 'medium'):
+        self.download_manager = download_manager
+        self.max_active = max_active
+        self.ttl = ttl
+        self.format_type = format_type
+        self.quality = quality
+        self.started = 0
+        self.hits = 0
+        self._by_user: Dict[int, Speculation] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_active, thread_name_prefix='speculative')
+
+    def start(self, user_id: int, video: Dict[str, Any]):
+        """Start downloading video for user_id, replacing their previous speculation"""
+        key = (video['id'], self.format_type, self.quality)
+        with self._lock:
+            current = self._by_user.get(user_id)
+            if current is not None and current.key == key:
+                return
+        if current is not None:
+            self.cancel(user_id)
+
+        with self._lock:
+            if len(self._by_user) >= self.max_active:
+                SPECULATIONS.inc(outcome='skipped')
+                return
+            speculation = self._by_user[user_id] = Speculation(user_id, key, video)
+            speculation.timer = threading.Timer(self.ttl, self._expire, (speculation,))
+            speculation.timer.daemon = True
+            self.started += 1
+        speculation.timer.start()
+        self._executor.submit(self._run, speculation)
+
+    def claim(self, user_id: int, video_id: str, format_type: str,
+              quality: str) -> Optional[Speculation]:
+        """Take over the user's speculation if it matches, else cancel it"""
+        with self._lock:
+            speculation = self._by_user.get(user_id)
+            if speculation is None:
+                return None
+            if speculation.key != (video_id, format_type, quality):
+                speculation = None
+            else:
+                del self._by_user[user_id]
+                speculation.timer.cancel()
+                self.hits += 1
+        if speculation is None:
+            self.cancel(user_id)
+            return None
+        SPECULATIONS.inc(outcome='hit')
+        return speculation
+
+    def cancel(self, user_id: int, outcome: str = 'cancelled'):
+        """Abort the user's speculation and free its file"""
+        with self._lock:
+            speculation = self._by_user.pop(user_id, None)
+            if speculation is None:
+                return
+            speculation.cancelled = True
+            speculation.timer.cancel()
+            result, speculation.result = speculation.result, None
+        SPECULATIONS.inc(outcome=outcome)
+        # Encore en cours : _run libère le fichier à la fin
+        if result:
+            self.download_manager.release(result[0])
+
+    def discard(self, speculation: Speculation):
+        """Give up a claimed speculation that was not used"""
+        with self._lock:
+            speculation.cancelled = True
+            result, speculation.result = speculation.result, None
+        if result:
+            self.download_manager.release(result[0])
+
+    def hit_rate(self) -> float:
+        with self._lock:
+            return self.hits / self.started if self.started else 0.0
+
+    def shutdown(self):
+        for user_id in list(self._by_user):
+            self.cancel(user_id)
+        self._executor.shutdown(wait=False)
+
+    def _expire(self, speculation: Speculation):
+        with self._lock:
+            current = self._by_user.get(speculation.user_id) is speculation
+        if current:
+            self.cancel(speculation.user_id, outcome='expired')
+
+    def _run(self, speculation: Speculation):
+        def check(phase: str, percent: Optional[float] = None):
+            if speculation.cancelled:
+                raise DownloadCancelled()
+
+        video = speculation.video
+        result = None
+        try:
+            result = self.download_manager.download_media(
+                video['url'], format_type=self.format_type, quality=self.quality,
+                video_id=video['id'], progress_callback=check
+            )
+        except DownloadCancelled:
+            pass
+        except Exception as e:
+            logger.warning(f"Speculative download of {video['id']} failed: {e}")
+            with self._lock:
+                failed = self._by_user.get(speculation.user_id) is speculation
+                if failed:
+                    del self._by_user[speculation.user_id]
+                    speculation.timer.cancel()
+            if failed:
+                SPECULATIONS.inc(outcome='failed')
+
+        with self._lock:
+            keep = result is not None and not speculation.cancelled
+            if keep:
+                speculation.result = result
+        if result is not None and not keep:
+            self.download_manager.release(result[0])
+        speculation.done.set()
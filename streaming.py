@@ -0,0 +1,164 @@
+import http.client
+import logging
+import mimetypes
+import subprocess
+import urllib.request
+import uuid
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+from telegram import error as telegram_error
+from telegram.utils.request import Request
+
+from hashing import CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class SizeLimitExceeded(ValueError):
+    """Raised while streaming once the byte count passes the size limit"""
+
+
+class LimitedStream:
+    """Read-only stream that aborts as soon as more than ``max_bytes`` went through"""
+
+    def __init__(self, stream: BinaryIO, max_bytes: int,
+                 on_read: Optional[Callable[[int], None]] = None):
+        self._stream = stream
+        self.max_bytes = max_bytes
+        self.on_read = on_read
+        self.bytes_read = 0
+
+    def read(self, size: int = CHUNK_SIZE) -> bytes:
+        data = self._stream.read(size)
+        self.bytes_read += len(data)
+        if self.bytes_read > self.max_bytes:
+            raise SizeLimitExceeded(
+                f"Le fichier est trop volumineux (> {self.max_bytes // (1024 * 1024)}MB)"
+            )
+        if self.on_read and data:
+            self.on_read(self.bytes_read)
+        return data
+
+    def close(self):
+        self._stream.close()
+
+
+class TeeStream:
+    """Read-only stream writing everything read from it to ``sink`` as well"""
+
+    def __init__(self, stream: BinaryIO, sink: BinaryIO):
+        self._stream = stream
+        self._sink = sink
+
+    def read(self, size: int = CHUNK_SIZE) -> bytes:
+        data = self._stream.read(size)
+        self._sink.write(data)
+        return data
+
+    def close(self):
+        # Le lecteur peut fermer le tee : la source reste à vider par son propriétaire
+        pass
+
+
+class ProcessStream:
+    """Standard output of an FFmpeg process, checked for errors at the end"""
+
+    def __init__(self, args: List[str]):
+        self._process = subprocess.Popen(
+            args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+
+    def read(self, size: int = CHUNK_SIZE) -> bytes:
+        data = self._process.stdout.read(size)
+        if not data and self._process.wait() != 0:
+            stderr = self._process.stderr.read().decode(errors='replace').strip()
+            raise RuntimeError(f"FFmpeg error: {stderr}")
+        return data
+
+    def close(self):
+        if self._process.poll() is None:
+            self._process.kill()
+        self._process.wait()
+        self._process.stdout.close()
+        self._process.stderr.close()
+
+
+def open_http_stream(url: str, headers: Dict[str, str], timeout: float = 30) -> BinaryIO:
+    """Response body of a direct media URL"""
+    return urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout)
+
+
+def open_ffmpeg_stream(url: str, headers: Dict[str, str], output_args: List[str]) -> ProcessStream:
+    """FFmpeg reading a media URL and writing the result to its standard output"""
+    args = ['ffmpeg', '-loglevel', 'error', '-nostdin']
+    if headers:
+        args += ['-headers', ''.join(f"{k}: {v}\r\n" for k, v in headers.items())]
+    return ProcessStream(args + ['-i', url, '-vn', *output_args, 'pipe:1'])
+
+
+def iter_multipart(boundary: str, fields: Dict[str, Any], file_field: str,
+                   filename: str, stream: BinaryIO) -> Iterator[bytes]:
+    """multipart/form-data body whose file part is read from stream chunk by chunk"""
+    for name, value in fields.items():
+        if value is None:
+            continue
+        yield (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+            f'{value}\r\n'
+        ).encode()
+
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    yield (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+        f'Content-Type: {content_type}\r\n\r\n'
+    ).encode()
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+        yield chunk
+    yield f'\r\n--{boundary}--\r\n'.encode()
+
+
+def post_stream(url: str, fields: Dict[str, Any], file_field: str, filename: str,
+                stream: BinaryIO, timeout: float = 120) -> Any:
+    """Upload a stream to a Bot API method with a chunked multipart request.
+
+    The body is produced while it is sent, so nothing is buffered beyond one
+    chunk. Errors are mapped to the same exceptions python-telegram-bot raises.
+    """
+    parts = urlsplit(url)
+    connection_class = (
+        http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    )
+    connection = connection_class(parts.netloc, timeout=timeout)
+    boundary = uuid.uuid4().hex
+    try:
+        connection.request(
+            'POST',
+            parts.path + (f'?{parts.query}' if parts.query else ''),
+            body=iter_multipart(boundary, fields, file_field, filename, stream),
+            headers={'Content-Type': f'multipart/form-data; boundary={boundary}'},
+            encode_chunked=True
+        )
+        response = connection.getresponse()
+        data = response.read()
+    except (OSError, http.client.HTTPException) as e:
+        raise telegram_error.NetworkError(f"Streaming upload failed: {e}") from e
+    finally:
+        connection.close()
+
+    if 200 <= response.status <= 299:
+        return Request._parse(data)
+
+    try:
+        message = str(Request._parse(data))
+    except (telegram_error.RetryAfter, telegram_error.ChatMigrated):
+        raise
+    except telegram_error.TelegramError:
+        message = 'Unknown HTTPError'
+    if response.status == 400:
+        raise telegram_error.BadRequest(message)
+    if response.status in (401, 403):
+        raise telegram_error.Unauthorized(message)
+    raise telegram_error.NetworkError(f'{message} ({response.status})')
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pytest
+
+# Les modules du bot sont à la racine du dépôt
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def redis_url():
+    """URL of a Redis server for the Redis backends, skipped when there is none"""
+    redis = pytest.importorskip('redis')
+    url = os.getenv('REDIS_TEST_URL', 'redis://localhost:6379/15')
+    client = redis.Redis.from_url(url, socket_connect_timeout=0.5)
+    try:
+        client.ping()
+    except redis.exceptions.ConnectionError:
+        pytest.skip(f"No Redis server at {url}")
+    finally:
+        client.close()
+    return url
+
+
+@pytest.fixture
+def downloader_bot(tmp_path, monkeypatch):
+    """YouTubeAudioDownloaderBot on a temporary directory, without Telegram"""
+    from config import Config
+    from fakes import FakeBot
+
+    downloads = tmp_path / 'downloads'
+    downloads.mkdir()
+    monkeypatch.setattr(Config, '_loaded', True)
+    monkeypatch.setattr(Config, 'DOWNLOAD_DIR', str(downloads))
+    monkeypatch.setattr(Config, 'MEDIA_CACHE_DIR', str(downloads / 'cache'))
+    monkeypatch.setattr(Config, 'DB_PATH', str(tmp_path / 'bot.sqlite'))
+    monkeypatch.setattr(Config, 'JOB_QUEUE_URL', '')
+
+    from bot import YouTubeAudioDownloaderBot
+    instance = YouTubeAudioDownloaderBot()
+    instance.db.initialize()
+    instance.bot = FakeBot()
+    yield instance
+    instance.db.close()
@@ -0,0 +1,66 @@
+"""Stand-ins for the python-telegram-bot objects the handlers touch"""
+import contextlib
+from types import SimpleNamespace
+
+
+class FakeMessage:
+    def __init__(self, chat_id: int = 1, message_id: int = 10, text: str = ''):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.text = text
+        self.replies = []
+        self.edits = []
+
+    def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+        return FakeMessage(self.chat_id, self.message_id + len(self.replies))
+
+    def edit_text(self, text, **kwargs):
+        self.edits.append(text)
+        return self
+
+
+class FakeQuery:
+    def __init__(self, data: str, user_id: int = 1, message: FakeMessage = None):
+        self.data = data
+        self.from_user = SimpleNamespace(id=user_id)
+        self.message = message or FakeMessage()
+        self.edits = []
+
+    def answer(self):
+        pass
+
+    def edit_message_text(self, text, **kwargs):
+        self.edits.append(text)
+
+
+class FakeBot:
+    """Records the Bot API calls made outside of the handlers"""
+
+    def __init__(self):
+        self.calls = []
+
+    def interactive(self):
+        return contextlib.nullcontext()
+
+    def edit_message_text(self, text, **kwargs):
+        self.calls.append(('edit_message_text', text, kwargs))
+
+    def send_audio(self, chat_id, media, **kwargs):
+        self.calls.append(('send_audio', media, kwargs))
+
+    def send_video(self, chat_id, media, **kwargs):
+        self.calls.append(('send_video', media, kwargs))
+
+    def texts(self):
+        return [call[1] for call in self.calls if call[0] == 'edit_message_text']
+
+
+def make_update(user_id: int = 1, message: FakeMessage = None, query: FakeQuery = None):
+    chat_id = (message or (query and query.message) or FakeMessage()).chat_id
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=user_id),
+        effective_chat=SimpleNamespace(id=chat_id),
+        message=message,
+        callback_query=query
+    )
@@ -0,0 +1,87 @@
+import contextlib
+
+import pytest
+
+import cache as cache_module
+from cache import Cache, normalize_query
+from fakes import FakeMessage, make_update
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, 'monotonic', clock.monotonic)
+    return clock
+
+
+def test_equivalent_queries_share_an_entry():
+    assert normalize_query('  Daft   PUNK ') == normalize_query('daft punk')
+    assert (normalize_query('https://youtu.be/dQw4w9WgXcQ')
+            == normalize_query('https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=1'))
+
+
+def test_results_expire_after_ttl(clock):
+    cache = Cache(ttl=100, negative_ttl=10)
+    cache.set_search_results('query', ('result',))
+    clock.now += 99
+    assert cache.get_search_results('Query') == ('result',)
+    clock.now += 2
+    assert cache.get_search_results('query') is None
+    assert cache.stats()['size'] == 0
+
+
+def test_empty_results_use_the_negative_ttl(clock):
+    cache = Cache(ttl=100, negative_ttl=10)
+    cache.set_search_results('nothing', ())
+    clock.now += 9
+    assert cache.get_search_results('nothing') == ()
+    clock.now += 2
+    assert cache.get_search_results('nothing') is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = Cache(max_size=2)
+    cache.set_search_results('a', ('a',))
+    cache.set_search_results('b', ('b',))
+    assert cache.get_search_results('a')
+    cache.set_search_results('c', ('c',))
+    assert cache.get_search_results('b') is None
+    assert cache.get_search_results('a') and cache.get_search_results('c')
+
+
+def test_search_errors_are_not_negative_cached(downloader_bot, monkeypatch):
+    def failing(query):
+        raise RuntimeError('network down')
+
+    monkeypatch.setattr(downloader_bot.download_manager, 'search_video', failing)
+    message = FakeMessage(text='daft punk')
+    downloader_bot.search_audio(make_update(message=message), None)
+    assert downloader_bot.cache.get_search_results('daft punk') is None
+
+    monkeypatch.setattr(downloader_bot.download_manager, 'search_video', lambda query: [])
+    downloader_bot.search_audio(make_update(message=FakeMessage(text='daft punk')), None)
+    # Un vrai « aucun résultat » est gardé pendant le TTL négatif
+    assert downloader_bot.cache.get_search_results('daft punk') == ()
+
+
+def test_search_video_raises_extraction_errors(downloader_bot, monkeypatch):
+    class BrokenYDL:
+        def extract_info(self, target, download=False):
+            raise RuntimeError('HTTP Error 503')
+
+    @contextlib.contextmanager
+    def acquire(profile):
+        yield BrokenYDL()
+
+    manager = downloader_bot.download_manager
+    monkeypatch.setattr(manager._pool, 'acquire', acquire)
+    with pytest.raises(RuntimeError):
+        manager.search_video('daft punk')
@@ -0,0 +1,121 @@
+import sqlite3
+import threading
+
+import pytest
+
+import db_models
+from db_models import Database
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / 'bot.sqlite'))
+    database.initialize()
+    yield database
+    database.close()
+
+
+def logged_users(db):
+    with db._connect() as conn:
+        return {row[0] for row in conn.execute('SELECT user_id FROM downloads')}
+
+
+def test_bad_row_does_not_drop_the_batch(db):
+    db.log_download(1, {'id': 'a', 'title': 'A'}, 'h1', 'mp3', 1.0)
+    # Paramètre impossible à lier : échoue au milieu du lot
+    db.log_download(2, {'id': 'b', 'title': 'B'}, 'h2', 'mp3', object())
+    db.log_download(3, {'id': 'c', 'title': 'C'}, 'h3', 'mp3', 3.0)
+    db.flush()
+    assert logged_users(db) == {1, 3}
+
+
+def test_writer_survives_unexpected_errors(db):
+    def broken(cursor):
+        raise RuntimeError('boom')
+
+    db._write_queue.put((broken, ()))
+    db.log_download(4, {'id': 'd', 'title': 'D'}, 'h4', 'mp3', 1.0)
+    db.flush()
+    assert db._writer.is_alive()
+    db.log_download(5, {'id': 'e', 'title': 'E'}, 'h5', 'mp3', 1.0)
+    db.flush()
+    assert logged_users(db) == {4, 5}
+
+
+def test_transient_error_retries_the_batch(db, monkeypatch):
+    monkeypatch.setattr(db_models, 'WRITE_RETRY_DELAY', 0)
+    failures = [sqlite3.OperationalError('database is locked')]
+    commit = db._commit
+
+    def flaky_commit(writes):
+        if failures:
+            raise failures.pop()
+        commit(writes)
+
+    monkeypatch.setattr(db, '_commit', flaky_commit)
+    db.log_download(6, {'id': 'f', 'title': 'F'}, 'h6', 'mp3', 1.0)
+    db.log_download(7, {'id': 'g', 'title': 'G'}, 'h7', 'mp3', 1.0)
+    db.flush()
+    assert logged_users(db) == {6, 7}
+
+
+def test_connections_of_finished_threads_are_closed(db):
+    for _ in range(50):
+        thread = threading.Thread(target=db.get_user_stats, args=(1,))
+        thread.start()
+        thread.join()
+    # Le writer, le thread courant et au plus le dernier thread terminé
+    assert len(db._connections) <= 3
+
+
+def create_legacy_database(path):
+    """Schema and rows of a database written before the user_stats migration"""
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT,
+            last_name TEXT, language TEXT DEFAULT 'en', join_date DATETIME,
+            total_downloads INTEGER DEFAULT 0, total_size REAL DEFAULT 0,
+            last_download_date DATETIME);
+        CREATE TABLE downloads (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER,
+            video_id TEXT, title TEXT, download_date DATETIME, file_hash TEXT,
+            quality TEXT, file_size REAL);
+        CREATE TABLE favorites (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER,
+            video_id TEXT, title TEXT, added_date DATETIME);
+        INSERT INTO downloads (user_id, video_id, download_date, file_size) VALUES
+            (1, 'a', '2024-01-01 10:00:00', 2.0),
+            (1, 'a', '2024-01-02 10:00:00', 2.0),
+            (1, 'b', '2024-01-03 10:00:00', 1.5),
+            (2, 'c', '2024-01-04 10:00:00', 4.0);
+        INSERT INTO favorites (user_id, video_id) VALUES (1, 'a'), (3, 'z');
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def test_migration_backfills_user_stats(tmp_path):
+    path = str(tmp_path / 'legacy.sqlite')
+    create_legacy_database(path)
+    database = Database(path)
+    database.initialize()
+    try:
+        assert database.get_user_stats(1) == (3, '2024-01-03 10:00:00', 2, 1, 5.5)
+        assert database.get_user_stats(2) == (1, '2024-01-04 10:00:00', 1, 0, 4.0)
+        # Seulement des favoris
+        assert database.get_user_stats(3)[3] == 1
+    finally:
+        database.close()
+
+
+def test_triggers_keep_user_stats_up_to_date(db):
+    for video_id, size in (('a', 2.0), ('a', 2.0), ('b', 1.0)):
+        db.log_download(1, {'id': video_id, 'title': video_id}, 'h', 'mp3', size)
+    db.flush()
+    total, last, unique, favorites, size = db.get_user_stats(1)
+    assert (total, unique, favorites, size) == (3, 2, 0, 5.0)
+    assert last is not None
+
+    with db._connect() as conn:
+        conn.execute("INSERT INTO favorites (user_id, video_id) VALUES (1, 'a'), (1, 'b')")
+        conn.execute("DELETE FROM favorites WHERE video_id = 'a'")
+    assert db.get_user_stats(1)[3] == 1
+    assert db.get_user_stats(2) is None
@@ -0,0 +1,100 @@
+import os
+import sys
+import threading
+
+import pytest
+
+from config import Config
+from format_planner import plan_format
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'benchmarks'))
+from fake_youtube import FakeYouTubeServer  # noqa: E402
+
+pytest.importorskip('yt_dlp')
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def media_server():
+    server = FakeYouTubeServer(media_size=64 * 1024)
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def download_manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'DOWNLOAD_DIR', str(tmp_path))
+    from download_manager import DownloadManager
+    return DownloadManager()
+
+
+def test_downloads_the_planned_format_not_the_profile_default(media_server, download_manager):
+    # Le profil 'audio-source' choisirait bestaudio (a2) ; a2 dépasse la limite
+    info = {
+        'id': 'planned', 'title': 'Planned', 'duration': 60,
+        'extractor': 'generic', 'extractor_key': 'Generic',
+        'webpage_url': media_server.media_url('planned'),
+        'formats': [
+            dict(format_id='a1', url=media_server.media_url('a1'), ext='m4a', abr=64,
+                 filesize=64 * 1024, vcodec='none', acodec='mp4a', protocol='http'),
+            dict(format_id='a2', url=media_server.media_url('a2'), ext='m4a', abr=160,
+                 filesize=80 * MB, vcodec='none', acodec='mp4a', protocol='http'),
+        ]
+    }
+    plan = plan_format(info, 'mp3', 'medium', Config.AUDIO_QUALITIES, 50 * MB)
+    assert plan.format_id == 'a1'
+
+    downloaded = download_manager._download_planned(info, 'audio-source', plan)
+    assert downloaded['format_id'] == plan.format_id
+    assert media_server.requests.get('a2', 0) == 0
+    assert os.path.exists(download_manager._output_path(downloaded))
+
+
+def test_each_download_profile_writes_its_own_files(download_manager):
+    # Un MP3 et un audio natif de la même vidéo ne doivent jamais partager un fichier
+    templates = [
+        opts['outtmpl'] for name, opts in download_manager._build_profiles().items()
+        if name not in ('search', 'resolve', 'playlist')
+    ]
+    assert len(templates) == len(set(templates))
+
+
+def test_concurrent_downloads_share_one_file(tmp_path, download_manager, monkeypatch):
+    release = threading.Event()
+    runs = []
+
+    def fake_download(url, format_type, quality, key=None):
+        runs.append(url)
+        release.wait(5)
+        path = tmp_path / f"{key[0]}.{format_type}"
+        path.write_bytes(b'media')
+        return str(path), {'id': key[0]}, 0.1
+
+    monkeypatch.setattr(download_manager, '_download_media', fake_download)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(download_manager.download_media(
+            'https://example.com/v', format_type='mp4', video_id='shared'
+        )))
+        for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    while download_manager._inflight.callers(('shared', 'mp4', 'medium')) < 3:
+        pass
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(runs) == 1
+    paths = {path for path, _, _ in results}
+    assert len(paths) == 1
+    path = paths.pop()
+    # Chaque appelant rend sa référence ; le dernier supprime le fichier
+    download_manager.release(path)
+    download_manager.release(path)
+    assert os.path.exists(path)
+    download_manager.release(path)
+    assert not os.path.exists(path)
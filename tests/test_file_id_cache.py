@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from cache import FileIdCache
+from db_models import Database
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / 'bot.sqlite'))
+    database.initialize()
+    yield database
+    database.close()
+
+
+def age_entry(db, video_id, days):
+    with db._connect() as conn:
+        conn.execute(
+            'UPDATE telegram_files SET created_date = ? WHERE video_id = ?',
+            (datetime.now() - timedelta(days=days), video_id)
+        )
+
+
+def test_hit_after_put_and_miss_for_other_keys(db):
+    cache = FileIdCache(db)
+    assert cache.get('a', 'mp3', 'medium') is None
+    cache.put('a', 'mp3', 'medium', 'FILE_A', 'hash-a', 3.5)
+    entry = cache.get('a', 'mp3', 'medium')
+    assert (entry['file_id'], entry['file_hash'], entry['file_size']) == ('FILE_A', 'hash-a', 3.5)
+    # Format et qualité font partie de la clé
+    assert cache.get('a', 'mp4', 'medium') is None
+    assert cache.get('a', 'mp3', 'high') is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 3
+
+
+def test_expired_entry_is_deleted(db):
+    cache = FileIdCache(db, max_age=24 * 60 * 60)
+    cache.put('a', 'mp3', 'medium', 'FILE_A', 'hash-a', 1.0)
+    age_entry(db, 'a', days=2)
+    assert cache.get('a', 'mp3', 'medium') is None
+    assert db.get_telegram_file('a', 'mp3', 'medium') is None
+
+
+def test_invalidate_forgets_the_file_id(db):
+    cache = FileIdCache(db)
+    cache.put('a', 'mp3', 'medium', 'FILE_A', 'hash-a', 1.0)
+    cache.invalidate('a', 'mp3', 'medium')
+    assert cache.get('a', 'mp3', 'medium') is None
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_prune_keeps_the_most_recently_used(db):
+    cache = FileIdCache(db, max_size=2, prune_every=4)
+    for video_id in ('a', 'b', 'c'):
+        cache.put(video_id, 'mp3', 'medium', f"FILE_{video_id}", 'h', 1.0)
+    # 'a' est relu : c'est 'b' le moins récemment utilisé
+    assert cache.get('a', 'mp3', 'medium')
+    db.flush()
+    cache.put('d', 'mp3', 'medium', 'FILE_d', 'h', 1.0)
+    remaining = {v for v in 'abcd' if db.get_telegram_file(v, 'mp3', 'medium')}
+    assert remaining == {'a', 'd'}
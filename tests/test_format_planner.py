@@ -0,0 +1,54 @@
+import pytest
+
+from format_planner import plan_format
+
+QUALITIES = {'low': '96', 'medium': '192', 'high': '320'}
+MB = 1024 * 1024
+
+
+def audio(format_id, abr, size=None, ext='m4a'):
+    return {'format_id': format_id, 'abr': abr, 'filesize': size, 'ext': ext,
+            'vcodec': 'none', 'acodec': 'mp4a'}
+
+
+def video(format_id, height, size=None):
+    return {'format_id': format_id, 'height': height, 'tbr': height, 'filesize': size,
+            'ext': 'mp4', 'vcodec': 'avc1', 'acodec': 'mp4a'}
+
+
+def test_best_audio_that_fits():
+    info = {'duration': 60, 'formats': [audio('a1', 64, MB), audio('a2', 160, 80 * MB)]}
+    plan = plan_format(info, 'audio', 'medium', QUALITIES, 50 * MB)
+    assert plan.format_id == 'a1'
+
+
+def test_native_audio_prefers_m4a():
+    info = {'duration': 60, 'formats': [audio('opus', 160, MB, ext='webm'), audio('aac', 128, MB)]}
+    assert plan_format(info, 'audio', 'medium', QUALITIES, 50 * MB).format_id == 'aac'
+    assert plan_format(info, 'mp3', 'medium', QUALITIES, 50 * MB).format_id == 'opus'
+
+
+def test_mp3_quality_lowered_to_fit():
+    # 192 kbps pendant 40 min ≈ 55 MB, 96 kbps ≈ 27 MB
+    info = {'duration': 2400, 'formats': [audio('a1', 128, 10 * MB)]}
+    plan = plan_format(info, 'mp3', 'medium', QUALITIES, 50 * MB)
+    assert (plan.format_id, plan.quality) == ('a1', 'low')
+
+
+def test_video_capped_at_720p():
+    info = {'duration': 60, 'formats': [video('1080', 1080, MB), video('720', 720, MB),
+                                        video('360', 360, MB)]}
+    assert plan_format(info, 'mp4', 'medium', QUALITIES, 50 * MB).format_id == '720'
+
+
+def test_unknown_size_only_when_nothing_known_fits():
+    info = {'duration': None, 'formats': [audio('big', 160, 80 * MB), audio('unknown', 128)]}
+    assert plan_format(info, 'audio', 'medium', QUALITIES, 50 * MB).format_id == 'unknown'
+    info['formats'].append(audio('small', 64, MB))
+    assert plan_format(info, 'audio', 'medium', QUALITIES, 50 * MB).format_id == 'small'
+
+
+def test_nothing_fits():
+    info = {'duration': 60, 'formats': [audio('a1', 160, 80 * MB)]}
+    with pytest.raises(ValueError):
+        plan_format(info, 'audio', 'medium', QUALITIES, 50 * MB)
@@ -0,0 +1,38 @@
+import hashlib
+import io
+
+from hashing import HashingReader, hash_file
+
+DATA = bytes(range(256)) * 5000
+
+
+def test_hash_file_matches_hashlib(tmp_path):
+    path = tmp_path / 'media.bin'
+    path.write_bytes(DATA)
+    assert hash_file(str(path), 'sha256') == hashlib.sha256(DATA).hexdigest()
+    empty = tmp_path / 'empty.bin'
+    empty.write_bytes(b'')
+    assert hash_file(str(empty), 'sha256') == hashlib.sha256(b'').hexdigest()
+
+
+def test_reader_hashes_what_the_upload_reads():
+    reader = HashingReader(io.BytesIO(DATA), 'sha256')
+    # Lecture par morceaux, comme l'envoi multipart
+    while reader.read(4096):
+        pass
+    assert reader.bytes_read == len(DATA)
+    assert reader.hexdigest() == hashlib.sha256(DATA).hexdigest()
+
+
+def test_hexdigest_reads_what_the_consumer_left():
+    reader = HashingReader(io.BytesIO(DATA), 'sha256')
+    reader.read(1000)
+    assert reader.hexdigest() == hashlib.sha256(DATA).hexdigest()
+    assert reader.bytes_read == len(DATA)
+
+
+def test_reader_closes_the_file():
+    fileobj = io.BytesIO(DATA)
+    with HashingReader(fileobj) as reader:
+        reader.read(10)
+    assert fileobj.closed
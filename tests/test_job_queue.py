@@ -0,0 +1,146 @@
+import time
+import uuid
+
+import pytest
+
+from job_queue import JobQueue, RedisJobQueue, SQLiteJobQueue
+from scheduler import QueueFull
+
+
+def make_queue(tmp_path, **kwargs):
+    return SQLiteJobQueue(str(tmp_path / 'jobs.sqlite'), **kwargs)
+
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def open_queue(request, tmp_path):
+    """Factory of queues for each backend (Redis skipped without a server)"""
+    queues = []
+
+    def factory(**kwargs):
+        if request.param == 'sqlite':
+            queue = make_queue(tmp_path, **kwargs)
+        else:
+            url = request.getfixturevalue('redis_url')
+            queue = RedisJobQueue(url, prefix=f"test:{uuid.uuid4().hex}", **kwargs)
+        queues.append(queue)
+        return queue
+
+    yield factory
+    for queue in queues:
+        if isinstance(queue, RedisJobQueue):
+            queue._redis.delete(*queue._keys.values())
+        queue.close()
+
+
+def drain(queue):
+    order = []
+    while True:
+        lease = queue.lease('worker', timeout=0)
+        if lease is None:
+            return order
+        order.append(lease.job['name'])
+        queue.ack(lease)
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        JobQueue()
+
+
+def test_round_robin_between_users(tmp_path):
+    queue = make_queue(tmp_path)
+    for name in ('a1', 'a2', 'a3'):
+        queue.put(1, {'name': name})
+    assert queue.put(2, {'name': 'b1'}) == 1
+    queue.put(2, {'name': 'b2'})
+    with pytest.raises(QueueFull):
+        queue.put(1, {'name': 'a4'})
+    assert drain(queue) == ['a1', 'b1', 'a2', 'b2', 'a3']
+
+
+def test_expired_lease_is_redelivered(tmp_path):
+    queue = make_queue(tmp_path, lease_seconds=0.05, max_attempts=2)
+    queue.put(1, {'name': 'a1'})
+    first = queue.lease('crashed', timeout=0)
+    assert queue.lease('worker', timeout=0) is None
+    time.sleep(0.1)
+    second = queue.lease('worker', timeout=0)
+    assert second.job_id == first.job_id
+    assert second.attempts == 2
+    # Le premier travailleur a perdu son bail
+    assert not queue.heartbeat(first)
+    queue.ack(first)
+    assert queue.heartbeat(second)
+    queue.ack(second)
+    assert queue.pending() == 0
+
+
+def test_dropped_job_keeps_user_ranks_fair(tmp_path):
+    queue = make_queue(tmp_path, lease_seconds=0.05, max_attempts=1)
+    for name in ('a1', 'a2', 'a3'):
+        queue.put(1, {'name': name})
+    for name in ('b1', 'b2'):
+        queue.put(2, {'name': name})
+    queue.lease('crashed', timeout=0)
+    time.sleep(0.1)
+    # a1 a épuisé ses tentatives : son tour est passé, les tâches suivantes
+    # de l'utilisateur avancent d'un rang
+    assert drain(queue) == ['b1', 'a2', 'b2', 'a3']
+    # Une place s'est libérée pour l'utilisateur
+    queue.put(1, {'name': 'a4'})
+
+
+def test_pending_limit_per_user(open_queue):
+    queue = open_queue(max_pending_per_user=2)
+    assert queue.put(1, {'name': 'a1'}) == 0
+    assert queue.put(2, {'name': 'b1'}) == 1
+    queue.put(1, {'name': 'a2'})
+    with pytest.raises(QueueFull):
+        queue.put(1, {'name': 'a3'})
+    lease = queue.lease('worker', timeout=0)
+    queue.ack(lease)
+    # La tâche acquittée libère sa place
+    queue.put(1, {'name': 'a3'})
+    assert queue.pending() == 3
+
+
+def test_lease_is_exclusive_until_it_expires(open_queue):
+    queue = open_queue(lease_seconds=0.05, max_attempts=2)
+    queue.put(1, {'name': 'a1'})
+    first = queue.lease('crashed', timeout=0)
+    assert first.job == {'name': 'a1'} and first.attempts == 1
+    assert queue.lease('worker', timeout=0) is None
+    time.sleep(0.1)
+    second = queue.lease('worker', timeout=0)
+    assert second.job_id == first.job_id and second.attempts == 2
+    assert not queue.heartbeat(first)
+    # L'acquittement du bail perdu ne supprime pas la tâche
+    queue.ack(first)
+    assert queue.heartbeat(second)
+    queue.ack(second)
+    assert queue.lease('worker', timeout=0) is None
+
+
+def test_job_is_dropped_after_max_attempts(open_queue):
+    queue = open_queue(lease_seconds=0.05, max_attempts=1, max_pending_per_user=1)
+    queue.put(1, {'name': 'a1'})
+    queue.lease('crashed', timeout=0)
+    time.sleep(0.1)
+    assert queue.lease('worker', timeout=0) is None
+    # La place de l'utilisateur est rendue
+    queue.put(1, {'name': 'a2'})
+
+
+def test_released_job_comes_back_without_counting_an_attempt(open_queue):
+    queue = open_queue(lease_seconds=60, max_attempts=1)
+    queue.put(1, {'name': 'a1'})
+    refused = queue.lease('busy', timeout=0)
+    queue.release(refused, delay=0.1)
+    # Le bail rendu n'appartient plus au worker qui l'a refusé
+    assert not queue.heartbeat(refused)
+    assert queue.lease('worker', timeout=0) is None
+    time.sleep(0.15)
+    lease = queue.lease('worker', timeout=0)
+    assert lease.job == {'name': 'a1'} and lease.attempts == 1
+    queue.ack(lease)
+    assert queue.pending() == 0
@@ -0,0 +1,68 @@
+import hashlib
+from pathlib import Path
+
+import pytest
+
+from config import Config
+from hashing import HashingReader
+
+DATA = b'media' * 1000
+
+
+@pytest.fixture
+def environment(monkeypatch):
+    """Re-read the environment, restoring the settings afterwards"""
+    def read(**variables):
+        for name, value in variables.items():
+            monkeypatch.setenv(name, value)
+        Config._read_environment()
+
+    yield read
+    monkeypatch.undo()
+    Config._read_environment()
+
+
+@pytest.fixture
+def media_file(tmp_path):
+    path = tmp_path / 'abc.m4a'
+    path.write_bytes(DATA)
+    return str(path)
+
+
+def make_job():
+    return {
+        'user_id': 1, 'chat_id': 1, 'message_id': 10, 'format': 'audio',
+        'quality': 'medium', 'video': {'id': 'abc', 'title': 'Titre'}
+    }
+
+
+def logged_hash(bot):
+    bot.db.flush()
+    with bot.db._connect() as conn:
+        return conn.execute('SELECT file_hash FROM downloads').fetchone()[0]
+
+
+def test_local_mode_raises_the_size_limit(environment):
+    environment(TELEGRAM_LOCAL_MODE='1', LOCAL_API_MAX_FILE_SIZE_MB='1500')
+    assert Config.MAX_FILE_SIZE_MB == 1500
+    environment(TELEGRAM_LOCAL_MODE='')
+    assert Config.MAX_FILE_SIZE_MB == Config.CLOUD_API_MAX_FILE_SIZE_MB
+
+
+def test_local_mode_sends_the_path(downloader_bot, media_file, monkeypatch):
+    monkeypatch.setattr(Config, 'TELEGRAM_LOCAL_MODE', True)
+    downloader_bot._upload_file(make_job(), media_file, {'id': 'abc'}, 0.005, cache_file=False)
+    method, media, kwargs = downloader_bot.bot.calls[0]
+    assert method == 'send_audio'
+    assert media == Path(media_file).resolve().as_uri()
+    assert kwargs['timeout'] == Config.LOCAL_API_UPLOAD_TIMEOUT
+    assert logged_hash(downloader_bot) == hashlib.new(Config.HASH_ALGORITHM, DATA).hexdigest()
+
+
+def test_cloud_mode_uploads_the_bytes(downloader_bot, media_file, monkeypatch):
+    monkeypatch.setattr(Config, 'TELEGRAM_LOCAL_MODE', False)
+    downloader_bot._upload_file(make_job(), media_file, {'id': 'abc'}, 0.005, cache_file=False)
+    method, media, kwargs = downloader_bot.bot.calls[0]
+    assert isinstance(media, HashingReader)
+    assert kwargs['filename'] == 'abc.m4a'
+    assert logged_hash(downloader_bot) == hashlib.new(Config.HASH_ALGORITHM, DATA).hexdigest()
@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+from db_models import Database
+from media_cache import MediaCache
+
+KB = 1024
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / 'bot.sqlite'))
+    database.initialize()
+    yield database
+    database.close()
+
+
+def make_source(tmp_path, name, size):
+    source = tmp_path / name
+    source.write_bytes(name.encode()[:1] * size)
+    return str(source)
+
+
+def indexed(db):
+    db.flush()
+    return [row['video_id'] for row in db.get_media_files()]
+
+
+def test_commit_of_a_vanished_source_is_skipped(tmp_path, db):
+    cache = MediaCache(db, str(tmp_path / 'cache'), max_bytes=1024 * 1024)
+    assert cache.commit('v1', 'mp3', 'medium', str(tmp_path / 'gone.mp3'), 'ab' * 32) is None
+    assert indexed(db) == []
+
+
+def test_commit_stores_the_file(tmp_path, db):
+    source = tmp_path / 'v1.mp3'
+    source.write_bytes(b'x' * 100)
+    cache = MediaCache(db, str(tmp_path / 'cache'), max_bytes=1024 * 1024)
+    path = cache.commit('v1', 'mp3', 'medium', str(source), 'ab' * 32)
+    assert path and open(path, 'rb').read() == b'x' * 100
+    assert ('v1', 'mp3', 'medium') in cache
+    assert indexed(db) == ['v1']
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path, db):
+    cache = MediaCache(db, str(tmp_path / 'cache'), max_bytes=25 * KB)
+    first = cache.commit('a', 'mp3', 'medium', make_source(tmp_path, 'a.mp3', 10 * KB), 'aa' * 32)
+    cache.commit('b', 'mp3', 'medium', make_source(tmp_path, 'b.mp3', 10 * KB), 'bb' * 32)
+    cache.commit('c', 'mp3', 'medium', make_source(tmp_path, 'c.mp3', 10 * KB), 'cc' * 32)
+    assert not os.path.exists(first)
+    assert ('a', 'mp3', 'medium') not in cache
+    assert indexed(db) == ['b', 'c']
+    assert cache.stats()['evictions'] == 1
+
+
+def test_quota_counts_the_files_of_other_processes(tmp_path, db):
+    # Deux processus : même base, même répertoire, chacun son index en mémoire
+    root = str(tmp_path / 'cache')
+    first = MediaCache(db, root, max_bytes=25 * KB)
+    second = MediaCache(db, root, max_bytes=25 * KB)
+    path_a = first.commit('a', 'mp3', 'medium', make_source(tmp_path, 'a.mp3', 10 * KB), 'aa' * 32)
+    second.commit('b', 'mp3', 'medium', make_source(tmp_path, 'b.mp3', 10 * KB), 'bb' * 32)
+    second.commit('c', 'mp3', 'medium', make_source(tmp_path, 'c.mp3', 10 * KB), 'cc' * 32)
+    assert not os.path.exists(path_a)
+    assert indexed(db) == ['b', 'c']
+    # L'index périmé de l'autre processus constate la disparition
+    assert first.acquire('a', 'mp3', 'medium') is None
+
+
+def test_pinned_file_is_removed_on_release(tmp_path, db):
+    cache = MediaCache(db, str(tmp_path / 'cache'), max_bytes=15 * KB)
+    cache.commit('a', 'mp3', 'medium', make_source(tmp_path, 'a.mp3', 10 * KB), 'aa' * 32)
+    pinned = cache.acquire('a', 'mp3', 'medium')
+    cache.commit('b', 'mp3', 'medium', make_source(tmp_path, 'b.mp3', 10 * KB), 'bb' * 32)
+    assert os.path.exists(pinned['path'])
+    cache.release(pinned['path'])
+    assert not os.path.exists(pinned['path'])
+
+
+def test_rebuild_keeps_the_lock_file(tmp_path, db):
+    cache = MediaCache(db, str(tmp_path / 'cache'), max_bytes=1024 * 1024)
+    cache.commit('a', 'mp3', 'medium', make_source(tmp_path, 'a.mp3', KB), 'aa' * 32)
+    cache.rebuild()
+    assert ('a', 'mp3', 'medium') in cache
+    assert os.path.exists(tmp_path / 'cache' / '.lock')
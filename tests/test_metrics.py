@@ -0,0 +1,53 @@
+import pytest
+
+from metrics import REGISTRY, Registry, STAGE_SECONDS, track
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram('latency_seconds', 'Latency', ('stage',), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe(value, stage='download')
+    text = registry.render()
+    assert 'latency_seconds_bucket{stage="download",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{stage="download",le="1"} 3' in text
+    assert 'latency_seconds_bucket{stage="download",le="+Inf"} 4' in text
+    assert 'latency_seconds_count{stage="download"} 4' in text
+    assert 'latency_seconds_sum{stage="download"} 6.05' in text
+
+
+def test_render_has_help_type_and_escaped_labels():
+    registry = Registry()
+    counter = registry.counter('errors_total', 'Errors', ('type',))
+    counter.inc(type='Say "hi"\n')
+    text = registry.render()
+    assert '# HELP errors_total Errors' in text
+    assert '# TYPE errors_total counter' in text
+    assert 'errors_total{type="Say \\"hi\\"\\n"} 1' in text
+
+
+def test_callback_gauges_are_read_at_scrape_time():
+    registry = Registry()
+    queue = [1, 2]
+    registry.gauge_callback('queued', 'Queued jobs', lambda: len(queue))
+    registry.counter_callback('lookups_total', 'Lookups', lambda: {('search', 'hit'): 3},
+                              ('cache', 'result'))
+    registry.gauge_callback('broken', 'Broken', lambda: 1 / 0)
+    assert 'queued 2' in registry.render()
+    queue.append(3)
+    text = registry.render()
+    assert 'queued 3' in text
+    assert 'lookups_total{cache="search",result="hit"} 3' in text
+    # Un callback en erreur est ignoré, pas tout le scrape
+    assert 'broken' not in text
+
+
+def test_track_times_stages_and_counts_errors():
+    before = STAGE_SECONDS.totals().get(('test_stage',), (0, 0))[0]
+    with track('test_stage'):
+        pass
+    with pytest.raises(ValueError):
+        with track('test_stage'):
+            raise ValueError('too big')
+    assert STAGE_SECONDS.totals()[('test_stage',)][0] == before + 2
+    assert 'ytdl_stage_errors_total{stage="test_stage",type="ValueError"} 1' in REGISTRY.render()
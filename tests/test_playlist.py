@@ -0,0 +1,65 @@
+import threading
+
+from playlist import PlaylistPipeline
+
+
+class FakeDownloadManager:
+    """Counts references like DownloadManager: one per download, one less per release"""
+
+    def __init__(self):
+        self.refs = {}
+        self.lock = threading.Lock()
+
+    def _acquire(self, path):
+        with self.lock:
+            self.refs[path] = self.refs.get(path, 0) + 1
+        return path
+
+    def download_source(self, url, quality, video_id=None):
+        return self._acquire(f"{video_id}.source.m4a"), {'id': video_id}, quality
+
+    def download_media(self, url, format_type, quality, video_id=None):
+        return self._acquire(f"{video_id}.{format_type}"), {'id': video_id}, 1.0
+
+    def transcode_audio(self, source, quality):
+        if 'bad' in source:
+            raise RuntimeError('FFmpeg error')
+        return self._acquire(f"{source}.mp3"), 1.0
+
+    def release(self, path):
+        with self.lock:
+            self.refs[path] -= 1
+
+
+class FakeDatabase:
+    def get_delivered_items(self, chat_id, playlist_id, format_type):
+        return set()
+
+    def mark_item_delivered(self, chat_id, playlist_id, format_type, video_id):
+        pass
+
+
+def run(format_type, ids):
+    manager = FakeDownloadManager()
+    delivered = []
+    entries = [{'id': i, 'title': i, 'url': f"https://example.com/{i}"} for i in ids]
+    pipeline = PlaylistPipeline(
+        manager, FakeDatabase(), 'PL1', entries, 1, format_type, 'medium',
+        deliver=lambda item: delivered.append(item['entry']['id'])
+    )
+    return pipeline.run(), manager, delivered
+
+
+def test_mp3_sources_are_released_once():
+    summary, manager, delivered = run('mp3', ['a', 'b', 'bad'])
+    assert sorted(delivered) == ['a', 'b']
+    assert [title for title, _ in summary['failed']] == ['bad']
+    # Les sources partagées sont rendues ; les MP3 privés sont supprimés du disque
+    assert manager.refs['a.source.m4a'] == 0
+    assert manager.refs['bad.source.m4a'] == 0
+
+
+def test_shared_media_is_released():
+    summary, manager, delivered = run('mp4', ['a', 'b'])
+    assert summary['delivered'] == 2
+    assert set(manager.refs.values()) == {0}
@@ -0,0 +1,95 @@
+import contextlib
+import threading
+
+from telegram import error as telegram_error
+
+from progress import ProgressFlusher, ProgressReporter
+from rate_limit import KeyedRateLimiter
+
+
+class FakeBot:
+    def __init__(self):
+        self.edits = []
+        self.retry_after = None
+        self.sending = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def interactive(self):
+        return contextlib.nullcontext()
+
+    def edit_message_text(self, text, **kwargs):
+        self.sending.set()
+        self.release.wait()
+        if self.retry_after:
+            raise telegram_error.RetryAfter(self.retry_after)
+        self.edits.append(text)
+
+
+def make_reporter(bot, key_rate=1000.0):
+    limiter = KeyedRateLimiter(None, None, key_rate=key_rate, key_capacity=1)
+    # Intervalle immense : les tests appellent flush() eux-mêmes
+    flusher = ProgressFlusher(interval=3600)
+    return ProgressReporter(bot, 1, 10, 'Titre', limiter, flusher), flusher
+
+
+def test_updates_only_record_the_latest_state():
+    bot = FakeBot()
+    reporter, flusher = make_reporter(bot)
+    for percent in range(0, 50, 3):
+        reporter('download', percent)
+    assert bot.edits == []
+    flusher.flush()
+    assert len(bot.edits) == 1 and '45' in bot.edits[0]
+    # Texte inchangé : pas de nouvelle édition
+    reporter('download', 47)
+    flusher.flush()
+    assert len(bot.edits) == 1
+
+
+def test_chat_limiter_drops_intermediate_states():
+    bot = FakeBot()
+    reporter, flusher = make_reporter(bot, key_rate=1 / 60)
+    reporter('download', 10)
+    flusher.flush()
+    reporter('download', 20)
+    reporter('transcode')
+    flusher.flush()
+    assert len(bot.edits) == 1
+    reporter.limiter.refund(1)
+    flusher.flush()
+    assert bot.edits[-1] == reporter._render('transcode', None)
+
+
+def test_retry_after_blocks_the_message():
+    bot = FakeBot()
+    bot.retry_after = 60
+    reporter, flusher = make_reporter(bot)
+    reporter('download', 10)
+    flusher.flush()
+    bot.retry_after = None
+    reporter('download', 50)
+    flusher.flush()
+    assert bot.edits == []
+
+
+def test_close_waits_for_the_edit_being_sent():
+    bot = FakeBot()
+    bot.release.clear()
+    reporter, flusher = make_reporter(bot)
+    reporter('download', 10)
+    sender = threading.Thread(target=flusher.flush)
+    sender.start()
+    bot.sending.wait(1)
+    closer = threading.Thread(target=reporter.close)
+    closer.start()
+    closer.join(0.1)
+    assert closer.is_alive()
+    bot.release.set()
+    closer.join(1)
+    sender.join(1)
+    # Rien après la fermeture : le message final reste affiché
+    reporter('upload')
+    flusher.flush()
+    assert len(bot.edits) == 1
+    assert len(flusher) == 0
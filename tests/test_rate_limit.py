@@ -0,0 +1,94 @@
+from telegram import Bot
+
+from config import Config
+from fakes import FakeQuery, make_update
+from rate_limit import KeyedRateLimiter, RateLimitedBot, SQLiteTokenBucket, open_token_bucket
+
+
+def test_multi_token_acquire_and_refund():
+    limiter = KeyedRateLimiter(None, None, key_rate=1 / 30, key_capacity=3)
+    assert limiter.try_acquire('user', 3)
+    assert not limiter.try_acquire('user')
+    assert limiter.wait_time('user', 3) > 60
+    limiter.refund('user', 3)
+    assert limiter.try_acquire('user', 2)
+    assert not limiter.try_acquire('user', 2)
+
+
+def test_charge_never_waits_and_delays_the_next_acquire():
+    limiter = KeyedRateLimiter(None, None, key_rate=1, key_capacity=1)
+    for _ in range(3):
+        limiter.charge('chat')
+    assert not limiter.try_acquire('chat')
+    assert limiter.wait_time('chat') > 2
+
+
+class RecordingLimiter(KeyedRateLimiter):
+    def __init__(self):
+        super().__init__(None, None, key_rate=1, key_capacity=1)
+        self.calls = []
+
+    def acquire(self, key, timeout=None):
+        self.calls.append(('acquire', key))
+        return super().acquire(key, timeout)
+
+    def charge(self, key, tokens=1):
+        self.calls.append(('charge', key))
+        super().charge(key, tokens)
+
+
+def test_interactive_calls_do_not_wait(monkeypatch):
+    monkeypatch.setattr(Bot, '_post', lambda self, endpoint, data=None, *args: True)
+    limiter = RecordingLimiter()
+    bot = RateLimitedBot('123:abc', limiter=limiter)
+    with bot.interactive():
+        for _ in range(3):
+            bot._post('sendMessage', {'chat_id': 1})
+    assert limiter.calls == [('charge', 1)] * 3
+    # Hors du dispatcher, la dette est remboursée avant l'envoi
+    assert limiter.wait_time(1) > 1
+    bot._post('sendMessage', {'chat_id': 2})
+    assert limiter.calls[-1] == ('acquire', 2)
+
+
+def test_sqlite_bucket_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite')
+    first = SQLiteTokenBucket(path, 'telegram', rate=0.1, capacity=2)
+    second = SQLiteTokenBucket(path, 'telegram', rate=0.1, capacity=2)
+    assert first.try_acquire()
+    assert second.try_acquire()
+    assert not first.try_acquire()
+    assert second.wait_time() > 5
+    first.refund()
+    assert second.try_acquire()
+    second.charge()
+    assert first.wait_time() > 5
+
+
+def test_limiter_with_shared_global_bucket(tmp_path):
+    url = f"sqlite:///{tmp_path / 'jobs.sqlite'}"
+    limiters = [
+        KeyedRateLimiter(None, None, key_rate=10, key_capacity=10,
+                         global_bucket=open_token_bucket(url, 'telegram', 0.1, 3))
+        for _ in range(2)
+    ]
+    taken = [limiter.try_acquire(chat) for chat in range(4) for limiter in limiters]
+    # Trois envois au total, quel que soit le processus
+    assert taken.count(True) == 3
+
+
+def test_redis_bucket(redis_url):
+    bucket = open_token_bucket(redis_url, 'test-bucket', rate=0.1, capacity=2)
+    bucket._redis.delete(bucket._key)
+    assert bucket.try_acquire(2)
+    assert not bucket.try_acquire()
+    bucket.refund(0.5)
+    assert 0 < bucket.wait_time() < 10
+
+
+def test_help_text_follows_the_download_limit(downloader_bot, monkeypatch):
+    monkeypatch.setattr(Config, 'RATE_LIMIT_SECONDS', 45)
+    monkeypatch.setattr(Config, 'USER_DOWNLOAD_BURST', 2)
+    query = FakeQuery('help')
+    downloader_bot.callback_handler(make_update(1, query=query), None)
+    assert "2 téléchargements d'affilée, puis un toutes les 45 secondes" in query.edits[-1]
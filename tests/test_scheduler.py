@@ -0,0 +1,36 @@
+import pytest
+
+from scheduler import DownloadScheduler, QueueFull
+
+
+def noop():
+    pass
+
+
+def test_position_counts_other_users_round_robin():
+    scheduler = DownloadScheduler(max_workers=1, max_pending_per_user=3)
+    assert scheduler.submit(1, noop) == 0
+    assert scheduler.submit(1, noop) == 1
+    assert scheduler.submit(1, noop) == 2
+    # Le deuxième utilisateur passe après la première tâche du premier
+    assert scheduler.submit(2, noop) == 1
+    assert scheduler.submit(2, noop) == 3
+
+
+def test_position_follows_dequeues():
+    scheduler = DownloadScheduler(max_workers=1, max_pending_per_user=3)
+    scheduler._running = True
+    for _ in range(3):
+        scheduler.submit(1, noop)
+    scheduler._next_job()
+    # Un worker occupé, deux tâches du premier utilisateur en attente
+    assert scheduler.submit(2, noop) == 2
+
+
+def test_queue_full():
+    scheduler = DownloadScheduler(max_workers=1, max_pending_per_user=2)
+    scheduler.submit(1, noop)
+    scheduler.submit(1, noop)
+    with pytest.raises(QueueFull):
+        scheduler.submit(1, noop)
+    assert scheduler.pending == 2
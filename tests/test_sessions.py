@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+
+import pytest
+
+import sessions
+from telegram.ext import ConversationHandler
+
+from fakes import FakeQuery, make_update
+from sessions import SessionStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sessions.time, 'monotonic', clock)
+    return clock
+
+
+def make_store(**kwargs):
+    evicted = []
+    store = SessionStore(on_evict=lambda user_id, session: evicted.append(user_id), **kwargs)
+    return store, evicted
+
+
+def test_idle_sessions_expire(clock):
+    store, evicted = make_store(ttl=60, max_sessions=10)
+    store.open(1, chat_id=1)
+    store.open(2, chat_id=2)
+    clock.now += 40
+    # L'accès repousse l'échéance
+    assert store.get(1) is not None
+    clock.now += 30
+    assert store.get(2) is None
+    assert store.get(1) is not None
+    assert evicted == [2]
+    assert len(store) == 1
+
+
+def test_least_recently_used_is_dropped_above_the_cap(clock):
+    store, evicted = make_store(ttl=60, max_sessions=2)
+    for user_id in (1, 2):
+        store.open(user_id, chat_id=user_id)
+    store.get(1)
+    store.open(3, chat_id=3)
+    assert evicted == [2]
+    assert store.evictions == 1
+    assert store.get(2) is None
+
+
+def test_discard_returns_the_session_without_notifying(clock):
+    store, evicted = make_store(ttl=60, max_sessions=10)
+    session = store.open(1, chat_id=5)
+    assert store.discard(1) is session
+    assert store.discard(1) is None
+    assert evicted == []
+
+
+def test_conversation_timeout_forgets_the_user(downloader_bot):
+    downloader_bot._dispatcher = SimpleNamespace(user_data={1: {'x': 1}}, chat_data={1: {}})
+    downloader_bot.sessions.open(1, chat_id=1)
+    downloader_bot.conversation_timeout(make_update(1), None)
+    assert downloader_bot.sessions.get(1) is None
+    assert downloader_bot._dispatcher.user_data == {}
+    assert downloader_bot._dispatcher.chat_data == {}
+
+
+def test_button_of_an_expired_session_ends_the_conversation(downloader_bot):
+    query = FakeQuery('plpage_1')
+    state = downloader_bot.process_download(make_update(1, query=query), None)
+    assert state == ConversationHandler.END
+    assert query.edits
@@ -0,0 +1,78 @@
+import threading
+
+from singleflight import SingleFlight
+
+
+def run_callers(flight, key, fn, count, **kwargs):
+    """Start count callers of key; fn blocks until the returned event is set"""
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(flight.do(key, fn, **kwargs))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def blocking(release, counter):
+    def fn():
+        counter.append(1)
+        release.wait(5)
+        return 'file'
+    return fn
+
+
+def wait_for_callers(flight, key, count):
+    while flight.callers(key) < count:
+        pass
+
+
+def test_concurrent_calls_run_once():
+    flight, release, runs, done = SingleFlight(), threading.Event(), [], []
+    threads, results, errors = run_callers(
+        flight, 'k', blocking(release, runs), 5,
+        on_done=lambda result, callers: done.append((result, callers))
+    )
+    wait_for_callers(flight, 'k', 5)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert runs == [1]
+    assert sorted(shared for _, shared in results) == [False] + [True] * 4
+    assert {result for result, _ in results} == {'file'}
+    # Une seule notification, une fois tous les appelants rattachés
+    assert done == [('file', 5)]
+    assert len(flight) == 0
+
+
+def test_error_is_shared_and_the_key_is_released():
+    flight, release = SingleFlight(), threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise RuntimeError('boom')
+
+    threads, results, errors = run_callers(flight, 'k', failing, 3)
+    wait_for_callers(flight, 'k', 3)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == [] and len(errors) == 3
+    assert not flight.in_flight('k')
+    # Un nouvel appel relance la fonction
+    assert flight.do('k', lambda: 'again') == ('again', False)
+
+
+def test_different_keys_do_not_wait_for_each_other():
+    flight, release, runs = SingleFlight(), threading.Event(), []
+    threads, _, _ = run_callers(flight, 'slow', blocking(release, runs), 1)
+    wait_for_callers(flight, 'slow', 1)
+    assert flight.do('other', lambda: 'fast') == ('fast', False)
+    release.set()
+    for thread in threads:
+        thread.join()
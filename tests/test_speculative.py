@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+from fakes import FakeQuery, make_update
+from sessions import MediaRef
+from speculative import SpeculativeDownloader
+
+VIDEO = {'id': 'v1', 'url': 'https://example.com/v1', 'title': 'Titre'}
+
+
+class FakeDownloadManager:
+    """download_media waits for finish (or a cancellation seen by its hook)"""
+
+    def __init__(self):
+        self.finish = threading.Event()
+        self.released = []
+
+    def download_media(self, url, format_type, quality, video_id, progress_callback):
+        while not self.finish.wait(0.01):
+            progress_callback('download', 10)
+        return f"/tmp/{video_id}.{format_type}", {'id': video_id}, 1.0
+
+    def release(self, path):
+        self.released.append(path)
+
+
+@pytest.fixture
+def speculative():
+    manager = FakeDownloadManager()
+    downloader = SpeculativeDownloader(manager, max_active=2, ttl=60)
+    yield downloader
+    manager.finish.set()
+    downloader.shutdown()
+
+
+def test_matching_format_claims_the_download(speculative):
+    speculative.start(1, VIDEO)
+    speculation = speculative.claim(1, 'v1', 'mp3', 'medium')
+    assert speculation is not None and speculation.take() is None
+    speculative.download_manager.finish.set()
+    assert speculation.done.wait(1)
+    assert speculation.take() == ('/tmp/v1.mp3', {'id': 'v1'}, 1.0)
+    assert speculative.hit_rate() == 1.0
+    assert speculative.download_manager.released == []
+
+
+def test_other_format_cancels_the_download(speculative):
+    speculative.start(1, VIDEO)
+    speculation = speculative._by_user[1]
+    assert speculative.claim(1, 'v1', 'mp4', 'medium') is None
+    # Le hook de progression interrompt le téléchargement
+    assert speculation.done.wait(1)
+    assert speculation.cancelled and speculation.take() is None
+    assert 1 not in speculative._by_user
+
+
+def test_cancel_after_the_download_releases_the_file(speculative):
+    speculative.download_manager.finish.set()
+    speculative.start(1, VIDEO)
+    assert speculative._by_user[1].done.wait(1)
+    speculative.cancel(1)
+    assert speculative.download_manager.released == ['/tmp/v1.mp3']
+
+
+def test_refused_download_cancels_the_speculation(downloader_bot, monkeypatch):
+    manager = FakeDownloadManager()
+    downloader_bot.speculative = speculative = SpeculativeDownloader(manager)
+    session = downloader_bot.sessions.open(1, chat_id=1)
+    session.message_id = 10
+    session.selected = MediaRef(VIDEO['id'], VIDEO['title'], VIDEO['url'])
+    speculative.start(1, VIDEO)
+    monkeypatch.setattr(downloader_bot, '_admit', lambda *args: 'Trop de téléchargements')
+    query = FakeQuery('format_mp3')
+    try:
+        downloader_bot.process_download(make_update(1, query=query), None)
+        assert query.edits[-1] == 'Trop de téléchargements'
+        assert 1 not in speculative._by_user
+    finally:
+        manager.finish.set()
+        speculative.shutdown()
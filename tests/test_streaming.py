@@ -0,0 +1,140 @@
+import io
+import os
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from config import Config
+from hashing import HashingReader
+from streaming import LimitedStream, SizeLimitExceeded, TeeStream
+
+DATA = b'media' * 4000
+KEY = ('v1', 'mp4', 'medium')
+
+
+def open_fake_stream(*args, progress_callback=None, **kwargs):
+    stream = LimitedStream(io.BytesIO(DATA), 1024 * 1024)
+    return stream, {'id': 'v1', 'title': 'Titre', 'duration': 60}, 'v1.mp4'
+
+
+@pytest.fixture
+def download_manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'DOWNLOAD_DIR', str(tmp_path))
+    from download_manager import DownloadManager
+    manager = DownloadManager()
+    monkeypatch.setattr(manager, 'open_stream', open_fake_stream)
+    return manager
+
+
+def read_all(stream, info, filename):
+    return b''.join(iter(stream.read, b''))
+
+
+def test_tee_writes_what_is_read():
+    sink = io.BytesIO()
+    tee = TeeStream(io.BytesIO(DATA), sink)
+    assert b''.join(iter(lambda: tee.read(1000), b'')) == DATA
+    assert sink.getvalue() == DATA
+
+
+def test_limited_stream_stops_above_the_limit():
+    stream = LimitedStream(io.BytesIO(DATA), 100)
+    with pytest.raises(SizeLimitExceeded):
+        stream.read(1000)
+
+
+def test_stream_is_written_to_a_shared_file(download_manager):
+    (path, info, size), consumed = download_manager.stream_media(
+        'https://example.com/v1', read_all, format_type='mp4', video_id='v1'
+    )
+    assert consumed == DATA
+    with open(path, 'rb') as f:
+        assert f.read() == DATA
+    assert info['id'] == 'v1' and size == len(DATA) / (1024 * 1024)
+    download_manager.release(path)
+    assert not os.path.exists(path)
+
+
+def test_concurrent_download_waits_for_the_stream(download_manager, monkeypatch):
+    attached = threading.Event()
+    monkeypatch.setattr(download_manager, '_download_media', lambda *args: pytest.fail())
+
+    def consume(stream, info, filename):
+        # Une seconde requête pour la même clé arrive pendant l'envoi
+        attached.wait(5)
+        return read_all(stream, info, filename)
+
+    results = []
+    follower = threading.Thread(target=lambda: results.append(download_manager.download_media(
+        'https://example.com/v1', format_type='mp4', video_id='v1'
+    )))
+    leader = threading.Thread(target=lambda: results.append(download_manager.stream_media(
+        'https://example.com/v1', consume, format_type='mp4', video_id='v1'
+    )))
+    leader.start()
+    while not download_manager._inflight.in_flight(KEY):
+        pass
+    follower.start()
+    while download_manager._inflight.callers(KEY) < 2:
+        pass
+    attached.set()
+    leader.join()
+    follower.join()
+
+    streamed = next(result for result in results if len(result) == 2)
+    (path, _, _), consumed = streamed
+    assert consumed == DATA
+    assert [result[0] for result in results if len(result) == 3] == [path]
+    download_manager.release(path)
+    assert os.path.exists(path)
+    download_manager.release(path)
+    assert not os.path.exists(path)
+
+
+def test_failed_upload_raises_and_releases_the_file(download_manager):
+    def consume(stream, info, filename):
+        stream.read(100)
+        raise RuntimeError('upload failed')
+
+    with pytest.raises(RuntimeError, match='upload failed'):
+        download_manager.stream_media(
+            'https://example.com/v1', consume, format_type='mp4', video_id='v1'
+        )
+    assert os.listdir(Config.DOWNLOAD_DIR) == []
+
+
+def test_unstreamable_format_is_downloaded(download_manager, tmp_path, monkeypatch):
+    path = tmp_path / 'v1.mp4'
+    path.write_bytes(DATA)
+    monkeypatch.setattr(download_manager, 'open_stream', lambda *args, **kwargs: None)
+    monkeypatch.setattr(
+        download_manager, '_download_media', lambda *args: (str(path), {'id': 'v1'}, 0.1)
+    )
+    result, consumed = download_manager.stream_media(
+        'https://example.com/v1', pytest.fail, format_type='mp4', video_id='v1'
+    )
+    assert result == (str(path), {'id': 'v1'}, 0.1) and consumed is None
+
+
+def test_streamed_upload_fills_the_caches(downloader_bot, monkeypatch):
+    monkeypatch.setattr(Config, 'STREAMING_UPLOADS', True)
+    monkeypatch.setattr(Config, 'TELEGRAM_LOCAL_MODE', False)
+    monkeypatch.setattr(downloader_bot.download_manager, 'open_stream', open_fake_stream)
+
+    def post_stream(job, stream, info, filename):
+        with HashingReader(stream) as media:
+            assert b''.join(iter(media.read, b'')) == DATA
+            message = SimpleNamespace(audio=None, video=SimpleNamespace(file_id='F1'))
+            return message, media.hexdigest()
+
+    monkeypatch.setattr(downloader_bot, '_post_stream', post_stream)
+    downloader_bot.execute_download({
+        'user_id': 1, 'chat_id': 1, 'message_id': 10, 'format': 'mp4', 'quality': 'medium',
+        'video': {'id': 'v1', 'title': 'Titre', 'url': 'https://example.com/v1'}
+    })
+    assert KEY in downloader_bot.media_cache
+    assert downloader_bot.file_id_cache.get(*KEY)['file_id'] == 'F1'
+    # Le fichier de travail est rendu, seule la copie du cache reste
+    leftovers = [entry.name for entry in os.scandir(Config.DOWNLOAD_DIR) if entry.is_file()]
+    assert leftovers == []
@@ -0,0 +1,59 @@
+import pytest
+
+from webhook import WebhookBridge
+
+
+class FakeDispatcher:
+    bot = None
+
+    def __init__(self, fail_on=()):
+        self.update_ids = []
+        self.fail_on = fail_on
+
+    def process_update(self, update):
+        if update.update_id in self.fail_on:
+            raise RuntimeError('handler failed')
+        self.update_ids.append(update.update_id)
+
+
+def test_submit_checks_the_secret_and_the_body():
+    bridge = WebhookBridge(FakeDispatcher(), 'secret')
+    assert bridge.submit({'update_id': 1}, None) == 403
+    assert bridge.submit({'update_id': 1}, 'wrong') == 403
+    assert bridge.submit(None, 'secret') == 400
+    assert bridge.submit({'update_id': 1}, 'secret') == 200
+    assert bridge.queue.qsize() == 1
+
+
+def test_full_queue_refuses_updates():
+    bridge = WebhookBridge(FakeDispatcher(), 'secret', maxsize=2)
+    assert [bridge.submit({'update_id': i}, 'secret') for i in range(3)] == [200, 200, 503]
+
+
+def test_updates_reach_the_dispatcher_in_order():
+    dispatcher = FakeDispatcher(fail_on={2})
+    bridge = WebhookBridge(dispatcher, 'secret')
+    bridge.start()
+    try:
+        for update_id in (1, 2, 3):
+            bridge.submit({'update_id': update_id}, 'secret')
+    finally:
+        bridge.stop()
+    # Une mise à jour en erreur n'arrête pas les suivantes
+    assert dispatcher.update_ids == [1, 3]
+
+
+def test_flask_route_answers_with_the_bridge_status(monkeypatch):
+    pytest.importorskip('flask')
+    import server
+
+    bridge = WebhookBridge(FakeDispatcher(), 'secret')
+    monkeypatch.setattr(server, 'bot_instance', type('Bot', (), {'webhook_bridge': bridge}))
+    client = server.app.test_client()
+    path = server.Config.WEBHOOK_PATH
+    assert client.post(path, json={'update_id': 1}).status_code == 403
+    response = client.post(path, json={'update_id': 1},
+                           headers={'X-Telegram-Bot-Api-Secret-Token': 'secret'})
+    assert response.status_code == 200
+    monkeypatch.setattr(server, 'bot_instance', None)
+    assert client.post(path, json={'update_id': 2}).status_code == 503
@@ -0,0 +1,43 @@
+import pytest
+
+from download_manager import DownloadCancelled
+from ydl_pool import YoutubeDLPool
+
+pytest.importorskip('yt_dlp')
+
+
+def make_pool():
+    return YoutubeDLPool({'search': {'quiet': True}}, max_per_profile=1,
+                         expected_errors=(DownloadCancelled,))
+
+
+def borrow_raising(pool, error):
+    with pytest.raises(type(error)):
+        with pool.acquire('search') as ydl:
+            raise error
+    return ydl
+
+
+def test_instance_is_reused():
+    pool = make_pool()
+    with pool.acquire('search') as first:
+        pass
+    with pool.acquire('search') as second:
+        pass
+    assert second is first
+    assert pool.stats() == {'search': {'size': 1, 'idle': 1}}
+
+
+def test_cancelled_download_keeps_the_instance():
+    pool = make_pool()
+    ydl = borrow_raising(pool, DownloadCancelled())
+    with pool.acquire('search') as again:
+        assert again is ydl
+
+
+def test_unexpected_error_recycles_the_instance():
+    pool = make_pool()
+    ydl = borrow_raising(pool, RuntimeError('boom'))
+    assert pool.stats() == {'search': {'size': 0, 'idle': 0}}
+    with pool.acquire('search') as again:
+        assert again is not ydl
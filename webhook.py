@@ -0,0 +1,64 @@
+import hmac
+import logging
+import queue
+import threading
+from typing import Any, Dict, Optional
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class WebhookBridge:
+    """Feed updates received by the web server to the dispatcher.
+
+    Requests are authenticated with the secret token Telegram sends in the
+    ``X-Telegram-Bot-Api-Secret-Token`` header, then queued in a bounded
+    queue. When the queue is full the request is refused so that Telegram
+    retries it later instead of the process buffering without limit.
+    """
+
+    def __init__(self, dispatcher, secret: str, maxsize: int = 256):
+        self.dispatcher = dispatcher
+        self.secret = secret
+        self.queue: queue.Queue = queue.Queue(maxsize)
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, data: Optional[Dict[str, Any]], secret: Optional[str]) -> int:
+        """Queue a raw update and return the HTTP status to answer with"""
+        if not hmac.compare_digest(secret or '', self.secret):
+            return 403
+        if not isinstance(data, dict):
+            return 400
+        try:
+            self.queue.put_nowait(data)
+        except queue.Full:
+            logger.warning("Webhook queue full, update refused")
+            return 503
+        return 200
+
+    def start(self):
+        """Start the thread handing queued updates to the dispatcher"""
+        self._thread = threading.Thread(
+            target=self._pump, name='webhook-dispatcher', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        if self._thread:
+            self.queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def _pump(self):
+        while True:
+            data = self.queue.get()
+            if data is _STOP:
+                return
+            try:
+                update = Update.de_json(data, self.dispatcher.bot)
+                self.dispatcher.process_update(update)
+            except Exception as e:
+                logger.error(f"Webhook update failed: {e}")
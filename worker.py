@@ -0,0 +1,41 @@
+import argparse
+import logging
+import signal
+import sys
+from threading import Event
+
+from bot import YouTubeAudioDownloaderBot
+
+# Configuration des logs
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO,
+    stream=sys.stdout
+)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Download/upload worker pulling jobs from JOB_QUEUE_URL"
+    )
+    parser.add_argument('--threads', type=int, default=None,
+                        help='jobs processed at the same time (default: WORKER_THREADS)')
+    args = parser.parse_args()
+
+    stop_event = Event()
+
+    def stop(signum, frame):
+        # Les tâches en cours se terminent ; les autres restent dans la file
+        logger.info("Arrêt du worker demandé...")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    bot = YouTubeAudioDownloaderBot()
+    bot.run_worker(stop_event, threads=args.threads)
+
+
+if __name__ == "__main__":
+    main()
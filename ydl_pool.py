@@ -0,0 +1,118 @@
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Deque, Dict, Iterator, Tuple, Type
+
+if TYPE_CHECKING:
+    from yt_dlp import YoutubeDL
+
+logger = logging.getLogger(__name__)
+
+
+class _PooledYDL:
+    __slots__ = ('ydl', 'jobs')
+
+    def __init__(self, ydl: 'YoutubeDL'):
+        self.ydl = ydl
+        self.jobs = 0
+
+
+class YoutubeDLPool:
+    """Long-lived YoutubeDL instances, keyed by option profile.
+
+    Reusing instances keeps extractors registered, the cookie jar parsed, the
+    HTTP sessions open and the YouTube player JS cached between requests.
+    An instance is used by one thread at a time, is recycled after
+    ``max_jobs`` jobs, and is discarded after an unexpected error: anything
+    but a yt-dlp DownloadError or one of ``expected_errors``.
+
+    yt-dlp itself (hundreds of extractor modules) is only imported when the
+    first instance is created, or ahead of time by warm_up().
+    """
+
+    def __init__(self, profiles: Dict[str, Dict[str, Any]], max_per_profile: int = 2,
+                 max_jobs: int = 100, expected_errors: Tuple[Type[BaseException], ...] = ()):
+        self.profiles = profiles
+        self.max_per_profile = max_per_profile
+        self.max_jobs = max_jobs
+        self.expected_errors = expected_errors
+        self._idle: Dict[str, Deque[_PooledYDL]] = {name: deque() for name in profiles}
+        self._count: Dict[str, int] = {name: 0 for name in profiles}
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def acquire(self, profile: str) -> Iterator['YoutubeDL']:
+        """Borrow an instance of the given profile"""
+        pooled = self._checkout(profile)
+        healthy = True
+        try:
+            yield pooled.ydl
+        except Exception as e:
+            from yt_dlp.utils import DownloadError
+
+            # Vidéo indisponible, trop volumineuse, abandon... l'instance reste saine
+            healthy = isinstance(e, (DownloadError, *self.expected_errors))
+            raise
+        finally:
+            pooled.jobs += 1
+            self._checkin(profile, pooled, healthy)
+
+    def warm_up(self, profile: str, *extractors: str):
+        """Import yt-dlp and create one idle instance with these extractors loaded"""
+        with self.acquire(profile) as ydl:
+            for name in extractors:
+                ydl.get_info_extractor(name)
+
+    def close(self):
+        """Close every idle instance"""
+        with self._cond:
+            for profile, idle in self._idle.items():
+                while idle:
+                    self._close(idle.pop())
+                    self._count[profile] -= 1
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._cond:
+            return {
+                profile: {'size': self._count[profile], 'idle': len(self._idle[profile])}
+                for profile in self.profiles
+            }
+
+    def _checkout(self, profile: str) -> _PooledYDL:
+        with self._cond:
+            idle = self._idle[profile]
+            while not idle and self._count[profile] >= self.max_per_profile:
+                self._cond.wait()
+            if idle:
+                return idle.pop()
+            self._count[profile] += 1
+
+        try:
+            from yt_dlp import YoutubeDL
+
+            return _PooledYDL(YoutubeDL(dict(self.profiles[profile])))
+        except Exception:
+            with self._cond:
+                self._count[profile] -= 1
+                self._cond.notify()
+            raise
+
+    def _checkin(self, profile: str, pooled: _PooledYDL, healthy: bool):
+        recycle = not healthy or pooled.jobs >= self.max_jobs
+        with self._cond:
+            if recycle:
+                self._count[profile] -= 1
+            else:
+                self._idle[profile].append(pooled)
+            self._cond.notify()
+        if recycle:
+            logger.info(f"Recycling YoutubeDL instance ({profile}, {pooled.jobs} jobs)")
+            self._close(pooled)
+
+    @staticmethod
+    def _close(pooled: _PooledYDL):
+        try:
+            pooled.ydl.close()
+        except Exception as e:
+            logger.warning(f"Error closing YoutubeDL instance: {e}")